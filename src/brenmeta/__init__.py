@@ -18,10 +18,11 @@
 """
 """
 
-from Qt import QtWidgets
-
 
 def validate_dependencies_v1():
+    # Qt is imported here so dna modules can be used headless, eg. by mhBatch
+    from Qt import QtWidgets
+
     from brenmeta.core import mhCore
     from brenmeta.dna1 import mhSrc
 
@@ -52,6 +53,8 @@ def validate_dependencies_v1():
     return True
 
 def validate_dependencies_v2():
+    from Qt import QtWidgets
+
     from brenmeta.core import mhCore
     from brenmeta.dna2 import mhSrc
 
@@ -22,6 +22,10 @@ import sys
 
 import logging
 
+from collections.abc import MutableMapping
+
+import numpy
+
 from maya import cmds
 
 
@@ -101,34 +105,470 @@ def validate_arg(arg_name, arg_value, expected_type, can_be_none=False):
     return True
 
 
+def pack_csr(rows, columns, values, row_count):
+    """Sort (row, column, value) entries into compressed sparse row arrays
+
+    Where there are duplicate entries the last value given is kept.
+
+    :return: indptr (int64), indices (int32), data (float32)
+    """
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+    columns = numpy.asarray(columns, dtype=numpy.int32)
+
+    if values is None:
+        values = numpy.zeros(rows.size, dtype=numpy.float32)
+    else:
+        values = numpy.asarray(values, dtype=numpy.float32)
+
+    # lexsort is stable so duplicates stay in the order given
+    order = numpy.lexsort((columns, rows))
+
+    rows = rows[order]
+    columns = columns[order]
+    values = values[order]
+
+    if rows.size:
+        last = numpy.ones(rows.size, dtype=bool)
+        last[:-1] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+
+        rows = rows[last]
+        columns = columns[last]
+        values = values[last]
+
+    indptr = numpy.zeros(row_count + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(rows, minlength=row_count), out=indptr[1:])
+
+    return indptr, columns, values
+
+
+class AttrTable(object):
+    """Shared table of joint attr names and their default values
+
+    Poses reference joint attrs by index into a table,
+    so attr names and defaults are stored once rather than per pose.
+
+    A table holds one set of defaults, set_defaults raises MHError if an attr is given a different default
+    to the one it already has, unless overwrite is True. Poses that need other defaults copy their table first,
+    see Pose.set_defaults.
+
+    version is incremented whenever attrs are added or defaults are set with set_defaults.
+    """
+
+    __slots__ = ("names", "indices", "_defaults", "_default_mask", "version")
+
+    def __init__(self, names=None, defaults=None):
+        self.names = []
+        self.indices = {}
+        self._defaults = numpy.zeros(0, dtype=numpy.float32)
+        self._default_mask = numpy.zeros(0, dtype=bool)
+        self.version = 0
+
+        if names:
+            names = list(names)
+
+            if defaults is None:
+                default_mask = numpy.zeros(len(names), dtype=bool)
+                defaults = numpy.zeros(len(names))
+            elif isinstance(defaults, dict):
+                default_mask = numpy.array([name in defaults for name in names], dtype=bool)
+                defaults = [defaults.get(name, 0.0) for name in names]
+            else:
+                default_mask = numpy.ones(len(names), dtype=bool)
+
+            self.names = names
+            self.indices = {name: i for i, name in enumerate(names)}
+            self._defaults = numpy.array(defaults, dtype=numpy.float32)
+            self._default_mask = default_mask
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return "{}({} attrs)".format(self.__class__.__name__, len(self))
+
+    @property
+    def defaults(self):
+        return self._defaults[:len(self.names)]
+
+    @property
+    def default_mask(self):
+        """Bool array flagging attrs that have been given a default
+        """
+        return self._default_mask[:len(self.names)]
+
+    def add(self, name):
+        """Get index of given attr name, adding it to the table if needed
+
+        Added attrs have a default of 0.0 until one is set.
+        """
+        index = self.indices.get(name)
+
+        if index is not None:
+            return index
+
+        index = len(self.names)
+
+        # grow defaults buffer in chunks to avoid a copy per added attr
+        if index >= len(self._defaults):
+            size = max(16, index * 2)
+
+            defaults = numpy.zeros(size, dtype=numpy.float32)
+            defaults[:index] = self._defaults[:index]
+            self._defaults = defaults
+
+            default_mask = numpy.zeros(size, dtype=bool)
+            default_mask[:index] = self._default_mask[:index]
+            self._default_mask = default_mask
+
+        self.names.append(name)
+        self.indices[name] = index
+        self._defaults[index] = 0.0
+        self._default_mask[index] = False
+        self.version += 1
+
+        return index
+
+    def get_conflicts(self, indices, values):
+        """Get array of the given indices that already have a default different to the given value
+        """
+        indices = numpy.atleast_1d(numpy.asarray(indices, dtype=numpy.intp))
+        values = numpy.broadcast_to(numpy.asarray(values, dtype=numpy.float32), indices.shape)
+
+        conflicts = self.default_mask[indices] & (self.defaults[indices] != values)
+
+        return indices[conflicts]
+
+    def set_defaults(self, indices, values, overwrite=False):
+        if not overwrite:
+            conflicts = self.get_conflicts(indices, values)
+
+            if conflicts.size:
+                raise MHError("Attrs already have different defaults in shared table: {}".format(
+                    self.get_names(conflicts[:10])
+                ))
+
+        self.defaults[indices] = values
+        self.default_mask[indices] = True
+        self.version += 1
+
+        return True
+
+    def copy(self):
+        """Get a copy of this table, with the same attr indices
+        """
+        attr_table = AttrTable()
+        attr_table.names = list(self.names)
+        attr_table.indices = dict(self.indices)
+        attr_table._defaults = self.defaults.copy()
+        attr_table._default_mask = self.default_mask.copy()
+
+        return attr_table
+
+    def get_names(self, indices):
+        return [self.names[i] for i in indices.tolist()]
+
+    def get_remap_indices(self, other):
+        """Get an array mapping each index of this table to the index of the same attr in other table
+
+        Attrs not in the other table are mapped to -1
+        """
+        return numpy.array(
+            [other.indices.get(name, -1) for name in self.names], dtype=numpy.int32
+        )
+
+
+class PoseDeltas(MutableMapping):
+    """Dict-like view of pose deltas, keyed by joint attr
+    """
+
+    __slots__ = ("pose",)
+
+    def __init__(self, pose):
+        self.pose = pose
+
+    def __getitem__(self, attr):
+        position = self.pose.find_attr(attr)
+
+        if position is None:
+            raise KeyError(attr)
+
+        return float(self.pose.values[position])
+
+    def __setitem__(self, attr, value):
+        self.pose.set_delta(attr, value)
+
+    def __delitem__(self, attr):
+        position = self.pose.find_attr(attr)
+
+        if position is None:
+            raise KeyError(attr)
+
+        self.pose.attr_indices = numpy.delete(self.pose.attr_indices, position)
+        self.pose.values = numpy.delete(self.pose.values, position)
+        self.pose.dirty = True
+
+    def __iter__(self):
+        return iter(self.pose.attr_table.get_names(self.pose.attr_indices))
+
+    def __len__(self):
+        return len(self.pose.attr_indices)
+
+    def items(self):
+        return list(zip(
+            self.pose.attr_table.get_names(self.pose.attr_indices),
+            self.pose.values.tolist()
+        ))
+
+
+class PoseDefaults(MutableMapping):
+    """Dict-like view of the defaults of the joint attrs of a pose
+
+    Defaults are stored in the shared AttrTable.
+    """
+
+    __slots__ = ("pose",)
+
+    def __init__(self, pose):
+        self.pose = pose
+
+    def _find(self, attr):
+        attr_index = self.pose.attr_table.indices.get(attr)
+
+        if attr_index is None:
+            return None
+
+        indices = self.pose.get_default_indices()
+        position = numpy.searchsorted(indices, attr_index)
+
+        if position < len(indices) and indices[position] == attr_index:
+            return attr_index
+
+        return None
+
+    def __getitem__(self, attr):
+        attr_index = self._find(attr)
+
+        if attr_index is None:
+            raise KeyError(attr)
+
+        return float(self.pose.attr_table.defaults[attr_index])
+
+    def __setitem__(self, attr, value):
+        attr_index = self.pose.attr_table.add(attr)
+        self.pose.set_defaults(attr_index, value)
+
+        indices = self.pose.get_default_indices()
+        position = numpy.searchsorted(indices, attr_index)
+
+        if position < len(indices) and indices[position] == attr_index:
+            return
+
+        self.pose.default_indices = numpy.insert(indices, position, attr_index).astype(numpy.int32)
+
+    def __delitem__(self, attr):
+        raise MHError("Pose defaults cannot be removed: {}".format(attr))
+
+    def __iter__(self):
+        return iter(self.pose.attr_table.get_names(self.pose.get_default_indices()))
+
+    def __len__(self):
+        return len(self.pose.get_default_indices())
+
+    def items(self):
+        indices = self.pose.get_default_indices()
+
+        return list(zip(
+            self.pose.attr_table.get_names(indices),
+            self.pose.attr_table.defaults[indices].tolist()
+        ))
+
+
 class Pose(object):
-    def __init__(self, name=None, index=None, shape_name=None):
+    """Joint attr deltas for a single pose (aka joint column)
+
+    attr_indices: sorted int32 array of the joint attrs driven by this pose,
+        as indices into the shared attr_table
+
+    values: float32 array of the delta for each attr in attr_indices
+
+    default_indices: optional sorted int32 array of attrs to use as pose defaults,
+        if None defaults are given for attr_indices
+
+    deltas and defaults are dict-like views of these arrays, keyed by joint attr.
+
+    version is incremented whenever these arrays are set or edited, so cached values
+    derived from a pose can be checked against it, see PSDPose.
+    Arrays edited in place outside of this class should be followed by touch().
+    """
+
+    __slots__ = (
+        "index", "name", "shape_name", "opposite", "dirty", "version",
+        "attr_table", "_attr_indices", "_values", "_default_indices",
+    )
+
+    def __init__(self, name=None, index=None, shape_name=None, attr_table=None):
         self.index = index
         self.name = name
         self.shape_name = shape_name
-        self.deltas = {}
-        self.defaults = {}
         self.opposite = None  # TODO
+        self.dirty = False
+        self.version = 0
+
+        self.attr_table = attr_table if attr_table is not None else AttrTable()
+        self.attr_indices = numpy.zeros(0, dtype=numpy.int32)
+        self.values = numpy.zeros(0, dtype=numpy.float32)
+        self.default_indices = None
+
+    @property
+    def attr_indices(self):
+        return self._attr_indices
+
+    @attr_indices.setter
+    def attr_indices(self, attr_indices):
+        self._attr_indices = attr_indices
+        self.version += 1
+
+    @property
+    def values(self):
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+        self.version += 1
+
+    @property
+    def default_indices(self):
+        return self._default_indices
+
+    @default_indices.setter
+    def default_indices(self, default_indices):
+        self._default_indices = default_indices
+        self.version += 1
+
+    def touch(self):
+        """Increment version, eg. after values have been edited in place
+        """
+        self.version += 1
+        return self.version
+
+    @property
+    def deltas(self):
+        return PoseDeltas(self)
+
+    @deltas.setter
+    def deltas(self, deltas):
+        attr_indices = numpy.array(
+            [self.attr_table.add(attr) for attr in deltas.keys()], dtype=numpy.int32
+        )
+
+        values = numpy.array(list(deltas.values()), dtype=numpy.float32)
+
+        self.set_arrays(attr_indices, values)
+
+    @property
+    def defaults(self):
+        return PoseDefaults(self)
+
+    @defaults.setter
+    def defaults(self, defaults):
+        attr_indices = []
+
+        for attr in defaults.keys():
+            attr_indices.append(self.attr_table.add(attr))
+
+        self.set_defaults(attr_indices, list(defaults.values()))
+
+        self.default_indices = numpy.unique(numpy.array(attr_indices, dtype=numpy.int32))
+
+    def set_defaults(self, attr_indices, values):
+        """Set defaults of attrs in the attr table
+
+        If the table already has different defaults for any of the attrs this pose is given its own
+        copy of the table first, so other poses sharing the table are not affected.
+        Table copies keep the same attr indices.
+        """
+        if self.attr_table.get_conflicts(attr_indices, values).size:
+            self.attr_table = self.attr_table.copy()
+
+        return self.attr_table.set_defaults(attr_indices, values, overwrite=True)
+
+    def set_arrays(self, attr_indices, values):
+        """Set attr indices and delta values, sorting by attr index
+        """
+        attr_indices = numpy.asarray(attr_indices, dtype=numpy.int32)
+        values = numpy.asarray(values, dtype=numpy.float32)
+
+        order = numpy.argsort(attr_indices, kind="stable")
+
+        self.attr_indices = attr_indices[order]
+        self.values = values[order]
+        self.dirty = True
+
+        return True
+
+    def get_default_indices(self):
+        if self.default_indices is None:
+            return self.attr_indices
+        return self.default_indices
+
+    def find_attr(self, attr):
+        """Get position of the given attr in attr_indices and values, or None
+        """
+        attr_index = self.attr_table.indices.get(attr)
+
+        if attr_index is None:
+            return None
+
+        position = numpy.searchsorted(self.attr_indices, attr_index)
+
+        if position < len(self.attr_indices) and self.attr_indices[position] == attr_index:
+            return int(position)
+
+        return None
+
+    def set_delta(self, attr, value):
+        position = self.find_attr(attr)
+
+        if position is None:
+            attr_index = self.attr_table.add(attr)
+            position = numpy.searchsorted(self.attr_indices, attr_index)
+
+            self.attr_indices = numpy.insert(self.attr_indices, position, attr_index).astype(numpy.int32)
+            self.values = numpy.insert(self.values, position, value).astype(numpy.float32)
+        else:
+            self.values[position] = value
+            self.touch()
+
+        self.dirty = True
+
+        return True
 
     def __add__(self, other):
         """Returned summed Pose
         """
-        summed_pose = Pose(name="{}_{}".format(self.name, other.name))
+        summed_pose = Pose(name="{}_{}".format(self.name, other.name), attr_table=self.attr_table)
 
-        summed_pose.defaults = self.defaults
+        summed_pose.defaults = dict(self.defaults)
+
+        # the summed pose gets its own copy of the table if other defaults differ, see set_defaults
         summed_pose.defaults.update(other.defaults)
 
-        for attr, delta in self.deltas.items():
-            if attr in other.deltas:
-                summed_pose.deltas[attr] = delta + other.deltas[attr]
-            else:
-                summed_pose.deltas[attr] = delta
+        if other.attr_table is self.attr_table:
+            other_indices = other.attr_indices
+        else:
+            other_indices = numpy.array(
+                [summed_pose.attr_table.add(attr) for attr in other.deltas], dtype=numpy.int32
+            )
 
-        for attr, delta in other.deltas.items():
-            if attr in self.deltas:
-                summed_pose.deltas[attr] += delta
-            else:
-                summed_pose.deltas[attr] = delta
+        attr_indices = numpy.union1d(self.attr_indices, other_indices).astype(numpy.int32)
+        values = numpy.zeros(len(attr_indices), dtype=numpy.float32)
+
+        values[numpy.searchsorted(attr_indices, self.attr_indices)] += self.values
+        values[numpy.searchsorted(attr_indices, other_indices)] += other.values
+
+        summed_pose.attr_indices = attr_indices
+        summed_pose.values = values
 
         return summed_pose
 
@@ -150,33 +590,72 @@ class Pose(object):
         return display_name
 
     def get_values(self, absolute=True, blend=1.0):
+        attrs = self.attr_table.get_names(self.attr_indices)
+
         if absolute:
-            values = {}
+            values = self.attr_table.defaults[self.attr_indices] + (self.values * blend)
+            return dict(zip(attrs, values.tolist()))
+        else:
+            return dict(zip(attrs, self.values.tolist()))
 
-            for attr, delta in self.deltas.items():
-                delta *= blend
-                values[attr] = self.defaults[attr] + delta
+    def pose_joints(self, blend=1.0, applier=None):
+        """Set joint attrs in the scene to pose values
 
-            return values
-        else:
-            return self.deltas
+        If a PoseApplier is given values are set through its cached plugs,
+        otherwise with cmds.setAttr, see mhPlugs.
+        """
+        if applier is not None:
+            return applier.set_arrays(
+                self.attr_table.get_names(self.attr_indices),
+                self.attr_table.defaults[self.attr_indices] + (self.values * blend),
+            )
+
+        values = self.get_values(absolute=True, blend=blend)
 
-    def pose_joints(self, blend=1.0):
-        for attr, value in self.get_values(absolute=True, blend=blend).items():
+        for attr, value in values.items():
             cmds.setAttr(attr, value)
 
         return True
 
-    def reset_joints(self):
+    def reset_joints(self, applier=None):
+        if applier is not None:
+            default_indices = self.get_default_indices()
+
+            return applier.set_arrays(
+                self.attr_table.get_names(default_indices), self.attr_table.defaults[default_indices]
+            )
+
         for attr, value in self.defaults.items():
             cmds.setAttr(attr, value)
 
         return True
 
-    def update_from_scene(self):
-        for attr, default in self.defaults.items():
-            value = cmds.getAttr(attr)
-            self.deltas[attr] = value - default
+    def update_from_scene(self, plug_cache=None):
+        """Set deltas of attrs with defaults from their current values in the scene
+
+        If a PlugCache is given values are read through its cached plugs in one pass,
+        otherwise with cmds.getAttr, see mhPlugs.
+        """
+        default_indices = self.get_default_indices()
+        attrs = self.attr_table.get_names(default_indices)
+
+        if plug_cache is not None:
+            scene_values = plug_cache.get_values(attrs).astype(numpy.float32)
+        else:
+            scene_values = numpy.array([cmds.getAttr(attr) for attr in attrs], dtype=numpy.float32)
+
+        # update deltas for every attr with a default, keeping any others
+        attr_indices = numpy.union1d(self.attr_indices, default_indices).astype(numpy.int32)
+        values = numpy.zeros(len(attr_indices), dtype=numpy.float32)
+
+        values[numpy.searchsorted(attr_indices, self.attr_indices)] = self.values
+        values[numpy.searchsorted(attr_indices, default_indices)] = (
+            scene_values - self.attr_table.defaults[default_indices]
+        )
+
+        self.attr_indices = attr_indices
+        self.values = values
+        self.dirty = True
 
         return True
 
@@ -185,7 +664,9 @@ class Pose(object):
         if attrs is None:
             attrs = ["tx", "ty", "tz"]
 
-        for pose_attr in self.deltas.keys():
+        scale_mask = numpy.zeros(len(self.attr_indices), dtype=bool)
+
+        for position, pose_attr in enumerate(self.attr_table.get_names(self.attr_indices)):
             joint, attr = pose_attr.split(".")
 
             if attr not in attrs:
@@ -195,27 +676,99 @@ class Pose(object):
                 if joint not in joints:
                     continue
 
-            self.deltas[pose_attr] *= value
+            scale_mask[position] = True
+
+        self.values[scale_mask] *= value
+
+        self.touch()
+        self.dirty = True
 
         return True
 
 
 class PSDPose(object):
+    """Pose driven by the product of its input poses
+
+    Summed deltas and merged defaults are cached, keyed by the version of each pose they
+    are derived from, so they are only rebuilt when an input pose is edited, see Pose.version.
+
+    input_version is incremented whenever input_poses or input_psd_poses are assigned.
+    Lists edited in place should be followed by touch_inputs().
+    """
+
+    # incremented whenever the inputs of any psd change,
+    # so cached input lists can be returned without visiting input psds
+    _structure_version = 0
+
     def __init__(self):
         super(PSDPose, self).__init__()
+        self.input_version = 0
+
         self.pose = None
         self.input_poses = []
         self.input_weights = []
         self.input_psd_poses = []
         self.opposite = None  # TODO
 
+        self._summed_key = None
+        self._summed = None
+        self._all_input_poses_key = None
+        self._all_input_poses = None
+        self._all_input_poses_version = 0
+        self._all_input_poses_structure_version = None
+
+    @property
+    def input_poses(self):
+        return self._input_poses
+
+    @input_poses.setter
+    def input_poses(self, input_poses):
+        self._input_poses = input_poses
+        self.touch_inputs()
+
+    @property
+    def input_psd_poses(self):
+        return self._input_psd_poses
+
+    @input_psd_poses.setter
+    def input_psd_poses(self, input_psd_poses):
+        self._input_psd_poses = input_psd_poses
+        self.touch_inputs()
+
+    def touch_inputs(self):
+        """Increment input version, eg. after input lists have been edited in place
+        """
+        self.input_version += 1
+        PSDPose._structure_version += 1
+        return self.input_version
+
     def __repr__(self):
         return "{}({}: {}) <- [{}]".format(
             self.__class__.__name__, self.pose.index, self.pose.name,
             [pose.name for pose in self.input_poses]
         )
 
-    def get_defaults(self):
+    def get_version_key(self):
+        """Get key of the identity and version of each pose summed by this psd, and their attr tables
+        """
+        poses = [self.pose] + list(self.input_poses) + [
+            input_psd_pose.pose for input_psd_pose in self.input_psd_poses
+        ]
+
+        return tuple([
+            (id(pose), pose.version, id(pose.attr_table), pose.attr_table.version) for pose in poses
+        ])
+
+    def get_summed(self):
+        """Get cached (defaults, summed deltas, attrs, attr defaults, attr deltas)
+
+        Where attrs are those with both a default and a summed delta, in order of defaults
+        """
+        key = self.get_version_key()
+
+        if self._summed is not None and key == self._summed_key:
+            return self._summed
+
         defaults = dict(self.pose.defaults)
 
         for input_pose in self.input_poses:
@@ -223,18 +776,7 @@ class PSDPose(object):
                 if attr not in defaults:
                     defaults[attr] = default
 
-        return defaults
-
-    def get_values(self, summed=True, absolute=True, blend=1.0):
-        """
-        Note the input weight is not used here (nor in the rig logic)
-        it actually seems to cause issues
-        """
-        if not summed:
-            return self.pose.get_values(absolute=absolute, blend=blend)
-
         summed_deltas = dict(self.pose.deltas)
-        defaults = self.get_defaults()
 
         for input_pose in self.input_poses:
             for attr, delta in input_pose.deltas.items():
@@ -250,43 +792,111 @@ class PSDPose(object):
                 else:
                     summed_deltas[attr] = delta
 
-        if absolute:
-            values = {}
+        attrs = [attr for attr in defaults.keys() if attr in summed_deltas]
 
-            for attr, default in defaults.items():
-                if attr not in summed_deltas:
-                    continue
+        self._summed = (
+            defaults,
+            summed_deltas,
+            attrs,
+            numpy.array([defaults[attr] for attr in attrs], dtype=numpy.float64),
+            numpy.array([summed_deltas[attr] for attr in attrs], dtype=numpy.float64),
+        )
+
+        self._summed_key = key
+
+        return self._summed
+
+    def clear_cache(self):
+        self._summed_key = None
+        self._summed = None
+        self._all_input_poses_key = None
+        self._all_input_poses = None
+        return True
+
+    def get_defaults(self):
+        return dict(self.get_summed()[0])
 
-                delta = summed_deltas[attr] * blend
-                values[attr] = default + delta
+    def get_values(self, summed=True, absolute=True, blend=1.0):
+        """
+        Note the input weight is not used here (nor in the rig logic)
+        it actually seems to cause issues
+        """
+        if not summed:
+            return self.pose.get_values(absolute=absolute, blend=blend)
 
-            return values
+        _, summed_deltas, attrs, attr_defaults, attr_deltas = self.get_summed()
 
+        if absolute:
+            return dict(zip(attrs, (attr_defaults + attr_deltas * blend).tolist()))
         else:
-            return summed_deltas
+            return dict(summed_deltas)
+
+    def pose_joints(self, summed=True, blend=1.0, applier=None):
+        if applier is not None:
+            if not summed:
+                return self.pose.pose_joints(blend=blend, applier=applier)
+
+            _, _, attrs, attr_defaults, attr_deltas = self.get_summed()
+
+            return applier.set_arrays(attrs, attr_defaults + attr_deltas * blend)
+
+        values = self.get_values(summed=summed, absolute=True, blend=blend)
 
-    def pose_joints(self, summed=True, blend=1.0):
-        for attr, value in self.get_values(summed=summed, absolute=True, blend=blend).items():
+        for attr, value in values.items():
             cmds.setAttr(attr, value)
 
         return True
 
-    def reset_joints(self):
-        for attr, value in self.get_defaults().items():
+    def reset_joints(self, applier=None):
+        defaults = self.get_defaults()
+
+        if applier is not None:
+            return applier.set_values(defaults)
+
+        for attr, value in defaults.items():
             cmds.setAttr(attr, value)
 
         return True
 
-    def get_all_input_poses(self):
-        poses = set(self.input_poses)
+    def _get_all_input_poses(self):
+        """Get cached list of all input poses
 
-        for input_psd_pose in self.input_psd_poses:
-            poses.update(input_psd_pose.get_all_input_poses())
+        While no psd inputs have changed the cached list is returned as is, otherwise it is
+        only rebuilt if the inputs of this psd, or the lists of its direct input psds, have changed.
+        """
+        if self._all_input_poses is not None and (
+                self._all_input_poses_structure_version == PSDPose._structure_version
+        ):
+            return self._all_input_poses
+
+        input_psd_pose_lists = [
+            input_psd_pose._get_all_input_poses() for input_psd_pose in self.input_psd_poses
+        ]
+
+        key = (
+            self.input_version,
+            tuple([input_psd_pose._all_input_poses_version for input_psd_pose in self.input_psd_poses]),
+        )
 
-        # sort by index
-        poses = sorted(poses, key=lambda p: p.index)
+        if self._all_input_poses is None or key != self._all_input_poses_key:
+            poses = set(self.input_poses)
 
-        return poses
+            for input_psd_pose_list in input_psd_pose_lists:
+                poses.update(input_psd_pose_list)
+
+            # sort by index
+            self._all_input_poses = sorted(poses, key=lambda p: p.index)
+            self._all_input_poses_key = key
+            self._all_input_poses_version += 1
+
+        self._all_input_poses_structure_version = PSDPose._structure_version
+
+        return self._all_input_poses
+
+    def get_all_input_poses(self):
+        """Get input poses of this psd and all input psds, sorted by index
+        """
+        return list(self._get_all_input_poses())
 
     def update_name(self, override=True):
         if self.pose.name and not override:
@@ -317,11 +927,561 @@ class PSDPose(object):
         return self.pose.name
 
 
+class PSDMatrix(object):
+    """Sparse (psd x pose) matrix of psd input pose weights
+
+    Rows are stored as compressed sparse row arrays, in order of first appearance of each psd,
+    with the inputs of each psd in the order given.
+    Entries are also grouped by pose when needed, for fast lookup of the psds each pose feeds.
+    """
+
+    def __init__(self, psd_indices, indptr, pose_indices, weights):
+        self.psd_indices = psd_indices
+        self.indptr = indptr
+        self.pose_indices = pose_indices
+        self.weights = weights
+
+        self._rows = None
+        self._pose_psds = None
+
+    def __repr__(self):
+        return "{}({} psds, {} inputs)".format(self.__class__.__name__, len(self), len(self.pose_indices))
+
+    def __len__(self):
+        return len(self.psd_indices)
+
+    def __contains__(self, psd_index):
+        return psd_index in self.rows
+
+    @property
+    def rows(self):
+        """Dict of row of each psd index
+        """
+        if self._rows is None:
+            self._rows = {psd_index: row for row, psd_index in enumerate(self.psd_indices.tolist())}
+        return self._rows
+
+    @property
+    def row_indices(self):
+        """Psd index of each entry
+        """
+        return numpy.repeat(self.psd_indices, numpy.diff(self.indptr))
+
+    @classmethod
+    def from_entries(cls, psd_indices, pose_indices, weights):
+        """Create a PSDMatrix from (psd index, pose index, weight) entries, eg. from the dna psd arrays
+        """
+        psd_indices = numpy.asarray(psd_indices, dtype=numpy.intp)
+        pose_indices = numpy.asarray(pose_indices, dtype=numpy.intp)
+        weights = numpy.asarray(weights, dtype=numpy.float32)
+
+        # group entries by psd, in order of first appearance
+        unique_psds, first, inverse, counts = numpy.unique(
+            psd_indices, return_index=True, return_inverse=True, return_counts=True
+        )
+
+        appearance = numpy.argsort(first, kind="stable")
+
+        # rank of each unique psd by appearance
+        ranks = numpy.empty(len(appearance), dtype=numpy.intp)
+        ranks[appearance] = numpy.arange(len(appearance))
+
+        order = numpy.argsort(ranks[inverse.ravel()], kind="stable")
+
+        indptr = numpy.zeros(len(unique_psds) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts[appearance], out=indptr[1:])
+
+        return cls(unique_psds[appearance], indptr, pose_indices[order], weights[order])
+
+    @classmethod
+    def from_psd_poses(cls, psd_poses):
+        """Create a PSDMatrix from PSDPose objects, including any additional combos
+        """
+        psd_poses = list(psd_poses.values()) if isinstance(psd_poses, dict) else list(psd_poses)
+
+        psd_indices = [
+            psd_pose.pose.index for psd_pose in psd_poses for _ in psd_pose.input_poses
+        ]
+
+        pose_indices = [
+            pose.index for psd_pose in psd_poses for pose in psd_pose.input_poses
+        ]
+
+        # psds without a weight for each input are given weights of 1.0
+        weights = [
+            weight for psd_pose in psd_poses
+            for weight in (
+                psd_pose.input_weights if len(psd_pose.input_weights) == len(psd_pose.input_poses)
+                else [1.0] * len(psd_pose.input_poses)
+            )
+        ]
+
+        return cls.from_entries(psd_indices, pose_indices, weights)
+
+    def iter_rows(self):
+        """Iterate (psd index, input pose indices, weights) of each psd
+        """
+        for row, psd_index in enumerate(self.psd_indices.tolist()):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            yield psd_index, self.pose_indices[start:end], self.weights[start:end]
+
+    def get_inputs(self, psd_index):
+        """Get (input pose indices, weights) arrays of psd
+        """
+        row = self.rows.get(psd_index)
+
+        if row is None:
+            raise MHError("Psd not found: {}".format(psd_index))
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+
+        return self.pose_indices[start:end], self.weights[start:end]
+
+    def get_psds(self, pose_index):
+        """Get sorted array of the psd indices that pose feeds
+        """
+        if self._pose_psds is None:
+            # group entries by pose
+            order = numpy.argsort(self.pose_indices, kind="stable")
+            grouped_poses = self.pose_indices[order]
+            grouped_psds = self.row_indices[order]
+
+            unique_poses, starts = numpy.unique(grouped_poses, return_index=True)
+            ends = numpy.append(starts[1:], len(grouped_poses))
+
+            self._pose_psds = {
+                pose: numpy.unique(grouped_psds[start:end])
+                for pose, start, end in zip(unique_poses.tolist(), starts, ends)
+            }
+
+        return self._pose_psds.get(pose_index, numpy.zeros(0, dtype=numpy.intp))
+
+    def to_dict(self):
+        """Get dict of psd indices with lists of (input pose index, weight)
+        """
+        return {
+            psd_index: list(zip(pose_indices.tolist(), weights.tolist()))
+            for psd_index, pose_indices, weights in self.iter_rows()
+        }
+
+    def to_dense(self, pose_count=None):
+        """Get (psd count, pose count) array of weights, rows in psd_indices order
+        """
+        if pose_count is None:
+            pose_count = int(self.pose_indices.max()) + 1 if len(self.pose_indices) else 0
+
+        dense = numpy.zeros((len(self), pose_count), dtype=numpy.float32)
+        rows = numpy.repeat(numpy.arange(len(self)), numpy.diff(self.indptr))
+        dense[rows, self.pose_indices] = self.weights
+
+        return dense
+
+
+class PoseMatrix(object):
+    """Pose data for every joint column, sharing a single AttrTable
+
+    Each pose stores only the joint attrs it drives as compact arrays.
+    When created from sparse entries these are views of CSR arrays shared by all poses,
+    a dense (joint column x joint attr) array can be built when needed with to_dense.
+
+    group_indices: optional list of (output indices, input indices) arrays for each joint group,
+        used to find which joint groups are affected by dirty poses
+
+    prune_stats: dict of pruned entry count, kept entry count, threshold and max error
+        if entries were pruned when the matrix was created
+    """
+
+    def __init__(self, attrs, defaults=None, column_count=0):
+        if isinstance(attrs, AttrTable):
+            self.attr_table = attrs
+        else:
+            self.attr_table = AttrTable(attrs, defaults=defaults)
+
+        self.poses = [
+            Pose(index=i, attr_table=self.attr_table) for i in range(column_count)
+        ]
+
+        self.group_indices = None
+        self.prune_stats = None
+
+    def __repr__(self):
+        return "{}({} columns x {} attrs)".format(
+            self.__class__.__name__, self.column_count, self.attr_count
+        )
+
+    @property
+    def attrs(self):
+        return self.attr_table.names
+
+    @property
+    def attr_indices(self):
+        return self.attr_table.indices
+
+    @property
+    def defaults(self):
+        return self.attr_table.defaults
+
+    @property
+    def column_count(self):
+        return len(self.poses)
+
+    @property
+    def attr_count(self):
+        return len(self.attr_table)
+
+    @property
+    def dirty(self):
+        return numpy.array([pose.dirty for pose in self.poses], dtype=bool)
+
+    @classmethod
+    def from_entries(
+            cls, attrs, columns, attr_indices, values, column_count,
+            defaults=None, prune_threshold=None
+    ):
+        """Create a PoseMatrix from sparse (column, attr index, value) entries
+
+        If prune_threshold is given, any entries with an absolute value less than or equal to it are dropped.
+        Pruned poses keep every attr they drive as defaults,
+        so they can still be reset and updated from the scene.
+        """
+        columns = numpy.asarray(columns, dtype=numpy.int64)
+        attr_indices = numpy.asarray(attr_indices, dtype=numpy.int32)
+        values = numpy.asarray(values, dtype=numpy.float32)
+
+        pose_matrix = cls(attrs, defaults=defaults, column_count=column_count)
+
+        if prune_threshold is None:
+            pose_matrix.set_csr(*pack_csr(columns, attr_indices, values, column_count))
+            return pose_matrix
+
+        keep = numpy.abs(values) > prune_threshold
+        pruned_values = numpy.abs(values[~keep])
+
+        pose_matrix.set_csr(*pack_csr(columns[keep], attr_indices[keep], values[keep], column_count))
+
+        # keep every driven attr as defaults
+        driven_indptr, driven_indices, _ = pack_csr(columns, attr_indices, None, column_count)
+
+        for column, pose in enumerate(pose_matrix.poses):
+            pose.default_indices = driven_indices[driven_indptr[column]:driven_indptr[column + 1]]
+
+        pose_matrix.prune_stats = {
+            "threshold": prune_threshold,
+            "pruned": int(pruned_values.size),
+            "kept": int(numpy.count_nonzero(keep)),
+            "max_error": float(pruned_values.max()) if pruned_values.size else 0.0,
+        }
+
+        return pose_matrix
+
+    def set_csr(self, indptr, indices, data):
+        """Set pose arrays as views of the given compressed sparse row arrays
+        """
+        if len(indptr) != self.column_count + 1:
+            raise MHError("CSR indptr length {} does not match column count {}".format(
+                len(indptr), self.column_count
+            ))
+
+        for column, pose in enumerate(self.poses):
+            start, end = indptr[column], indptr[column + 1]
+            pose.attr_indices = indices[start:end]
+            pose.values = data[start:end]
+
+        return True
+
+    def to_csr(self):
+        """Get (indptr, attr indices, values) compressed sparse row arrays of all poses
+        """
+        counts = [len(pose.attr_indices) for pose in self.poses]
+
+        indptr = numpy.zeros(self.column_count + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=indptr[1:])
+
+        if self.poses:
+            indices = numpy.concatenate([pose.attr_indices for pose in self.poses]).astype(numpy.int32)
+            data = numpy.concatenate([pose.values for pose in self.poses]).astype(numpy.float32)
+        else:
+            indices = numpy.zeros(0, dtype=numpy.int32)
+            data = numpy.zeros(0, dtype=numpy.float32)
+
+        return indptr, indices, data
+
+    def to_csc(self):
+        """Get (indptr, columns, values) compressed sparse column arrays of all poses
+
+        Entries are grouped by attr, for fast lookup of the poses driving each attr
+        """
+        indptr, indices, data = self.to_csr()
+        columns = numpy.repeat(numpy.arange(self.column_count), numpy.diff(indptr))
+
+        return pack_csr(indices, columns, data, self.attr_count)
+
+    def pack(self):
+        """Repack pose arrays into contiguous shared buffers, eg. after poses have been edited
+        """
+        return self.set_csr(*self.to_csr())
+
+    def get_entry_count(self):
+        return sum([len(pose.attr_indices) for pose in self.poses])
+
+    @classmethod
+    def from_dense(cls, attrs, values, mask, defaults=None):
+        """Create a PoseMatrix from dense (joint column x joint attr) values and mask arrays
+        """
+        pose_matrix = cls(attrs, defaults=defaults, column_count=values.shape[0])
+
+        for column, pose in enumerate(pose_matrix.poses):
+            attr_indices = numpy.flatnonzero(mask[column]).astype(numpy.int32)
+            pose.attr_indices = attr_indices
+            pose.values = values[column, attr_indices].astype(numpy.float32)
+
+        return pose_matrix
+
+    def to_dense(self):
+        """Get dense (joint column x joint attr) values and mask arrays
+
+        The mask flags which joint attrs are driven by each pose
+        """
+        values = numpy.zeros((self.column_count, self.attr_count), dtype=numpy.float32)
+        mask = numpy.zeros((self.column_count, self.attr_count), dtype=bool)
+
+        for column, pose in enumerate(self.poses):
+            values[column, pose.attr_indices] = pose.values
+            mask[column, pose.attr_indices] = True
+
+        return values, mask
+
+    def get_block(self, input_indices, output_indices):
+        """Get dense (inputs x outputs) values and mask arrays of a single joint group block
+
+        Gathered from the sparse arrays of the input poses only, without building the whole dense matrix.
+        """
+        values = numpy.zeros((len(input_indices), len(output_indices)), dtype=numpy.float32)
+        mask = numpy.zeros((len(input_indices), len(output_indices)), dtype=bool)
+
+        if not len(output_indices):
+            return values, mask
+
+        order = numpy.argsort(output_indices, kind="stable")
+        sorted_outputs = numpy.asarray(output_indices)[order]
+
+        for row, column in enumerate(numpy.asarray(input_indices).tolist()):
+            pose = self.poses[column]
+
+            positions = numpy.searchsorted(sorted_outputs, pose.attr_indices)
+            positions = numpy.minimum(positions, len(sorted_outputs) - 1)
+            found = sorted_outputs[positions] == pose.attr_indices
+
+            block_columns = order[positions[found]]
+            values[row, block_columns] = pose.values[found]
+            mask[row, block_columns] = True
+
+        return values, mask
+
+    @classmethod
+    def from_poses(cls, attrs, poses, defaults=None):
+        """Get a PoseMatrix of the given attrs from a list of Pose objects
+
+        Poses that already share an AttrTable matching the given attrs are used directly,
+        otherwise their deltas are remapped by attr name.
+        Pose deltas for attrs not in the given attrs are ignored.
+        """
+        attrs = list(attrs)
+
+        if poses and defaults is None and poses[0] is not None:
+            attr_table = poses[0].attr_table
+
+            if attr_table.names == attrs and all(
+                    pose is not None and pose.attr_table is attr_table for pose in poses
+            ):
+                pose_matrix = cls(attr_table)
+                pose_matrix.poses = list(poses)
+                return pose_matrix
+
+        pose_matrix = cls(attrs, defaults=defaults, column_count=len(poses))
+        pose_matrix.copy_poses(poses, copy_defaults=defaults is None)
+
+        return pose_matrix
+
+    def copy_poses(self, poses, copy_defaults=True):
+        """Copy deltas from the given poses into the poses of this matrix, remapping attrs by name
+        """
+        # map indices of each source table to this table
+        remap_indices = {}
+
+        for src_pose, pose in zip(poses, self.poses):
+            if src_pose is None:
+                continue
+
+            src_table = src_pose.attr_table
+
+            if id(src_table) not in remap_indices:
+                table_remap = src_table.get_remap_indices(self.attr_table)
+
+                if copy_defaults:
+                    valid = table_remap >= 0
+                    # poses from tables with different defaults take the defaults of the last table
+                    self.attr_table.set_defaults(
+                        table_remap[valid], src_table.defaults[valid], overwrite=True
+                    )
+
+                remap_indices[id(src_table)] = table_remap
+
+            attr_indices = remap_indices[id(src_table)][src_pose.attr_indices]
+            valid = attr_indices >= 0
+
+            pose.set_arrays(attr_indices[valid], src_pose.values[valid])
+            pose.dirty = src_pose.dirty
+
+        return True
+
+    def remap(self, attrs, defaults=None):
+        """Get a copy of this matrix with attrs matching the given attrs by name
+
+        Any attrs not in this matrix are left undriven.
+        """
+        pose_matrix = self.__class__(attrs, defaults=defaults, column_count=self.column_count)
+        pose_matrix.copy_poses(self.poses, copy_defaults=defaults is None)
+
+        return pose_matrix
+
+    def get_dirty_columns(self):
+        return numpy.flatnonzero(self.dirty)
+
+    def get_dirty_groups(self, group_indices=None):
+        """Get indices of joint groups with any dirty input columns
+        """
+        if group_indices is None:
+            group_indices = self.group_indices
+
+        if group_indices is None:
+            raise MHError("No joint group indices to find dirty groups from")
+
+        dirty = self.dirty
+        dirty_groups = []
+
+        for group_index, (output_indices, input_indices) in enumerate(group_indices):
+            input_indices = input_indices[input_indices < self.column_count]
+
+            if dirty[input_indices].any():
+                dirty_groups.append(group_index)
+
+        return dirty_groups
+
+    def clear_dirty(self):
+        for pose in self.poses:
+            pose.dirty = False
+
+        return True
+
+    def get_pose(self, column, name=None, shape_name=None):
+        pose = self.poses[column]
+
+        if name is not None:
+            pose.name = name
+
+        if shape_name is not None:
+            pose.shape_name = shape_name
+
+        return pose
+
+    def get_poses(self, names=None, shape_names=None):
+        """Get the Pose object of each column, with optional names
+        """
+        if names is None:
+            names = [None] * self.column_count
+
+        if shape_names is None:
+            shape_names = [None] * self.column_count
+
+        poses = [
+            self.get_pose(i, name=name, shape_name=shape_name)
+            for i, (name, shape_name) in enumerate(zip(names, shape_names))
+        ]
+
+        return poses
+
+
+def get_attr_poses(poses, attrs):
+    """Get a dict of the poses with deltas for each of the given attrs
+    """
+    attr_poses = {attr: [] for attr in attrs}
+
+    for pose in poses:
+        for attr in pose.attr_table.get_names(pose.attr_indices):
+            if attr in attr_poses:
+                attr_poses[attr].append(pose)
+
+    return attr_poses
+
+
+def map_input_psd_poses(psd_poses):
+    """Set input_psd_poses of each PSDPose to the other PSDPoses whose input poses are all inputs of its own
+
+    eg. the 2 way combos that contribute to a 3 way combo.
+
+    Input poses of each psd are stored as an int bitset, and psds are looked up
+    through an inverted index of the psds each pose feeds, so each psd is only
+    compared with the psds that share its least used input pose.
+    Input psd poses are in the same order as psd_poses.
+    """
+    psd_poses = list(psd_poses.values()) if isinstance(psd_poses, dict) else list(psd_poses)
+
+    # bit of each input pose, keyed by id as poses are compared by identity
+    pose_bits = {}
+    bitsets = []
+
+    # inverted index of positions of psds that each pose bit feeds
+    bit_psds = []
+
+    for i, psd_pose in enumerate(psd_poses):
+        bitset = 0
+
+        for pose in psd_pose.input_poses:
+            bit = pose_bits.setdefault(id(pose), len(pose_bits))
+
+            if bit == len(bit_psds):
+                bit_psds.append([])
+
+            if not bitset >> bit & 1:
+                bit_psds[bit].append(i)
+
+            bitset |= 1 << bit
+
+        bitsets.append(bitset)
+
+        psd_pose.input_psd_poses = []
+
+    all_psds = range(len(psd_poses))
+
+    for i, input_psd_pose in enumerate(psd_poses):
+        input_bitset = bitsets[i]
+
+        if input_bitset:
+            bits = [pose_bits[id(pose)] for pose in input_psd_pose.input_poses]
+            candidates = bit_psds[min(bits, key=lambda bit: len(bit_psds[bit]))]
+        else:
+            # no inputs are contained by every psd
+            candidates = all_psds
+
+        for j in candidates:
+            if j != i and bitsets[j] & input_bitset == input_bitset:
+                psd_poses[j].input_psd_poses.append(input_psd_pose)
+
+    for psd_pose in psd_poses:
+        psd_pose.touch_inputs()
+
+    return True
+
+
 def add_additional_poses(poses, pose_names, joints_attr_defaults):
     pose_count = len(poses)
 
+    # share attr table with existing poses
+    attr_table = poses[0].attr_table if poses else None
+
     for i, pose_name in enumerate(pose_names):
-        pose = Pose()
+        pose = Pose(attr_table=attr_table)
         pose.name = pose_name
         pose.index = pose_count + i
         pose.defaults = joints_attr_defaults
@@ -341,10 +1501,13 @@ def add_additional_combo_poses(poses, psd_poses, additional_combos, joints_attr_
 
     pose_count = len(poses)
 
+    # share attr table with existing poses
+    attr_table = poses[0].attr_table if poses else None
+
     for i, pose_names in enumerate(additional_combos):
         combo = PSDPose()
 
-        combo.pose = Pose()
+        combo.pose = Pose(attr_table=attr_table)
         combo.pose.name = "_".join(pose_names)
         combo.pose.index = pose_count + i
         combo.pose.defaults = joints_attr_defaults
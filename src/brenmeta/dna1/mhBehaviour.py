@@ -15,13 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import numpy
+
 from maya import cmds
 
 import dna
 import dnacalib
 
 from brenmeta.core import mhCore
-from brenmeta.maya import mhMayaUtils
 
 LOG = mhCore.get_basic_logger(__name__)
 
@@ -98,103 +99,155 @@ def get_joint_defaults(reader):
     return joints_attr_defaults
 
 
-def get_all_poses(reader, absolute=True):
-    """
+def get_pose_matrix(reader, verbose=False):
+    """Get a PoseMatrix of every joint group value in the dna
 
+    Each joint group values block is converted to sparse (column, attr, value) entries in one go,
+    rather than looping over every input and output index.
     """
 
     # get data
     joint_attrs = get_joint_attrs(reader)
     joints_attr_defaults = get_joint_defaults(reader)
-    pose_names = get_pose_names(reader, extend_with_shapes=True)
-    blendshape_names = get_columns_to_blendshape_channels(reader)
+    column_count = reader.getJointColumnCount()
+    group_indices = get_joint_group_indices(reader)
 
-    # get pose values for each joint group
-    poses = [
-        mhCore.Pose(name=name, index=i, shape_name=shape_name)
-        for i, (name, shape_name) in enumerate(zip(pose_names, blendshape_names))
-    ]
+    entry_columns = []
+    entry_attrs = []
+    entry_values = []
 
-    for group_index in range(reader.getJointGroupCount()):
-        # get driver expressions for this joint group
-        input_indices = reader.getJointGroupInputIndices(group_index)
-        input_count = len(input_indices)
+    for group_index, (output_indices, input_indices) in enumerate(group_indices):
+        if not input_indices.size or not output_indices.size:
+            continue
 
-        # get driven attrs for this joint group
-        output_indices = reader.getJointGroupOutputIndices(group_index)
-        output_count = len(output_indices)
-        group_attrs = [joint_attrs[i] for i in output_indices]
+        # get values as (output x input) block
+        values = numpy.array(reader.getJointGroupValues(group_index), dtype=numpy.float32)
+        values = values.reshape(output_indices.size, input_indices.size)
 
-        # get values and add to pose data
-        values = reader.getJointGroupValues(group_index)
+        # ignore any inputs out of range
+        valid = input_indices < column_count
 
-        for column_index, input_index in enumerate(input_indices):
-            pose = poses[input_index]
+        if not valid.all():
+            if verbose:
+                for input_index in input_indices[~valid]:
+                    LOG.warning("input index out of range: {}".format(input_index))
 
-            for row_index, attr in enumerate(group_attrs):
-                value_index = (row_index * input_count) + column_index
+            input_indices = input_indices[valid]
+            values = values[:, valid]
 
-                value = values[value_index]
+        # block entries in column major order
+        entry_columns.append(numpy.repeat(input_indices, output_indices.size))
+        entry_attrs.append(numpy.tile(output_indices, input_indices.size))
+        entry_values.append(values.T.ravel())
 
-                pose.deltas[attr] = value
-                pose.defaults[attr] = joints_attr_defaults[attr]
+    if entry_values:
+        entry_columns = numpy.concatenate(entry_columns)
+        entry_attrs = numpy.concatenate(entry_attrs)
+        entry_values = numpy.concatenate(entry_values)
 
-                # if absolute and attr in joints_attr_defaults:
-                #     value += joints_attr_defaults[attr]
-                #
-                # poses[input_index].values[attr] = value
+    pose_matrix = mhCore.PoseMatrix.from_entries(
+        joint_attrs, entry_columns, entry_attrs, entry_values, column_count,
+        defaults=joints_attr_defaults,
+    )
 
-    return poses
+    pose_matrix.group_indices = group_indices
 
+    return pose_matrix
 
-def set_all_poses(reader, writer, pose_data, from_absolute=True):
-    # validate data
-    if len(pose_data) != reader.getJointColumnCount():
-        raise mhCore.MHError("Joint column count ({}) != pose_data length ({})".format(
-            len(pose_data), reader.getJointColumnCount()
-        ))
 
-    # get data
-    joint_attrs = get_joint_attrs(reader)
-    joints_attr_defaults = get_joint_defaults(reader)
+def get_all_poses(reader, absolute=True):
+    """Get a Pose object for every joint column
+
+    Poses share the AttrTable of a PoseMatrix
+    """
+
+    pose_matrix = get_pose_matrix(reader)
+    pose_names = get_pose_names(reader, extend_with_shapes=True)
+    blendshape_names = get_columns_to_blendshape_channels(reader)
+
+    poses = pose_matrix.get_poses(names=pose_names, shape_names=blendshape_names)
+
+    return poses
+
+
+def get_joint_group_indices(reader):
+    """Get (output indices, input indices) arrays for every joint group
+    """
+    group_indices = []
 
-    # loop through joint groups
     for group_index in range(reader.getJointGroupCount()):
-        input_indices = reader.getJointGroupInputIndices(group_index)
+        output_indices = numpy.array(reader.getJointGroupOutputIndices(group_index), dtype=numpy.intp)
+        input_indices = numpy.array(reader.getJointGroupInputIndices(group_index), dtype=numpy.intp)
+        group_indices.append((output_indices, input_indices))
 
-        if not input_indices:
-            print("No input indices for joint group: {}".format(group_index))
+    return group_indices
+
+
+def set_pose_matrix(reader, writer, pose_matrix, group_indices=None, verbose=False):
+    """Write PoseMatrix values to each joint group
+
+    Each group block is gathered from the sparse pose arrays of its inputs, see PoseMatrix.get_block.
+    Values not driven in the matrix are left as they are in the reader.
+    Groups whose values are unchanged from the reader are not written.
+
+    :return: list of changed joint group indices
+    """
+    if group_indices is None:
+        group_indices = get_joint_group_indices(reader)
+
+    changed_groups = []
+
+    for group_index, (output_indices, input_indices) in enumerate(group_indices):
+        if not input_indices.size:
+            if verbose:
+                LOG.info("No input indices for joint group: {}".format(group_index))
             continue
 
-        output_indices = reader.getJointGroupOutputIndices(group_index)
-        group_attrs = [joint_attrs[i] for i in output_indices]
+        existing_values = numpy.array(reader.getJointGroupValues(group_index), dtype=numpy.float32)
+        existing_values = existing_values.reshape(output_indices.size, input_indices.size)
 
-        # get values for group
-        group_values = []
+        # keep existing values for any inputs out of range, or attrs not driven in the matrix
+        valid = input_indices < pose_matrix.column_count
 
-        for input_index in input_indices:
-            pose = pose_data[input_index]
+        if not valid.all():
+            LOG.warning("input indices out of range for joint group {}: {}".format(
+                group_index, input_indices[~valid].tolist()
+            ))
 
-            output_values = []
+        block_values, block_mask = pose_matrix.get_block(input_indices[valid], output_indices)
 
-            for attr in group_attrs:
-                value = pose.deltas[attr]
+        values = existing_values.copy()
 
-                # if from_absolute and attr in joints_attr_defaults:
-                #     value -= joints_attr_defaults[attr]
+        values[:, valid] = numpy.where(block_mask.T, block_values.T, existing_values[:, valid])
 
-                output_values.append(value)
+        if numpy.array_equal(values, existing_values):
+            continue
 
-            group_values.append(output_values)
+        writer.setJointGroupValues(group_index, values.ravel().tolist())
+        changed_groups.append(group_index)
 
-        # restructure values
-        values = mhMayaUtils.transpose_matrix(group_values)
-        values = [i for values_i in values for i in values_i]
+    return changed_groups
 
-        # set values
-        writer.setJointGroupValues(group_index, values)
 
-    return True
+def set_all_poses(reader, writer, pose_data, from_absolute=True):
+    """Write pose deltas to each joint group
+
+    :return: list of changed joint group indices
+    """
+    # validate data
+    if len(pose_data) != reader.getJointColumnCount():
+        raise mhCore.MHError("Joint column count ({}) != pose_data length ({})".format(
+            len(pose_data), reader.getJointColumnCount()
+        ))
+
+    joint_attrs = get_joint_attrs(reader)
+    pose_matrix = mhCore.PoseMatrix.from_poses(joint_attrs, pose_data)
+
+    changed_groups = set_pose_matrix(reader, writer, pose_matrix)
+
+    LOG.info("Joint groups updated: {}".format(len(changed_groups)))
+
+    return changed_groups
 
 
 
@@ -234,23 +287,18 @@ def get_pose_names(reader, extend_with_shapes=True):
     return pose_names
 
 
-def get_psd_indices(reader):
-    """Get a dict of psd indices with corresponding input pose indices and weights
+def get_psd_matrix(reader):
+    """Get mhCore.PSDMatrix of psd input pose indices and weights
     """
-    psd_count = reader.getPSDCount()
-    columns = reader.getPSDColumnIndices()
-    rows = reader.getPSDRowIndices()
-    values = reader.getPSDValues()
-
-    psd_indices = {}
+    return mhCore.PSDMatrix.from_entries(
+        reader.getPSDRowIndices(), reader.getPSDColumnIndices(), reader.getPSDValues()
+    )
 
-    for psd, pose, weight in zip(rows, columns, values):
-        if psd in psd_indices:
-            psd_indices[psd].append((pose, weight))
-        else:
-            psd_indices[psd] = [(pose, weight)]
 
-    return psd_indices
+def get_psd_indices(reader):
+    """Get a dict of psd indices with corresponding input pose indices and weights
+    """
+    return get_psd_matrix(reader).to_dict()
 
 
 def get_psd_poses(reader, poses, update_names=True):
@@ -272,14 +320,7 @@ def get_psd_poses(reader, poses, update_names=True):
         psd_poses[psd_index] = psd_pose
 
     # add input psds for 3+ way combos
-    for psd_pose in psd_poses.values():
-        for input_psd_pose in psd_poses.values():
-            if input_psd_pose is psd_pose:
-                continue
-
-            # check if input_psd_pose has inputs that contribute to this psd
-            if all([pose in psd_pose.input_poses for pose in input_psd_pose.input_poses]):
-                psd_pose.input_psd_poses.append(input_psd_pose)
+    mhCore.map_input_psd_poses(psd_poses)
 
     if update_names:
         for psd_pose in psd_poses:
@@ -48,6 +48,7 @@ from brenmeta.dna1 import mhJoints
 from brenmeta.mh import mhFaceMaterials, mhFaceJoints
 from brenmeta.mh import mhFaceMeshes
 from brenmeta.maya import mhAnimUtils
+from brenmeta.maya import mhPlugs
 
 LOG = mhCore.get_basic_logger(__name__)
 
@@ -1290,7 +1291,7 @@ class DnaPosesWidget(QtWidgets.QWidget):
         else:
             pose = poses[0]
 
-        pose.update_from_scene()
+        pose.update_from_scene(plug_cache=mhPlugs.get_plug_cache())
 
         # mhBehaviour.update_pose_data_from_scene(
         #     self.calib_reader, self.poses, pose,
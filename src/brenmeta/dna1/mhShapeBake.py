@@ -30,6 +30,7 @@ import dnacalib
 from brenmeta.core import mhCore
 from brenmeta.dna1 import mhBehaviour, mhCore
 from brenmeta.maya import mhMayaUtils
+from brenmeta.maya import mhPlugs
 
 from brenmy.utils import bmBlendshapeUtils
 from brenmy.deformers import bmBlendshape
@@ -205,19 +206,13 @@ bmMhFaceShapeBake.bake_shapes(
     # get attr poses
     # dict where key is every attr for all joints we want to still have driven
     # and value is all poses that drive that attr
-    attr_poses = {}
+    joint_attrs = [
+        "{}.{}".format(joint, attr)
+        for joint in pose_joints
+        for attr in ["tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz"]
+    ]
 
-    for joint in pose_joints:
-        for attr in ["tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz"]:
-            joint_attr = "{}.{}".format(joint, attr)
-
-            joint_poses = []
-
-            for pose in poses:
-                if joint_attr in pose.deltas:
-                    joint_poses.append(pose)
-
-            attr_poses[joint_attr] = joint_poses
+    attr_poses = mhCore.get_attr_poses(poses, joint_attrs)
 
     # create combo logic
     LOG.info("Creating combo logic...")
@@ -272,6 +267,9 @@ bmMhFaceShapeBake.bake_shapes(
     target_group = cmds.createNode("transform", name="targets")
     cmds.hide(target_group)
 
+    # resolve joint attr plugs once for all poses
+    applier = mhPlugs.PoseApplier()
+
     # bake core shapes
     targets = []
     pose_names = []
@@ -297,11 +295,11 @@ bmMhFaceShapeBake.bake_shapes(
         # pose rig
         if pose_index in psd_poses:
             psd_pose = psd_poses[pose_index]
-            psd_pose.pose_joints(summed=True)
+            psd_pose.pose_joints(summed=True, applier=applier)
             pose_name = psd_pose.pose.name
             pose = psd_pose
         else:
-            pose.pose_joints()
+            pose.pose_joints(applier=applier)
             pose_name = pose.name
             pose_names.append(pose_name)
 
@@ -317,7 +315,7 @@ bmMhFaceShapeBake.bake_shapes(
             bs_node, base_mesh, target, default_weight=0.0
         )
 
-        pose.reset_joints()
+        pose.reset_joints(applier=applier)
 
         # create in-betweens
         if pose_name in in_betweens:
@@ -327,7 +325,7 @@ bmMhFaceShapeBake.bake_shapes(
                 ib_value = float(ib_index + 1) / float(in_betweens[pose_name] + 1)
                 ib_value = round(ib_value, 3)
 
-                pose.pose_joints(blend=ib_value)
+                pose.pose_joints(blend=ib_value, applier=applier)
 
                 in_between_target = cmds.duplicate(mesh, name=pose_name)[0]
                 cmds.parent(in_between_target, target_group)
@@ -337,7 +335,7 @@ bmMhFaceShapeBake.bake_shapes(
                     bs_node, base_mesh, pose_name, in_between_target, ib_value
                 )
 
-                pose.reset_joints()
+                pose.reset_joints(applier=applier)
 
     cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
 
@@ -0,0 +1,430 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Headless batch processing of dna files
+
+Runs the same operations as the Transfer and Merge tabs over a manifest of
+dna files, without Qt or the Maya UI, one dna per worker process:
+
+    mayapy -m brenmeta.dna2.mhBatch manifest.json --workers 8 --report report.json
+
+The manifest is a json file with a list of jobs, and optional defaults
+that are used for any option a job doesn't set:
+
+    {
+        "defaults": {
+            "src": "base/head.dna",
+            "merge_joints": true,
+            "calculate_lods": true
+        },
+        "jobs": [
+            {"input": "chars/a.dna", "output": "out/a.dna", "scale": 1.1},
+            {"input": "chars/b.dna", "output": "out/b.json", "merge_vertices": "nearest", "json": true}
+        ]
+    }
+
+Relative paths are relative to the manifest. Job options:
+
+    input               dna file to modify
+    output              file to write, defaults to input file name in --output-dir
+    scale               scale dna by value
+    src                 dna file to merge from
+    merge_joints        set neutral joint xforms to those of src
+    merge_vertices      set vertex positions to those of src, by "index", "nearest" or "barycentric"
+    merge_poses         set joint poses to those of src
+    calculate_lods      recalculate lower lods, only of merged meshes if merge_vertices is set
+    lod                 lod of meshes to merge, default 0
+    json                write output as json
+    mesh_workers        threads used per dna to prepare mesh data, see mhMesh.map_meshes
+
+Each job gets a result with the time taken by each step, or the error if it failed.
+
+Each worker process starts maya standalone and validates the metahuman plugin
+and dna module once, before any job is run, see init_worker.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import traceback
+
+from brenmeta.core import mhCore
+
+LOG = mhCore.get_basic_logger(__name__)
+
+VERTEX_MATCH_MODES = ["index", "nearest", "barycentric"]
+
+PATH_OPTIONS = ["input", "output", "src"]
+
+DEFAULT_OPTIONS = {
+    "output": None,
+    "scale": 1.0,
+    "src": None,
+    "merge_joints": False,
+    "merge_vertices": None,
+    "merge_poses": False,
+    "calculate_lods": False,
+    "lod": 0,
+    "json": False,
+    "mesh_workers": None,
+}
+
+
+class BatchResult(object):
+    """Result and step timings of one batch job
+    """
+
+    def __init__(self, job):
+        self.input = job.get("input")
+        self.output = job.get("output")
+        self.ok = False
+        self.error = None
+        self.timings = {}
+        self.seconds = 0.0
+        self.mesh_timings = {}
+        self.updated_mesh_count = None
+        self.moved_joint_count = None
+
+    def step(self, name, start):
+        self.timings[name] = time.time() - start
+        return self.timings[name]
+
+    def to_dict(self):
+        return {
+            "input": self.input,
+            "output": self.output,
+            "ok": self.ok,
+            "error": self.error,
+            "seconds": self.seconds,
+            "timings": self.timings,
+            "mesh_timings": {str(key): value for key, value in self.mesh_timings.items()},
+            "updated_mesh_count": self.updated_mesh_count,
+            "moved_joint_count": self.moved_joint_count,
+        }
+
+
+def read_manifest(path, output_dir=None):
+    """Get list of job dicts from manifest, with defaults applied and paths made absolute
+    """
+    path = os.path.abspath(path)
+
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    # a plain list of jobs is also accepted
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+
+    root = os.path.dirname(path)
+
+    defaults = dict(DEFAULT_OPTIONS)
+    defaults.update(manifest.get("defaults", {}))
+
+    jobs = []
+
+    for i, job_options in enumerate(manifest.get("jobs", [])):
+        # a plain path is a job with default options
+        if not isinstance(job_options, dict):
+            job_options = {"input": job_options}
+
+        job = dict(defaults)
+        job.update(job_options)
+
+        for key in PATH_OPTIONS:
+            if job.get(key):
+                job[key] = os.path.normpath(os.path.join(root, job[key]))
+
+        validate_job(job, i)
+
+        if job["output"] is None:
+            if output_dir is None:
+                raise mhCore.MHError("No output path for job {}, and no output dir given".format(i))
+
+            file_name = os.path.splitext(os.path.basename(job["input"]))[0]
+            file_name += ".json" if job["json"] else ".dna"
+
+            job["output"] = os.path.join(os.path.abspath(output_dir), file_name)
+
+        jobs.append(job)
+
+    return jobs
+
+
+def validate_job(job, index=0):
+    unknown = set(job.keys()) - set(DEFAULT_OPTIONS.keys()) - {"input"}
+
+    if unknown:
+        raise mhCore.MHError("Unrecognised options in job {}: {}".format(index, sorted(unknown)))
+
+    if not job.get("input"):
+        raise mhCore.MHError("No input path for job {}".format(index))
+
+    if job["merge_vertices"] not in [None, False] + VERTEX_MATCH_MODES:
+        raise mhCore.MHError("Unrecognised merge_vertices in job {}: {}, expected one of: {}".format(
+            index, job["merge_vertices"], VERTEX_MATCH_MODES
+        ))
+
+    if any([job["merge_joints"], job["merge_vertices"], job["merge_poses"]]) and not job["src"]:
+        raise mhCore.MHError("No src path for merge in job {}".format(index))
+
+    return True
+
+
+def init_worker():
+    """Initialize maya standalone and validate dependencies, before dna libs are imported
+
+    Called once per worker process, and in this process if jobs are run in process.
+    """
+    from maya import cmds
+
+    # cmds is empty until maya is initialized, eg. in a fresh mayapy process
+    if not hasattr(cmds, "about"):
+        import maya.standalone
+        maya.standalone.initialize(name="python")
+
+    from brenmeta.dna2 import mhSrc
+
+    mhSrc.validate_plugin()
+    mhSrc.validate_dna_module()
+
+    return True
+
+
+def process_job(job):
+    """Run job and get result dict, errors are caught and stored in the result
+    """
+    # imported here so the manifest can be read without the dna libs
+    import dna
+
+    from brenmeta.dna2 import mhBehaviour
+    from brenmeta.dna2 import mhCache
+    from brenmeta.dna2 import mhJoints
+    from brenmeta.dna2 import mhMesh
+    from brenmeta.dna2 import mhUtils
+
+    result = BatchResult(job)
+    job_start = time.time()
+
+    try:
+        start = time.time()
+        dna_obj = mhCache.get_dna(job["input"])
+        calib_reader = mhCache.get_calib_reader(job["input"])
+        result.step("load", start)
+
+        src_dna_obj = None
+        src_reader = None
+
+        if job["src"]:
+            start = time.time()
+            src_dna_obj = mhCache.get_dna(job["src"])
+            src_reader = mhCache.get_reader(job["src"])
+            result.step("load_src", start)
+
+        if job["scale"] != 1.0:
+            start = time.time()
+            mhUtils.scale_dna(calib_reader, job["scale"])
+            result.step("scale", start)
+
+        if job["merge_joints"]:
+            start = time.time()
+            joint_diff = mhJoints.merge_joint_neutral_xforms(src_reader, calib_reader)
+            result.moved_joint_count = len(joint_diff.moved_joints)
+            result.step("merge_joints", start)
+
+        # only recalculate lods of meshes that have changed
+        updated_mesh_indices = None
+
+        if job["merge_vertices"]:
+            start = time.time()
+
+            updated_mesh_indices = mhMesh.merge_meshes_positions(
+                src_dna_obj, src_reader, dna_obj, calib_reader,
+                lod=job["lod"],
+                src_dna_path=job["src"],
+                correspondence=None if job["merge_vertices"] == "index" else job["merge_vertices"],
+                workers=job["mesh_workers"],
+                timings=result.mesh_timings,
+            )
+
+            result.updated_mesh_count = len(updated_mesh_indices)
+            result.step("merge_vertices", start)
+
+        if job["calculate_lods"]:
+            start = time.time()
+
+            # lods of all meshes are calculated in one command sequence, so are timed as one step
+            mhMesh.calculate_lods(dna_obj, calib_reader, from_lod=job["lod"], mesh_indices=updated_mesh_indices)
+
+            result.step("calculate_lods", start)
+
+        start = time.time()
+
+        output_dir = os.path.dirname(job["output"])
+
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        if job["merge_poses"]:
+            poses = mhBehaviour.get_all_poses(src_reader)
+
+            mhBehaviour.save_dna(
+                calib_reader, job["output"], validate=True, as_json=job["json"], poses=poses,
+            )
+        else:
+            mhUtils.save_dna(calib_reader, job["output"], validate=True, as_json=job["json"])
+
+        result.step("save", start)
+
+        if not dna.Status.isOk():
+            raise mhCore.MHError(dna.Status.get().message)
+
+        result.ok = True
+
+    except Exception as err:
+        # keep going with the rest of the batch, the error is reported per file
+        result.error = "{}: {}".format(type(err).__name__, err)
+        LOG.error("Failed to process dna: {}\n{}".format(job["input"], traceback.format_exc()))
+
+    result.seconds = time.time() - job_start
+
+    return result.to_dict()
+
+
+def run_jobs(jobs, workers=None):
+    """Run jobs in a process pool, one dna per worker, and get result dicts in job order
+
+    If workers is 1 jobs are run in this process instead.
+    Each worker is initialized with init_worker.
+    """
+    if workers == 1 or len(jobs) <= 1:
+        init_worker()
+        return [process_job(job) for job in jobs]
+
+    results = [None] * len(jobs)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        futures = {executor.submit(process_job, job): i for i, job in enumerate(jobs)}
+
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+
+            try:
+                results[i] = future.result()
+            except Exception as err:
+                # eg. the worker process crashed in the dna library
+                results[i] = BatchResult(jobs[i]).to_dict()
+                results[i]["error"] = "{}: {}".format(type(err).__name__, err)
+
+            LOG.info("{} {} ({:.2f}s)".format(
+                "done" if results[i]["ok"] else "FAILED", jobs[i]["input"], results[i]["seconds"]
+            ))
+
+    return results
+
+
+def get_report(results, seconds=None):
+    """Get report dict of results, with totals
+    """
+    return {
+        "count": len(results),
+        "ok_count": len([result for result in results if result["ok"]]),
+        "failed_count": len([result for result in results if not result["ok"]]),
+        "seconds": seconds,
+        "job_seconds": sum([result["seconds"] for result in results]),
+        "results": results,
+    }
+
+
+def log_report(report):
+    for result in report["results"]:
+        steps = ", ".join([
+            "{} {:.2f}s".format(step, seconds) for step, seconds in result["timings"].items()
+        ])
+
+        if result["ok"]:
+            LOG.info("OK     {} ({:.2f}s: {})".format(result["input"], result["seconds"], steps))
+        else:
+            LOG.error("FAILED {} ({})".format(result["input"], result["error"]))
+
+    LOG.info("{ok_count}/{count} dna files processed, {failed_count} failed".format(**report))
+
+    if report["seconds"]:
+        LOG.info("{:.2f}s total, {:.2f}s of work ({:.1f}x)".format(
+            report["seconds"], report["job_seconds"], report["job_seconds"] / report["seconds"]
+        ))
+
+    return True
+
+
+def run_manifest(manifest_path, workers=None, output_dir=None, report_path=None):
+    """Run all jobs in manifest and get report dict
+    """
+    jobs = read_manifest(manifest_path, output_dir=output_dir)
+
+    # avoid each process starting its own full thread pool
+    if workers != 1:
+        for job in jobs:
+            if job["mesh_workers"] is None:
+                job["mesh_workers"] = 1
+
+    LOG.info("Processing {} dna files...".format(len(jobs)))
+
+    start = time.time()
+    results = run_jobs(jobs, workers=workers)
+
+    report = get_report(results, seconds=time.time() - start)
+
+    log_report(report)
+
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=4)
+
+        LOG.info("Report written: {}".format(report_path))
+
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="brenmeta.dna2.mhBatch",
+        description="Batch process dna files listed in a json manifest",
+    )
+
+    parser.add_argument("manifest", help="json manifest of jobs")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-o", "--output-dir", default=None, help="directory for jobs with no output path")
+    parser.add_argument("-r", "--report", default=None, help="path to write json report to")
+
+    args = parser.parse_args(args)
+
+    try:
+        report = run_manifest(
+            args.manifest, workers=args.workers, output_dir=args.output_dir, report_path=args.report
+        )
+    except (mhCore.MHError, IOError, ValueError) as err:
+        LOG.error(err)
+        return 2
+
+    return 0 if report["failed_count"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,12 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import numpy
+
 from maya import cmds
 
 import dna
 
 from brenmeta.core import mhCore
-from brenmeta.maya import mhMayaUtils
+from brenmeta.dna2 import mhReader
 
 LOG = mhCore.get_basic_logger(__name__)
 
@@ -28,22 +30,18 @@ LOG = mhCore.get_basic_logger(__name__)
 def find_expression_index(reader, expression, ignore_namespace=True):
     """Find matching raw control for given expression name and return index
     """
-    for i in range(reader.getRawControlCount()):
-        raw_control = reader.getRawControlName(i)
-
-        if ignore_namespace:
-            raw_control = raw_control.split(".")[-1]
+    index = mhReader.get_reader_index(reader).get_raw_control_index(
+        expression, ignore_namespace=ignore_namespace
+    )
 
-        if raw_control == expression:
-            return i
+    if index is None:
+        raise mhCore.MHError("Failed to find expression: {}".format(expression))
 
-    raise mhCore.MHError("Failed to find expression: {}".format(expression))
+    return index
 
 
 def print_expressions(reader, ignore_namespace=True, filter=None):
-    for i in range(reader.getRawControlCount()):
-        raw_control = reader.getRawControlName(i)
-
+    for raw_control in mhReader.get_snapshot(reader).raw_control_names:
         if ignore_namespace:
             raw_control = raw_control.split(".")[-1]
 
@@ -66,26 +64,15 @@ def print_expressions(reader, ignore_namespace=True, filter=None):
 def get_joint_attrs(reader):
     """Get a list of joint attrs that correspond to joint output indices
     """
-
-    joint_attrs = []
-
-    for i in range(reader.getJointCount()):
-        joint = reader.getJointName(i)
-
-        for attr in ["tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz"]:
-            joint_attrs.append("{}.{}".format(joint, attr))
-
-    return joint_attrs
+    return list(mhReader.get_snapshot(reader).joint_attrs)
 
 
 def get_joint_defaults(reader):
-    joints_attr_defaults = {}
-
-    for i in range(reader.getJointCount()):
-        joint = reader.getJointName(i)
+    snapshot = mhReader.get_snapshot(reader)
 
-        translation = reader.getNeutralJointTranslation(i)
+    joints_attr_defaults = {}
 
+    for joint, translation in zip(snapshot.joint_names, snapshot.neutral_joint_translations.tolist()):
         for axis, value in zip("xyz", translation):
             joints_attr_defaults["{}.t{}".format(joint, axis)] = value
 
@@ -96,205 +83,257 @@ def get_joint_defaults(reader):
     return joints_attr_defaults
 
 
-def get_all_poses(reader, verbose=False):
-    """
+def get_pose_matrix(reader, verbose=False, prune_threshold=None, lod=None):
+    """Get a PoseMatrix of every joint group value in the dna
+
+    Each joint group values block is converted to sparse (column, attr, value) entries in one go,
+    rather than looping over every input and output index.
 
+    If prune_threshold is given, values with an absolute value less than or equal to it are dropped,
+    eg. 0.0 to drop only exact zeros.
+
+    If lod is given, only the joint group rows active at that lod are read,
+    other attrs are left undriven and so are kept as they are when saving.
     """
 
     # get data
+    snapshot = mhReader.get_snapshot(reader)
     joint_attrs = get_joint_attrs(reader)
     joints_attr_defaults = get_joint_defaults(reader)
-    pose_names = get_pose_names(reader, extend_with_shapes=True)
-    blendshape_names = get_columns_to_blendshape_channels(reader)
+    column_count = snapshot.joint_column_count
+    group_indices = get_joint_group_indices(reader)
 
-    # get pose values for each joint group
-    poses = [
-        mhCore.Pose(name=name, index=i, shape_name=shape_name)
-        for i, (name, shape_name) in enumerate(zip(pose_names, blendshape_names))
-    ]
+    entry_columns = []
+    entry_attrs = []
+    entry_values = []
+
+    for group_index, (output_indices, input_indices) in enumerate(group_indices):
+        if not input_indices.size or not output_indices.size:
+            continue
 
-    for group_index in range(reader.getJointGroupCount()):
-        # get driver expressions for this joint group
-        input_indices = reader.getJointGroupInputIndices(group_index)
-        input_count = len(input_indices)
+        # get values as (output x input) block
+        values = numpy.array(reader.getJointGroupValues(group_index), dtype=numpy.float32)
+        values = values.reshape(output_indices.size, input_indices.size)
 
-        # get driven attrs for this joint group
-        output_indices = reader.getJointGroupOutputIndices(group_index)
-        output_count = len(output_indices)
-        group_attrs = [joint_attrs[i] for i in output_indices]
+        if lod is not None:
+            row_count = snapshot.get_joint_group_row_count(group_index, lod=lod)
+            output_indices = output_indices[:row_count]
+            values = values[:row_count]
 
-        # get values and add to pose data
-        values = reader.getJointGroupValues(group_index)
+        # ignore any inputs out of range
+        valid = input_indices < column_count
 
-        for column_index, input_index in enumerate(input_indices):
-            if input_index >= len(poses):
-                if verbose:
+        if not valid.all():
+            if verbose:
+                for input_index in input_indices[~valid]:
                     LOG.warning("input index out of range: {}".format(input_index))
-                continue
 
-            pose = poses[input_index]
+            input_indices = input_indices[valid]
+            values = values[:, valid]
+
+        # block entries in column major order
+        entry_columns.append(numpy.repeat(input_indices, output_indices.size))
+        entry_attrs.append(numpy.tile(output_indices, input_indices.size))
+        entry_values.append(values.T.ravel())
 
-            for row_index, attr in enumerate(group_attrs):
-                value_index = (row_index * input_count) + column_index
+    if entry_values:
+        entry_columns = numpy.concatenate(entry_columns)
+        entry_attrs = numpy.concatenate(entry_attrs)
+        entry_values = numpy.concatenate(entry_values)
 
-                value = values[value_index]
+    pose_matrix = mhCore.PoseMatrix.from_entries(
+        joint_attrs, entry_columns, entry_attrs, entry_values, column_count,
+        defaults=joints_attr_defaults, prune_threshold=prune_threshold,
+    )
 
-                pose.deltas[attr] = value
-                pose.defaults[attr] = joints_attr_defaults[attr]
+    pose_matrix.group_indices = group_indices
+
+    if pose_matrix.prune_stats:
+        LOG.info("Pruned {pruned} of {total} pose values <= {threshold}, max error: {max_error}".format(
+            total=pose_matrix.prune_stats["pruned"] + pose_matrix.prune_stats["kept"],
+            **pose_matrix.prune_stats
+        ))
+
+    return pose_matrix
+
+
+def get_all_poses(reader, verbose=False, prune_threshold=None, lod=None):
+    """Get a Pose object for every joint column
+
+    Poses share the AttrTable of a PoseMatrix, if lod is given only joint attrs active at that lod are driven
+    """
+
+    pose_matrix = get_pose_matrix(reader, verbose=verbose, prune_threshold=prune_threshold, lod=lod)
+    pose_names = get_pose_names(reader, extend_with_shapes=True)
+    blendshape_names = mhReader.get_snapshot(reader).columns_to_blendshape_channels
+
+    poses = pose_matrix.get_poses(names=pose_names, shape_names=blendshape_names)
 
     return poses
 
 
-def set_all_poses(reader, writer, pose_data):
-    # validate data
-    if len(pose_data) != reader.getJointColumnCount():
-        LOG.warning("Joint column count ({}) != pose_data length ({})".format(
-            len(pose_data), reader.getJointColumnCount()
-        ))
+def get_joint_group_indices(reader, lod=None):
+    """Get (output indices, input indices) arrays for every joint group
+
+    If lod is given, output indices are sliced to the rows active at that lod
+    """
+    return mhReader.get_snapshot(reader).get_joint_group_indices(lod=lod)
 
-    # get data
-    joint_attrs = get_joint_attrs(reader)
-    joints_attr_defaults = get_joint_defaults(reader)
 
-    # loop through joint groups
-    for group_index in range(reader.getJointGroupCount()):
-        input_indices = reader.getJointGroupInputIndices(group_index)
+def set_pose_matrix(reader, writer, pose_matrix, group_indices=None, dirty_only=False, verbose=False):
+    """Write PoseMatrix values to each joint group
 
-        if not input_indices:
-            print("No input indices for joint group: {}".format(group_index))
+    Each group block is gathered from the sparse pose arrays of its inputs, see PoseMatrix.get_block.
+    Values not driven in the matrix are left as they are in the reader.
+    Groups whose values are unchanged from the reader are not written.
+
+    If dirty_only is True, only groups with inputs from dirty matrix columns are considered,
+    this assumes the writer has already been set from the reader.
+
+    :return: list of changed joint group indices
+    """
+    if group_indices is None:
+        if pose_matrix.group_indices is not None and \
+                pose_matrix.column_count == mhReader.get_snapshot(reader).joint_column_count:
+            group_indices = pose_matrix.group_indices
+        else:
+            group_indices = get_joint_group_indices(reader)
+
+    if dirty_only:
+        group_filter = set(pose_matrix.get_dirty_groups(group_indices))
+
+        if verbose:
+            LOG.info("Dirty joint groups: {}/{}".format(len(group_filter), len(group_indices)))
+    else:
+        group_filter = None
+
+    changed_groups = []
+
+    for group_index, (output_indices, input_indices) in enumerate(group_indices):
+        if group_filter is not None and group_index not in group_filter:
             continue
 
-        output_indices = reader.getJointGroupOutputIndices(group_index)
-        group_attrs = [joint_attrs[i] for i in output_indices]
+        if not input_indices.size:
+            if verbose:
+                LOG.info("No input indices for joint group: {}".format(group_index))
+            continue
 
-        # get values for group
-        group_values = []
+        existing_values = numpy.array(reader.getJointGroupValues(group_index), dtype=numpy.float32)
+        existing_values = existing_values.reshape(output_indices.size, input_indices.size)
 
-        for input_index in input_indices:
-            if input_index < len(pose_data):
-                pose = pose_data[input_index]
-            else:
-                LOG.warning("input index out of range: {}".format(input_index))
-                pose = None
+        # keep existing values for any inputs out of range, or attrs not driven in the matrix
+        valid = input_indices < pose_matrix.column_count
 
-            output_values = []
+        if not valid.all():
+            LOG.warning("input indices out of range for joint group {}: {}".format(
+                group_index, input_indices[~valid].tolist()
+            ))
 
-            for attr in group_attrs:
-                if pose:
-                    value = pose.deltas[attr]
-                else:
-                    value = 0.0 # TODO use existing value
+        block_values, block_mask = pose_matrix.get_block(input_indices[valid], output_indices)
 
-                output_values.append(value)
+        values = existing_values.copy()
 
-            group_values.append(output_values)
+        values[:, valid] = numpy.where(block_mask.T, block_values.T, existing_values[:, valid])
 
-        # restructure values
-        values = mhMayaUtils.transpose_matrix(group_values)
-        values = [i for values_i in values for i in values_i]
+        if numpy.array_equal(values, existing_values):
+            continue
 
-        # set values
-        writer.setJointGroupValues(group_index, values)
+        writer.setJointGroupValues(group_index, values.ravel().tolist())
+        changed_groups.append(group_index)
 
-    return True
+    return changed_groups
 
 
-def get_columns_to_blendshape_channels(reader):
-    """Get list of blendshape channels associated with each joint column
+def set_all_poses(reader, writer, pose_data, dirty_only=False):
+    """Write pose deltas to each joint group
+
+    If dirty_only is True, only joint groups driven by poses edited since they were loaded are written.
+    Note poses stay dirty after saving, as the reader they were loaded from is not updated.
+
+    :return: list of changed joint group indices
     """
-    blendshape_channel_names = [
-        reader.getBlendShapeChannelName(i)
-        for i in range(reader.getBlendShapeChannelCount())
-    ]
+    # validate data
+    if len(pose_data) != reader.getJointColumnCount():
+        LOG.warning("Joint column count ({}) != pose_data length ({})".format(
+            len(pose_data), reader.getJointColumnCount()
+        ))
 
-    blendshape_channel_inputs = reader.getBlendShapeChannelInputIndices()
+    joint_attrs = get_joint_attrs(reader)
+    pose_matrix = mhCore.PoseMatrix.from_poses(joint_attrs, pose_data)
 
-    columns_to_blendshapes = [None] * reader.getJointColumnCount()
-    # columns_to_blendshapes = [None] * (max(blendshape_channel_inputs) + 1)
+    changed_groups = set_pose_matrix(reader, writer, pose_matrix, dirty_only=dirty_only)
 
-    for blendshape_channel_name, joint_column in zip(blendshape_channel_names, blendshape_channel_inputs):
-        if joint_column >= reader.getJointColumnCount():
-            LOG.warning("Blendshape out of joint column range: {} {}".format(blendshape_channel_name, joint_column))
-            continue
+    LOG.info("Joint groups updated: {}".format(len(changed_groups)))
 
-        columns_to_blendshapes[joint_column] = blendshape_channel_name
+    return changed_groups
 
-    return columns_to_blendshapes
+
+def get_columns_to_blendshape_channels(reader):
+    """Get list of blendshape channels associated with each joint column
+    """
+    return list(mhReader.get_snapshot(reader).columns_to_blendshape_channels)
 
 
 def get_pose_names(reader, extend_with_shapes=True):
     """Get appropriate names for all poses (aka joint columns)
     """
+    snapshot = mhReader.get_snapshot(reader)
 
-    pose_names = []
-
-    for i in range(reader.getRawControlCount()):
-        pose_name = reader.getRawControlName(i)
-        pose_name = pose_name.split(".")[-1]
-        pose_names.append(pose_name)
+    pose_names = [
+        mhReader.get_short_name(raw_control) for raw_control in snapshot.raw_control_names
+    ]
 
     if extend_with_shapes:
-        columns_to_blendshapes = get_columns_to_blendshape_channels(reader)
-        pose_names.extend(columns_to_blendshapes[reader.getRawControlCount():])
+        pose_names.extend(snapshot.columns_to_blendshape_channels[snapshot.raw_control_count:])
 
     return pose_names
 
 
+def get_psd_matrix(reader):
+    """Get mhCore.PSDMatrix of psd input pose indices and weights
+    """
+    return mhReader.get_snapshot(reader).psd_matrix
+
+
 def get_psd_indices(reader):
     """Get a dict of psd indices with corresponding input pose indices and weights
     """
-    psd_count = reader.getPSDCount()
-    columns = reader.getPSDColumnIndices()
-    rows = reader.getPSDRowIndices()
-    values = reader.getPSDValues()
+    return get_psd_matrix(reader).to_dict()
 
-    psd_indices = {}
 
-    for psd, pose, weight in zip(rows, columns, values):
-        if psd in psd_indices:
-            psd_indices[psd].append((pose, weight))
-        else:
-            psd_indices[psd] = [(pose, weight)]
-
-    return psd_indices
+def get_pose_psds(reader, pose_index):
+    """Get sorted array of the psd indices that pose feeds
+    """
+    return get_psd_matrix(reader).get_psds(pose_index)
 
 
 def get_psd_poses(reader, poses, override_name=True):
     """Get a list of PSDPose objects referencing given Pose objects
     """
-    psd_indices = get_psd_indices(reader)
+    psd_matrix = get_psd_matrix(reader)
 
     psd_poses = {}
 
     # create psd pose objects
-    for psd_index, psd_data in psd_indices.items():
+    for psd_index, pose_indices, weights in psd_matrix.iter_rows():
         psd_pose = mhCore.PSDPose()
         psd_pose.pose = poses[psd_index]
-        psd_valid = True
 
-        for pose_index, weight in psd_data:
-            if pose_index >= len(poses):
-                LOG.warning("psd input pose out of range: {} {}".format(psd_pose.pose.name, pose_index))
-                psd_valid = False
-                continue
+        in_range = pose_indices < len(poses)
+
+        for pose_index in pose_indices[~in_range].tolist():
+            LOG.warning("psd input pose out of range: {} {}".format(psd_pose.pose.name, pose_index))
 
-            psd_pose.input_poses.append(poses[pose_index])
-            psd_pose.input_weights.append(weight)
+        psd_pose.input_poses = [poses[pose_index] for pose_index in pose_indices[in_range].tolist()]
+        psd_pose.input_weights = weights[in_range].tolist()
 
-        if psd_valid:
+        if in_range.all():
             psd_poses[psd_index] = psd_pose
         else:
             LOG.warning("invalid psd pose: {}".format(psd_pose.pose.name))
 
     # add input psds for 3+ way combos
-    for psd_pose in psd_poses.values():
-        for input_psd_pose in psd_poses.values():
-            if input_psd_pose is psd_pose:
-                continue
-
-            # check if input_psd_pose has inputs that contribute to this psd
-            if all([pose in psd_pose.input_poses for pose in input_psd_pose.input_poses]):
-                psd_pose.input_psd_poses.append(input_psd_pose)
+    mhCore.map_input_psd_poses(psd_poses)
 
     # check psd names
     # if dna file does not have blendshapes to get names from
@@ -308,7 +347,7 @@ def get_psd_poses(reader, poses, override_name=True):
     return psd_poses
 
 
-def save_dna(reader, path, validate=True, as_json=False, poses=None):
+def save_dna(reader, path, validate=True, as_json=False, poses=None, dirty_only=False):
     stream = dna.FileStream(path, dna.FileStream.AccessMode_Write, dna.FileStream.OpenMode_Binary)
 
     if as_json:
@@ -316,10 +355,10 @@ def save_dna(reader, path, validate=True, as_json=False, poses=None):
     else:
         writer = dna.BinaryStreamWriter(stream)
 
-    writer.setFrom(reader)
+    writer.setFrom(mhReader.get_full_reader(reader))
 
     if poses:
-        set_all_poses(reader, writer, poses)
+        set_all_poses(reader, writer, poses, dirty_only=dirty_only)
 
     writer.write()
 
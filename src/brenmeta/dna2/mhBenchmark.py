@@ -0,0 +1,324 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks for dna data operations
+
+eg.
+
+    from brenmeta.dna2 import mhBenchmark
+    mhBenchmark.benchmark_pose_memory(r"D:/Projects/metahuman/head.dna")
+    mhBenchmark.benchmark_load_layers(r"D:/Projects/metahuman/head.dna")
+    mhBenchmark.benchmark_psd_graph(r"D:/Projects/metahuman/head.dna")
+    mhBenchmark.benchmark_evaluator(r"D:/Projects/metahuman/head.dna")
+    mhBenchmark.benchmark_lods(r"D:/Projects/metahuman/head.dna")
+
+"""
+
+import gc
+import os
+import time
+import tracemalloc
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import numpy
+
+from brenmeta.core import mhCore
+from brenmeta.dna2 import mhBehaviour
+from brenmeta.dna2 import mhEvaluator
+from brenmeta.dna2 import mhReader
+from brenmeta.dna2 import mhUtils
+
+LOG = mhCore.get_basic_logger(__name__)
+
+
+def measure_memory(func, *args, **kwargs):
+    """Call func and get the result, the bytes still allocated after the call and the peak bytes allocated
+    """
+    tracemalloc.start()
+
+    try:
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        result = func(*args, **kwargs)
+        end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, end_bytes - start_bytes, peak_bytes - start_bytes
+
+
+def get_process_memory():
+    """Get resident memory of this process in bytes
+
+    Unlike tracemalloc this includes memory allocated by the dna library.
+    Uses psutil if available, otherwise the peak resident memory from the resource module,
+    which only increases and so only gives a lower bound when comparing.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_pose_dicts(poses):
+    """Get deltas and defaults of each pose as plain dicts,
+    as poses were stored before they were array backed
+    """
+    return [
+        (dict(pose.deltas.items()), dict(pose.defaults.items()))
+        for pose in poses
+    ]
+
+
+def benchmark_pose_memory(dna_path):
+    """Compare memory used by array backed poses against dict backed poses for the given dna
+
+    Note dict sizes exclude the attr name strings, which are shared by both representations.
+    """
+    reader = mhUtils.load_dna(dna_path)
+
+    start = time.time()
+    poses, pose_bytes, pose_peak_bytes = measure_memory(mhBehaviour.get_all_poses, reader)
+    pose_time = time.time() - start
+
+    start = time.time()
+    pose_dicts, dict_bytes, dict_peak_bytes = measure_memory(get_pose_dicts, poses)
+    dict_time = time.time() - start
+
+    entry_count = sum([len(deltas) for deltas, defaults in pose_dicts])
+
+    results = {
+        "pose_count": len(poses),
+        "attr_count": len(poses[0].attr_table) if poses else 0,
+        "entry_count": entry_count,
+        "array_bytes": pose_bytes,
+        "array_peak_bytes": pose_peak_bytes,
+        "array_time": pose_time,
+        "dict_bytes": dict_bytes,
+        "dict_peak_bytes": dict_peak_bytes,
+        "dict_time": dict_time,
+    }
+
+    LOG.info("Pose memory: {}".format(dna_path))
+    LOG.info("    {pose_count} poses, {attr_count} attrs, {entry_count} pose deltas".format(**results))
+
+    LOG.info("    array backed: {:.2f} MB (peak {:.2f} MB) in {:.3f}s".format(
+        pose_bytes / 1e6, pose_peak_bytes / 1e6, pose_time
+    ))
+
+    LOG.info("    dict backed: {:.2f} MB (peak {:.2f} MB)".format(
+        dict_bytes / 1e6, dict_peak_bytes / 1e6
+    ))
+
+    if pose_bytes:
+        LOG.info("    ratio: {:.1f}x".format(float(dict_bytes) / pose_bytes))
+
+    return results
+
+
+def benchmark_load_layers(dna_path, layers=None):
+    """Compare load time and memory of the given dna loaded with each layer
+    """
+    if layers is None:
+        layers = mhReader.LAYERS
+
+    results = {}
+
+    LOG.info("Dna load layers: {}".format(dna_path))
+
+    for layer in layers:
+        gc.collect()
+        start_memory = get_process_memory()
+
+        start = time.time()
+        reader = mhReader.load_dna(dna_path, layer=layer)
+        load_time = time.time() - start
+
+        memory = get_process_memory() - start_memory
+
+        results[layer] = {
+            "time": load_time,
+            "memory_bytes": memory,
+        }
+
+        LOG.info("    {}: {:.3f}s, {:.2f} MB".format(layer, load_time, memory / 1e6))
+
+        del reader
+
+    return results
+
+
+def map_input_psd_poses_pairwise(psd_poses):
+    """Map input psd poses by comparing every psd with every other psd,
+    as get_psd_poses did before mhCore.map_input_psd_poses
+    """
+    for psd_pose in psd_poses.values():
+        input_psd_poses = []
+
+        for input_psd_pose in psd_poses.values():
+            if input_psd_pose is psd_pose:
+                continue
+
+            if all([pose in psd_pose.input_poses for pose in input_psd_pose.input_poses]):
+                input_psd_poses.append(input_psd_pose)
+
+        psd_pose.input_psd_poses = input_psd_poses
+
+    return True
+
+
+def benchmark_psd_graph(dna_path, bake_config_path=None):
+    """Compare mapping input psd poses with mhCore.map_input_psd_poses against pairwise comparison
+
+    Uses every psd in the dna plus the additional combos of the bake config.
+    """
+    # imported here so other benchmarks don't import the shape baking and blendshape modules
+    from brenmeta.maya import mhShapeBake
+
+    if bake_config_path is None:
+        bake_config_path = os.path.join(mhCore.DATA_DIR, "configs", "bake_config.json")
+
+    reader = mhUtils.load_dna(dna_path, layer="behavior")
+
+    poses = mhBehaviour.get_all_poses(reader)
+    psd_poses = mhBehaviour.get_psd_poses(reader, poses)
+    joints_attr_defaults = mhBehaviour.get_joint_defaults(reader)
+
+    bake_config = mhShapeBake.BakeConfig.load(bake_config_path)
+
+    mhCore.add_additional_poses(poses, bake_config.shapes, joints_attr_defaults)
+    mhCore.add_additional_combo_poses(poses, psd_poses, bake_config.combos, joints_attr_defaults)
+
+    start = time.time()
+    map_input_psd_poses_pairwise(psd_poses)
+    pairwise_time = time.time() - start
+
+    pairwise_inputs = [list(psd_pose.input_psd_poses) for psd_pose in psd_poses.values()]
+
+    start = time.time()
+    mhCore.map_input_psd_poses(psd_poses)
+    indexed_time = time.time() - start
+
+    indexed_inputs = [list(psd_pose.input_psd_poses) for psd_pose in psd_poses.values()]
+
+    results = {
+        "psd_count": len(psd_poses),
+        "additional_combo_count": len(bake_config.combos),
+        "input_psd_count": sum([len(inputs) for inputs in indexed_inputs]),
+        "pairwise_time": pairwise_time,
+        "indexed_time": indexed_time,
+        "matches": pairwise_inputs == indexed_inputs,
+    }
+
+    LOG.info("Psd graph: {}".format(dna_path))
+    LOG.info("    {psd_count} psds ({additional_combo_count} additional), {input_psd_count} input psds".format(
+        **results
+    ))
+    LOG.info("    pairwise: {:.3f}s".format(pairwise_time))
+    LOG.info("    indexed: {:.3f}s".format(indexed_time))
+
+    if indexed_time:
+        LOG.info("    ratio: {:.1f}x".format(pairwise_time / indexed_time))
+
+    if not results["matches"]:
+        LOG.warning("    input psds differ from pairwise comparison")
+
+    return results
+
+
+def benchmark_evaluator(dna_path, frame_count=1000, seed=0):
+    """Time evaluating joint outputs of random raw control values with mhEvaluator
+    """
+    reader = mhUtils.load_dna(dna_path, layer="behavior")
+
+    start = time.time()
+    evaluator = mhEvaluator.PoseEvaluator.from_reader(reader)
+    build_time = time.time() - start
+
+    raw_values = numpy.random.default_rng(seed).random(
+        (frame_count, evaluator.raw_control_count), dtype=numpy.float32
+    )
+
+    start = time.time()
+    evaluator.evaluate(raw_values)
+    evaluate_time = time.time() - start
+
+    results = {
+        "frame_count": frame_count,
+        "psd_count": evaluator.psd_count,
+        "attr_count": evaluator.attr_count,
+        "value_count": evaluator.value_count,
+        "build_time": build_time,
+        "evaluate_time": evaluate_time,
+        "frames_per_second": frame_count / evaluate_time if evaluate_time else 0.0,
+    }
+
+    LOG.info("Evaluator: {}".format(dna_path))
+    LOG.info("    {psd_count} psds, {attr_count} attrs, {value_count} joint group values".format(**results))
+    LOG.info("    built in {:.3f}s".format(build_time))
+    LOG.info("    {} frames in {:.3f}s ({:.0f} fps)".format(
+        frame_count, evaluate_time, results["frames_per_second"]
+    ))
+
+    return results
+
+
+def benchmark_lods(dna_path, frame_count=1000, seed=0):
+    """Compare cost of evaluating joint outputs at each lod with mhEvaluator
+
+    :return: list of cost stats dicts of each lod, with evaluation time per frame
+    """
+    reader = mhUtils.load_dna(dna_path, layer="behavior")
+    snapshot = mhReader.get_snapshot(reader)
+
+    raw_values = numpy.random.default_rng(seed).random(
+        (frame_count, snapshot.raw_control_count), dtype=numpy.float32
+    )
+
+    results = []
+
+    LOG.info("Lod cost: {}".format(dna_path))
+
+    for lod in range(snapshot.lod_count):
+        evaluator = mhEvaluator.PoseEvaluator.from_reader(reader, lod=lod)
+
+        start = time.time()
+        evaluator.evaluate(raw_values)
+        evaluate_time = time.time() - start
+
+        stats = evaluator.get_cost_stats()
+        stats["frame_time"] = evaluate_time / frame_count
+
+        results.append(stats)
+
+        LOG.info(
+            "    lod {lod}: {active_joint_count} joints, {active_attr_count} attrs, "
+            "{non_zero_count}/{value_count} non zero values, {frame_time_us:.1f}us per frame".format(
+                frame_time_us=stats["frame_time"] * 1e6, **stats
+            )
+        )
+
+    return results
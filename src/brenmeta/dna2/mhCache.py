@@ -0,0 +1,256 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Process wide cache of loaded DNA files
+
+Parsing a DNA file is slow, and several tabs may load the same file in one
+session. Loaded DNA objects are cached in an LRU keyed by absolute path,
+file size and mtime, so a file is only parsed again once it changes on disk.
+
+Files are only loaded with the layers requested so far, and reloaded with
+more layers when a later request needs them, eg. the poses tab only needs
+the behavior layer.
+
+Cached readers are shared and must not be modified. Anything that runs
+dnacalib commands should get its own copy with get_calib_reader:
+
+    reader = mhCache.get_reader(dna_path, layer="behavior")
+    dna_obj = mhCache.get_dna(dna_path)
+    snapshot = mhCache.get_snapshot(dna_path)
+
+    calib_reader = mhCache.get_calib_reader(dna_path)
+    mhUtils.scale_dna(calib_reader, 2.0)
+
+Entries are evicted least recently used first when the total file size of cached
+dna files is over the size budget. This is a budget on file size, not memory, which
+depends on the layers loaded: an entry counts its full file size whatever layers
+have been loaded so far.
+
+Readers are only ever loaded or upgraded from the version of a file they were
+first read from, if the file changes on disk before a layer is loaded MHError is
+raised, and the file should be got from the cache again.
+"""
+
+import collections
+import os
+import threading
+
+import dnacalib2
+
+from mh_assemble_lib.model.dnalib import DNAReader, Layer
+
+from brenmeta.core import mhCore
+from brenmeta.dna2 import mhReader
+
+LOG = mhCore.get_basic_logger(__name__)
+
+DEFAULT_SIZE_BUDGET = 512 * 1024 * 1024
+
+
+def get_key(path):
+    """Get (absolute path, size, mtime) key for a DNA file
+    """
+    return mhReader.get_file_key(path)
+
+
+class DnaCacheEntry(object):
+    def __init__(self, key):
+        self.key = key
+        self.lazy_reader = mhReader.LazyReader(key[0], layer=None, key=key)
+        self._dna_obj = None
+
+    @property
+    def path(self):
+        return self.key[0]
+
+    @property
+    def size(self):
+        return self.key[1]
+
+    @property
+    def dna_obj(self):
+        """DNAReader object with all layers loaded
+        """
+        if self._dna_obj is None:
+            self.lazy_reader.check_key()
+
+            LOG.info("Loading dna: {}".format(self.path))
+            self._dna_obj = DNAReader.read(self.path, Layer.all)
+            self.lazy_reader.set_reader(self._dna_obj._reader, "all")
+        return self._dna_obj
+
+    def get_reader(self, layer="all"):
+        if layer == "all" and not self.lazy_reader.covers("all"):
+            # load through DNAReader so the dna object and reader are shared
+            return self.dna_obj._reader
+        return self.lazy_reader.upgrade(layer)
+
+
+class DnaCache(object):
+    """LRU cache of loaded DNA objects
+    """
+
+    def __init__(self, size_budget=DEFAULT_SIZE_BUDGET):
+        self.size_budget = size_budget
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        try:
+            return get_key(path) in self._entries
+        except mhCore.MHError:
+            return False
+
+    @property
+    def total_size(self):
+        """Total file size of cached dna files
+        """
+        return sum(entry.size for entry in self._entries.values())
+
+    def set_size_budget(self, size_budget):
+        with self._lock:
+            self.size_budget = size_budget
+            self.evict()
+        return True
+
+    def get_entry(self, path):
+        """Get cache entry for path, loading the file if it is not cached or has changed on disk
+        """
+        key = get_key(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry
+
+            self.misses += 1
+
+            # discard any stale entries for this path
+            self.invalidate(key[0])
+
+            entry = DnaCacheEntry(key)
+
+            self._entries[key] = entry
+
+            self.evict(keep=key)
+
+        return entry
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until total file size is within budget
+        """
+        with self._lock:
+            while self._entries and self.total_size > self.size_budget:
+                key = next(iter(self._entries))
+
+                if key == keep:
+                    break
+
+                LOG.info("Evicting dna from cache: {}".format(key[0]))
+
+                del self._entries[key]
+
+        return True
+
+    def invalidate(self, path=None):
+        """Remove entries for path, or all entries if no path is given
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                path = os.path.abspath(path)
+
+                for key in [key for key in self._entries if key[0] == path]:
+                    del self._entries[key]
+
+        return True
+
+    def get_dna(self, path):
+        """Get shared DNAReader object, this must not be modified
+        """
+        return self.get_entry(path).dna_obj
+
+    def get_reader(self, path, layer="all"):
+        """Get shared dna reader with at least the given layer loaded, this must not be modified
+        """
+        entry = self.get_entry(path)
+
+        with self._lock:
+            return entry.get_reader(layer=layer)
+
+    def get_lazy_reader(self, path, layer="definition"):
+        """Get shared LazyReader, that loads more layers as they are needed
+        """
+        entry = self.get_entry(path)
+
+        with self._lock:
+            entry.lazy_reader.upgrade(layer)
+
+        return entry.lazy_reader
+
+    def get_snapshot(self, path):
+        return mhReader.get_snapshot(self.get_reader(path, layer="behavior"))
+
+    def get_calib_reader(self, path, layer="all"):
+        """Get a new DNACalibDNAReader copied from the cached reader, that is safe to modify
+        """
+        return dnacalib2.DNACalibDNAReader(self.get_reader(path, layer=layer))
+
+
+_CACHE = DnaCache()
+
+
+def get_cache():
+    return _CACHE
+
+
+def set_size_budget(size_budget):
+    return _CACHE.set_size_budget(size_budget)
+
+
+def clear():
+    return _CACHE.invalidate()
+
+
+def get_dna(path):
+    return _CACHE.get_dna(path)
+
+
+def get_reader(path, layer="all"):
+    return _CACHE.get_reader(path, layer=layer)
+
+
+def get_lazy_reader(path, layer="definition"):
+    return _CACHE.get_lazy_reader(path, layer=layer)
+
+
+def get_snapshot(path):
+    return _CACHE.get_snapshot(path)
+
+
+def get_calib_reader(path, layer="all"):
+    return _CACHE.get_calib_reader(path, layer=layer)
@@ -0,0 +1,336 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Vertex correspondence between meshes with different topology
+
+Maps each dst vertex to either the nearest src vertex, or the closest point
+on the nearest src triangle as barycentric weights, so src positions can be
+transferred onto dst meshes that don't share vertex order:
+
+    correspondence = mhCorrespondence.get_correspondence(
+        src_positions, src_triangles, dst_positions, dst_triangles, mode="barycentric"
+    )
+
+    dst_positions = correspondence.apply(src_positions)
+
+Correspondences are cached per (src topology, dst topology) pair, so merging
+other heads of the same asset generations reuses the same mapping. Topology hashes
+can be given instead of triangles, eg. of the vertex layout of dna meshes, and
+src triangles as a function, so faces are only triangulated when a barycentric
+correspondence is not yet cached:
+
+    correspondence = mhCorrespondence.get_correspondence(
+        src_positions, lambda: get_triangles(src_mesh), dst_positions, None, mode="nearest",
+        src_topology_hash=src_hash, dst_topology_hash=dst_hash,
+    )
+
+Uses scipy's cKDTree if available, otherwise a chunked numpy search.
+"""
+
+import hashlib
+
+import numpy
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from brenmeta.core import mhCore
+
+LOG = mhCore.get_basic_logger(__name__)
+
+MODES = ["nearest", "barycentric"]
+
+# number of nearest src vertices whose triangles are tested for barycentric correspondence
+CANDIDATE_VERTEX_COUNT = 4
+
+_CORRESPONDENCES = {}
+
+
+def find_nearest(src_points, dst_points, k=1, chunk_size=256):
+    """Get (N, k) indices of and distances to the nearest src points of each dst point
+    """
+    src_points = numpy.asarray(src_points, dtype=numpy.float64)
+    dst_points = numpy.asarray(dst_points, dtype=numpy.float64)
+
+    k = min(k, len(src_points))
+
+    if cKDTree is not None:
+        distances, indices = cKDTree(src_points).query(dst_points, k=k)
+        return indices.reshape(-1, k), distances.reshape(-1, k)
+
+    # brute force in chunks to limit memory
+    indices = numpy.zeros((len(dst_points), k), dtype=numpy.intp)
+    distances = numpy.zeros((len(dst_points), k), dtype=numpy.float64)
+
+    src_squared = numpy.einsum("ij,ij->i", src_points, src_points)
+
+    for start in range(0, len(dst_points), chunk_size):
+        chunk = dst_points[start:start + chunk_size]
+
+        # |a - b|^2 = |a|^2 - 2ab + |b|^2
+        squared = numpy.einsum("ij,ij->i", chunk, chunk)[:, None] - 2.0 * chunk.dot(src_points.T) + src_squared
+
+        if k == 1:
+            chunk_indices = numpy.argmin(squared, axis=1)[:, None]
+        else:
+            chunk_indices = numpy.argpartition(squared, k - 1, axis=1)[:, :k]
+
+        chunk_squared = numpy.take_along_axis(squared, chunk_indices, axis=1)
+
+        order = numpy.argsort(chunk_squared, axis=1)
+
+        indices[start:start + chunk_size] = numpy.take_along_axis(chunk_indices, order, axis=1)
+        distances[start:start + chunk_size] = numpy.sqrt(
+            numpy.maximum(numpy.take_along_axis(chunk_squared, order, axis=1), 0.0)
+        )
+
+    return indices, distances
+
+
+def get_closest_points_on_triangles(points, a, b, c):
+    """Get (N, 3) barycentric weights of the closest point on each triangle abc to each point
+
+    All arguments are (N, 3) arrays, see Ericson, Real-Time Collision Detection 5.1.5
+    """
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+
+    d1 = numpy.einsum("ij,ij->i", ab, ap)
+    d2 = numpy.einsum("ij,ij->i", ac, ap)
+    d3 = numpy.einsum("ij,ij->i", ab, bp)
+    d4 = numpy.einsum("ij,ij->i", ac, bp)
+    d5 = numpy.einsum("ij,ij->i", ab, cp)
+    d6 = numpy.einsum("ij,ij->i", ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        # face region
+        denom = va + vb + vc
+        v = vb / denom
+        w = vc / denom
+        weights = numpy.column_stack([1.0 - v - w, v, w])
+
+        # edge regions
+        bc_w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        ab_v = d1 / (d1 - d3)
+        ac_w = d2 / (d2 - d6)
+
+    regions = [
+        # vertex regions
+        ((d1 <= 0) & (d2 <= 0), [1.0, 0.0, 0.0]),
+        ((d3 >= 0) & (d4 <= d3), [0.0, 1.0, 0.0]),
+        ((d6 >= 0) & (d5 <= d6), [0.0, 0.0, 1.0]),
+    ]
+
+    edge_regions = [
+        ((vc <= 0) & (d1 >= 0) & (d3 <= 0), numpy.column_stack([1.0 - ab_v, ab_v, numpy.zeros_like(ab_v)])),
+        ((vb <= 0) & (d2 >= 0) & (d6 <= 0), numpy.column_stack([1.0 - ac_w, numpy.zeros_like(ac_w), ac_w])),
+        ((va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0), numpy.column_stack([numpy.zeros_like(bc_w), 1.0 - bc_w, bc_w])),
+    ]
+
+    # apply in reverse priority so vertex regions take precedence
+    for mask, edge_weights in reversed(edge_regions):
+        weights[mask] = edge_weights[mask]
+
+    for mask, vertex_weights in reversed(regions):
+        weights[mask] = vertex_weights
+
+    # degenerate triangles
+    invalid = ~numpy.isfinite(weights).all(axis=1)
+    weights[invalid] = [1.0, 0.0, 0.0]
+
+    return weights
+
+
+class VertexCorrespondence(object):
+    """Each dst vertex as weighted src vertices
+    """
+
+    def __init__(self, mode, src_indices, weights, distances):
+        self.mode = mode
+        self.src_indices = src_indices
+        self.weights = weights
+        self.distances = distances
+
+    def __len__(self):
+        return len(self.src_indices)
+
+    def apply(self, src_positions):
+        """Get (N, 3) dst positions from src positions
+        """
+        src_positions = numpy.asarray(src_positions)
+        return numpy.einsum("ij,ijk->ik", self.weights, src_positions[self.src_indices]).astype(src_positions.dtype)
+
+
+def get_nearest_correspondence(src_positions, dst_positions):
+    indices, distances = find_nearest(src_positions, dst_positions)
+
+    src_indices = numpy.repeat(indices, 3, axis=1)
+    weights = numpy.zeros(src_indices.shape, dtype=numpy.float32)
+    weights[:, 0] = 1.0
+
+    return VertexCorrespondence("nearest", src_indices, weights, distances[:, 0])
+
+
+def get_barycentric_correspondence(src_positions, src_triangles, dst_positions):
+    """Map each dst vertex to the closest point on the triangles around its nearest src vertices
+    """
+    src_positions = numpy.asarray(src_positions, dtype=numpy.float64)
+    dst_positions = numpy.asarray(dst_positions, dtype=numpy.float64)
+    src_triangles = numpy.asarray(src_triangles, dtype=numpy.intp).reshape(-1, 3)
+
+    # triangles around each src vertex, as csr arrays
+    vertex_ids = src_triangles.ravel()
+    triangle_ids = numpy.repeat(numpy.arange(len(src_triangles)), 3)
+
+    order = numpy.argsort(vertex_ids, kind="stable")
+    vertex_triangles = triangle_ids[order]
+    offsets = numpy.zeros(len(src_positions) + 1, dtype=numpy.intp)
+    numpy.cumsum(numpy.bincount(vertex_ids, minlength=len(src_positions)), out=offsets[1:])
+
+    nearest_indices, _ = find_nearest(src_positions, dst_positions, k=CANDIDATE_VERTEX_COUNT)
+
+    # candidate (dst vertex, triangle) pairs
+    counts = offsets[nearest_indices + 1] - offsets[nearest_indices]
+    dst_ids = numpy.repeat(numpy.arange(len(dst_positions)), counts.sum(axis=1))
+
+    starts = numpy.repeat(offsets[nearest_indices].ravel(), counts.ravel())
+    local = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts.ravel()) - counts.ravel(), counts.ravel())
+    candidate_triangles = vertex_triangles[starts + local]
+
+    corners = src_triangles[candidate_triangles]
+
+    weights = get_closest_points_on_triangles(
+        dst_positions[dst_ids],
+        src_positions[corners[:, 0]],
+        src_positions[corners[:, 1]],
+        src_positions[corners[:, 2]],
+    )
+
+    closest = numpy.einsum("ij,ijk->ik", weights, src_positions[corners])
+    distances = numpy.linalg.norm(closest - dst_positions[dst_ids], axis=1)
+
+    # pick closest candidate for each dst vertex
+    order = numpy.lexsort((distances, dst_ids))
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = dst_ids[order][1:] != dst_ids[order][:-1]
+    best = order[first]
+
+    src_indices = numpy.zeros((len(dst_positions), 3), dtype=numpy.intp)
+    best_weights = numpy.zeros((len(dst_positions), 3), dtype=numpy.float32)
+    best_distances = numpy.full(len(dst_positions), numpy.inf)
+
+    src_indices[dst_ids[best]] = corners[best]
+    best_weights[dst_ids[best]] = weights[best]
+    best_distances[dst_ids[best]] = distances[best]
+
+    # vertices with no triangles fall back on nearest vertex
+    missing = ~numpy.isfinite(best_distances)
+
+    if missing.any():
+        nearest = get_nearest_correspondence(src_positions, dst_positions[missing])
+        src_indices[missing] = nearest.src_indices
+        best_weights[missing] = nearest.weights
+        best_distances[missing] = nearest.distances
+
+    return VertexCorrespondence("barycentric", src_indices, best_weights, best_distances)
+
+
+def get_topology_hash(vertex_count, *arrays):
+    """Get hash of vertex count and any given index arrays, eg. triangles
+    """
+    topology_hash = hashlib.sha1(str(vertex_count).encode())
+
+    for array in arrays:
+        if array is not None:
+            topology_hash.update(numpy.ascontiguousarray(array, dtype=numpy.int64).data)
+
+    return topology_hash.hexdigest()
+
+
+def get_triangles(triangles):
+    """Get triangles array, from a function returning it if given one
+    """
+    if callable(triangles):
+        return triangles()
+    return triangles
+
+
+def get_correspondence(
+        src_positions, src_triangles, dst_positions, dst_triangles, mode="nearest", cache=True,
+        src_topology_hash=None, dst_topology_hash=None,
+):
+    """Get cached VertexCorrespondence from src mesh to dst mesh
+
+    The correspondence is computed from the positions given the first time
+    a (src topology, dst topology) pair is seen, and reused after that.
+
+    Meshes are keyed by topology hash if given, otherwise by a hash of their triangles.
+    Triangles can be given as a function returning them, to only get them when needed.
+    """
+    if mode not in MODES:
+        raise mhCore.MHError("Unrecognised correspondence mode: {}, expected one of: {}".format(mode, MODES))
+
+    if src_topology_hash is None:
+        src_triangles = get_triangles(src_triangles)
+        src_topology_hash = get_topology_hash(len(src_positions), src_triangles)
+
+    if dst_topology_hash is None:
+        dst_topology_hash = get_topology_hash(len(dst_positions), get_triangles(dst_triangles))
+
+    key = (mode, src_topology_hash, dst_topology_hash)
+
+    if cache and key in _CORRESPONDENCES:
+        return _CORRESPONDENCES[key]
+
+    if mode == "nearest":
+        correspondence = get_nearest_correspondence(src_positions, dst_positions)
+    else:
+        src_triangles = get_triangles(src_triangles)
+
+        if src_triangles is None:
+            raise mhCore.MHError("Src triangles are needed for barycentric correspondence")
+
+        correspondence = get_barycentric_correspondence(src_positions, src_triangles, dst_positions)
+
+    LOG.info("{} correspondence: {} -> {} vertices, max distance {:.5f}".format(
+        mode, len(src_positions), len(dst_positions), float(numpy.max(correspondence.distances, initial=0.0))
+    ))
+
+    if cache:
+        _CORRESPONDENCES[key] = correspondence
+
+    return correspondence
+
+
+def is_cached(mode, src_topology_hash, dst_topology_hash):
+    """Check if a correspondence between topologies has been computed, eg. to avoid reading triangles
+    """
+    return (mode, src_topology_hash, dst_topology_hash) in _CORRESPONDENCES
+
+
+def clear_cache():
+    _CORRESPONDENCES.clear()
+    return True
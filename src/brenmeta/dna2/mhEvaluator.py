@@ -0,0 +1,297 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Evaluate joint outputs from raw control values without a scene
+
+Mirrors the joint behavior of RigLogic for whole animations at once:
+
+    raw controls -> psd activations -> joint columns -> joint groups -> joint attr deltas
+
+Raw control values for every frame are given as a (frames, raw controls) array,
+psds are evaluated as the product of their inputs, then each joint group block
+is applied to all frames as one matrix product:
+
+    evaluator = mhEvaluator.PoseEvaluator.from_reader(reader)
+    values = evaluator.evaluate(raw_values, absolute=True)
+
+To evaluate edited poses instead of the dna values use from_pose_matrix:
+
+    evaluator = mhEvaluator.PoseEvaluator.from_pose_matrix(
+        pose_matrix, snapshot.psd_matrix, snapshot.raw_control_count, lod=2, snapshot=snapshot
+    )
+
+Like the runtime, evaluators can be limited to the joint group rows active at a lod,
+and get_cost_stats gives the amount of work each lod needs:
+
+    evaluator = mhEvaluator.PoseEvaluator.from_reader(reader, lod=2)
+
+Note psd input weights are not used by default, see PSDPose.get_values.
+"""
+
+import numpy
+
+from brenmeta.core import mhCore
+from brenmeta.dna2 import mhBehaviour
+from brenmeta.dna2 import mhReader
+
+LOG = mhCore.get_basic_logger(__name__)
+
+
+class PoseEvaluator(object):
+    """Joint group blocks and psd table of a dna, evaluated with numpy
+
+    groups: list of (output attr indices, input column indices, (outputs, inputs) values) of each joint group
+    """
+
+    def __init__(self, raw_control_count, column_count, attrs, defaults, psd_matrix, groups, lod=None):
+        self.lod = lod
+        self.raw_control_count = raw_control_count
+        self.column_count = column_count
+        self.attrs = list(attrs)
+        self.defaults = numpy.asarray(defaults, dtype=numpy.float32)
+        self.psd_matrix = psd_matrix
+        self.groups = groups
+
+        # psds with other psds as inputs need more than one pass
+        self.psd_passes = 1
+
+        if len(psd_matrix.pose_indices) and psd_matrix.pose_indices.max() >= raw_control_count:
+            self.psd_passes = len(psd_matrix)
+
+    def __repr__(self):
+        return "{}({} raw controls, {} psds, {} attrs, {} joint groups)".format(
+            self.__class__.__name__, self.raw_control_count, len(self.psd_matrix), self.attr_count, len(self.groups)
+        )
+
+    @property
+    def attr_count(self):
+        return len(self.attrs)
+
+    @property
+    def psd_count(self):
+        return len(self.psd_matrix)
+
+    @property
+    def value_count(self):
+        """Total number of values in all joint group blocks
+        """
+        return sum([values.size for _, _, values in self.groups])
+
+    @property
+    def output_indices(self):
+        """Sorted array of joint attrs driven by any joint group
+        """
+        if not self.groups:
+            return numpy.zeros(0, dtype=numpy.intp)
+        return numpy.unique(numpy.concatenate([output_indices for output_indices, _, _ in self.groups]))
+
+    def get_cost_stats(self):
+        """Get dict of the amount of work done per frame
+        """
+        output_indices = self.output_indices
+
+        return {
+            "lod": self.lod,
+            "joint_group_count": len(self.groups),
+            "active_joint_count": int(numpy.unique(output_indices // len(mhReader.JOINT_ATTRS)).size),
+            "active_attr_count": int(output_indices.size),
+            "value_count": self.value_count,
+            "non_zero_count": sum([int(numpy.count_nonzero(values)) for _, _, values in self.groups]),
+            "psd_count": self.psd_count,
+        }
+
+    @classmethod
+    def from_reader(cls, reader, lod=None):
+        """Create evaluator from the joint group values and psd table of a dna reader
+
+        If lod is given only the joint group rows active at that lod are evaluated.
+        """
+        snapshot = mhReader.get_snapshot(reader)
+
+        attrs = mhBehaviour.get_joint_attrs(reader)
+        joints_attr_defaults = mhBehaviour.get_joint_defaults(reader)
+
+        groups = []
+
+        for group_index, (output_indices, input_indices) in enumerate(snapshot.joint_group_indices):
+            if not input_indices.size or not output_indices.size:
+                continue
+
+            values = numpy.array(reader.getJointGroupValues(group_index), dtype=numpy.float32)
+            values = values.reshape(output_indices.size, input_indices.size)
+
+            if lod is not None:
+                row_count = snapshot.get_joint_group_row_count(group_index, lod=lod)
+
+                if not row_count:
+                    continue
+
+                output_indices = output_indices[:row_count]
+                values = values[:row_count]
+
+            # ignore any inputs out of range, as get_pose_matrix does
+            valid = input_indices < snapshot.joint_column_count
+
+            groups.append((output_indices, input_indices[valid], numpy.ascontiguousarray(values[:, valid])))
+
+        return cls(
+            snapshot.raw_control_count,
+            snapshot.joint_column_count,
+            attrs,
+            [joints_attr_defaults.get(attr, 0.0) for attr in attrs],
+            snapshot.psd_matrix,
+            groups,
+            lod=lod,
+        )
+
+    @classmethod
+    def from_pose_matrix(cls, pose_matrix, psd_matrix, raw_control_count, group_indices=None, lod=None, snapshot=None):
+        """Create evaluator from a PoseMatrix, eg. of edited poses
+
+        Joint group blocks are gathered from the sparse poses of the matrix using group_indices if given,
+        or the group indices of the matrix, otherwise all driven values are evaluated as one block.
+
+        If lod is given group indices are taken from the DnaSnapshot of the dna instead,
+        with outputs sliced to the rows active at that lod, see DnaSnapshot.get_joint_group_indices.
+        """
+        if lod is not None:
+            if snapshot is None:
+                raise mhCore.MHError("A DnaSnapshot is needed to evaluate lod: {}".format(lod))
+
+            group_indices = snapshot.get_joint_group_indices(lod=lod)
+
+        if group_indices is None:
+            group_indices = pose_matrix.group_indices
+
+        if group_indices is None:
+            input_indices = [i for i, pose in enumerate(pose_matrix.poses) if len(pose.attr_indices)]
+
+            if input_indices:
+                group_indices = [(
+                    numpy.unique(numpy.concatenate([pose_matrix.poses[i].attr_indices for i in input_indices])),
+                    numpy.array(input_indices, dtype=numpy.intp),
+                )]
+            else:
+                group_indices = []
+
+        groups = []
+
+        for output_indices, input_indices in group_indices:
+            input_indices = input_indices[input_indices < pose_matrix.column_count]
+
+            if not input_indices.size or not output_indices.size:
+                continue
+
+            block, _ = pose_matrix.get_block(input_indices, output_indices)
+
+            groups.append((output_indices, input_indices, numpy.ascontiguousarray(block.T)))
+
+        return cls(
+            raw_control_count,
+            pose_matrix.column_count,
+            pose_matrix.attrs,
+            pose_matrix.defaults,
+            psd_matrix,
+            groups,
+            lod=lod,
+        )
+
+    def get_psd_values(self, column_values, use_weights=False):
+        """Get (frames, psds) activations from (frames, columns) values, in psd_matrix order
+
+        Each psd is the product of its inputs clamped between 0 and 1.
+        """
+        if not self.psd_count:
+            return numpy.zeros((len(column_values), 0), dtype=numpy.float32)
+
+        inputs = column_values[:, self.psd_matrix.pose_indices]
+
+        if use_weights:
+            inputs = inputs * self.psd_matrix.weights
+
+        psd_values = numpy.multiply.reduceat(inputs, self.psd_matrix.indptr[:-1], axis=1)
+
+        return numpy.clip(psd_values, 0.0, 1.0)
+
+    def get_column_values(self, raw_values, clamp=True, use_weights=False):
+        """Get (frames, joint columns) values from (frames, raw controls) values
+
+        Raw control values are clamped between 0 and 1 if clamp is True.
+        """
+        raw_values = numpy.atleast_2d(numpy.asarray(raw_values, dtype=numpy.float32))
+
+        if raw_values.shape[1] != self.raw_control_count:
+            raise mhCore.MHError("Expected {} raw control values per frame, got {}".format(
+                self.raw_control_count, raw_values.shape[1]
+            ))
+
+        column_values = numpy.zeros((len(raw_values), self.column_count), dtype=numpy.float32)
+        column_values[:, :self.raw_control_count] = raw_values
+
+        if clamp:
+            numpy.clip(column_values, 0.0, 1.0, out=column_values)
+
+        psd_indices = self.psd_matrix.psd_indices
+        valid = psd_indices < self.column_count
+
+        for _ in range(self.psd_passes):
+            psd_values = self.get_psd_values(column_values, use_weights=use_weights)
+
+            if numpy.array_equal(column_values[:, psd_indices[valid]], psd_values[:, valid]):
+                break
+
+            column_values[:, psd_indices[valid]] = psd_values[:, valid]
+
+        return column_values
+
+    def evaluate_columns(self, column_values, absolute=False):
+        """Get (frames, attrs) joint attr values from (frames, joint columns) values
+        """
+        column_values = numpy.atleast_2d(numpy.asarray(column_values, dtype=numpy.float32))
+
+        outputs = numpy.zeros((len(column_values), self.attr_count), dtype=numpy.float32)
+
+        for output_indices, input_indices, values in self.groups:
+            # (frames, inputs) x (inputs, outputs)
+            outputs[:, output_indices] += column_values[:, input_indices].dot(values.T)
+
+        if absolute:
+            outputs += self.defaults
+
+        return outputs
+
+    def evaluate(self, raw_values, absolute=False, clamp=True, use_weights=False):
+        """Get (frames, attrs) joint attr deltas, or values if absolute, from (frames, raw controls) values
+        """
+        column_values = self.get_column_values(raw_values, clamp=clamp, use_weights=use_weights)
+        return self.evaluate_columns(column_values, absolute=absolute)
+
+    def get_frame_values(self, outputs, frame=0, threshold=1e-6):
+        """Get dict of joint attr values of a frame of evaluate outputs, skipping values within threshold of 0
+        """
+        frame_values = outputs[frame]
+        indices = numpy.flatnonzero(numpy.abs(frame_values) > threshold)
+
+        return dict(zip([self.attrs[i] for i in indices.tolist()], frame_values[indices].tolist()))
+
+
+def get_pose_raw_values(evaluator, pose_indices):
+    """Get (len(pose_indices), raw controls) values with each raw control pose fully on in turn
+    """
+    raw_values = numpy.zeros((len(pose_indices), evaluator.raw_control_count), dtype=numpy.float32)
+    raw_values[numpy.arange(len(pose_indices)), pose_indices] = 1.0
+    return raw_values
@@ -0,0 +1,313 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""On disk cache of dna geometry
+
+Vertex positions and blendshape deltas are written to .npy files the first
+time they are read from a dna, then memory mapped on later reads instead of
+reading them from the dna again.
+
+Caches are keyed by a hash of the dna file contents, so any change to the
+file gives a new cache. Files are stored in the user cache directory by default,
+eg. ~/.cache/brenmeta/dnacache on linux:
+
+    dnacache/
+        <content hash>/
+            manifest.json
+            positions_0.npy
+            blendshape_deltas_0.npy
+            ...
+
+Use set_cache_root to store them somewhere else, or set_use_sidecar to store them
+in a .dnacache directory next to each dna file, where dna files are not in read only
+or shared directories.
+
+Only use the cache for readers that are unmodified since loading from the
+dna file, eg. not after running dnacalib commands on them.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+import numpy
+
+from brenmeta.core import mhCore
+
+LOG = mhCore.get_basic_logger(__name__)
+
+VERSION = 1
+
+CACHE_DIR_NAME = ".dnacache"
+
+MANIFEST_NAME = "manifest.json"
+
+BLENDSHAPE_ARRAYS = ["deltas", "vertex_indices", "offsets", "channel_indices"]
+
+USER_CACHE_DIR_NAME = os.path.join("brenmeta", "dnacache")
+
+# root directory for all caches, if None the user cache directory is used
+_CACHE_ROOT = None
+
+# store caches next to each dna file instead
+_USE_SIDECAR = False
+
+# file hashes keyed by (path, size, mtime)
+_FILE_HASHES = {}
+
+_LOCK = threading.RLock()
+
+
+def set_cache_root(path):
+    """Store all geometry caches in given directory instead of the user cache directory, or None to reset
+    """
+    global _CACHE_ROOT
+    _CACHE_ROOT = path
+    return True
+
+
+def set_use_sidecar(use_sidecar):
+    """Store geometry caches in a directory next to each dna file, instead of the cache root
+    """
+    global _USE_SIDECAR
+    _USE_SIDECAR = use_sidecar
+    return True
+
+
+def get_user_cache_dir():
+    """Get platform cache directory of the current user
+    """
+    if sys.platform == "win32":
+        return os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+
+    if sys.platform == "darwin":
+        return os.path.expanduser(os.path.join("~", "Library", "Caches"))
+
+    return os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache"))
+
+
+def get_file_hash(path, chunk_size=1024 * 1024):
+    """Get sha1 hash of file contents, hashes are remembered until the file size or mtime changes
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    with _LOCK:
+        if key in _FILE_HASHES:
+            return _FILE_HASHES[key]
+
+    file_hash = hashlib.sha1()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+
+    file_hash = file_hash.hexdigest()
+
+    with _LOCK:
+        _FILE_HASHES[key] = file_hash
+
+    return file_hash
+
+
+def get_cache_root(dna_path):
+    if _USE_SIDECAR:
+        return os.path.join(os.path.dirname(os.path.abspath(dna_path)), CACHE_DIR_NAME)
+
+    if _CACHE_ROOT is not None:
+        return _CACHE_ROOT
+
+    return os.path.join(get_user_cache_dir(), USER_CACHE_DIR_NAME)
+
+
+class GeometryCache(object):
+    """Vertex positions and blendshape deltas of a dna file, stored as .npy files
+    """
+
+    def __init__(self, dna_path):
+        self.dna_path = os.path.abspath(dna_path)
+        self.dna_hash = get_file_hash(self.dna_path)
+        self.directory = os.path.join(get_cache_root(self.dna_path), self.dna_hash)
+
+        self._manifest = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = self.read_manifest()
+        return self._manifest
+
+    def read_manifest(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r") as f:
+                    manifest = json.load(f)
+
+                if manifest.get("version") == VERSION and manifest.get("dna_hash") == self.dna_hash:
+                    return manifest
+
+                LOG.warning("Ignoring out of date geometry cache: {}".format(self.directory))
+
+            except ValueError:
+                LOG.warning("Ignoring invalid geometry cache manifest: {}".format(self.manifest_path))
+
+        return {
+            "version": VERSION,
+            "dna_hash": self.dna_hash,
+            "dna_path": self.dna_path,
+            "positions": {},
+            "blendshapes": {},
+        }
+
+    def write_manifest(self):
+        temp_path = self.manifest_path + ".tmp"
+
+        with open(temp_path, "w") as f:
+            json.dump(self.manifest, f, indent=4)
+
+        os.replace(temp_path, self.manifest_path)
+
+        return True
+
+    def _load(self, file_name):
+        return numpy.load(os.path.join(self.directory, file_name), mmap_mode="c")
+
+    def _save(self, file_name, array):
+        path = os.path.join(self.directory, file_name)
+        temp_path = path + ".tmp.npy"
+
+        numpy.save(temp_path, numpy.ascontiguousarray(array))
+        os.replace(temp_path, path)
+
+        return file_name
+
+    def _prepare(self):
+        """Create cache directory, removing caches of previous versions of this dna file
+        """
+        if not os.path.exists(self.directory):
+            remove_stale_caches(self.dna_path, keep=self.dna_hash)
+            os.makedirs(self.directory)
+
+        return True
+
+    def load_positions(self, mesh_index):
+        """Get memory mapped (N, 3) vertex positions of mesh, or None if not cached
+        """
+        file_name = self.manifest["positions"].get(str(mesh_index))
+
+        if file_name is None:
+            return None
+
+        try:
+            return self._load(file_name)
+        except (IOError, ValueError) as err:
+            LOG.warning("Failed to load cached positions: {}".format(err))
+            return None
+
+    def save_positions(self, mesh_index, positions):
+        """Save (N, 3) vertex positions of mesh, failing to write the cache is not an error
+        """
+        with _LOCK:
+            try:
+                self._prepare()
+                file_name = self._save("positions_{}.npy".format(mesh_index), positions)
+                self.manifest["positions"][str(mesh_index)] = file_name
+                self.write_manifest()
+            except (IOError, OSError) as err:
+                LOG.warning("Failed to write geometry cache: {}".format(err))
+                return False
+
+        return True
+
+    def load_blendshape_arrays(self, mesh_index):
+        """Get dict of memory mapped blendshape arrays of mesh, or None if not cached
+        """
+        file_names = self.manifest["blendshapes"].get(str(mesh_index))
+
+        if file_names is None:
+            return None
+
+        try:
+            return {name: self._load(file_name) for name, file_name in file_names.items()}
+        except (IOError, ValueError) as err:
+            LOG.warning("Failed to load cached blendshapes: {}".format(err))
+            return None
+
+    def save_blendshape_arrays(self, mesh_index, arrays):
+        """Save dict of blendshape arrays of mesh, failing to write the cache is not an error
+        """
+        with _LOCK:
+            try:
+                self._prepare()
+
+                file_names = {
+                    name: self._save("blendshape_{}_{}.npy".format(name, mesh_index), arrays[name])
+                    for name in BLENDSHAPE_ARRAYS
+                }
+
+                self.manifest["blendshapes"][str(mesh_index)] = file_names
+                self.write_manifest()
+
+            except (IOError, OSError) as err:
+                LOG.warning("Failed to write geometry cache: {}".format(err))
+                return False
+
+        return True
+
+
+def remove_stale_caches(dna_path, keep=None):
+    """Remove caches of previous versions of dna file
+    """
+    dna_path = os.path.abspath(dna_path)
+    cache_root = get_cache_root(dna_path)
+
+    if not os.path.exists(cache_root):
+        return True
+
+    for dna_hash in os.listdir(cache_root):
+        if dna_hash == keep:
+            continue
+
+        manifest_path = os.path.join(cache_root, dna_hash, MANIFEST_NAME)
+
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            continue
+
+        if manifest.get("dna_path") == dna_path:
+            LOG.info("Removing stale geometry cache: {}".format(dna_hash))
+            shutil.rmtree(os.path.join(cache_root, dna_hash), ignore_errors=True)
+
+    return True
+
+
+def get_geometry_cache(dna_path):
+    """Get GeometryCache for dna path, or None if dna_path is None
+    """
+    if dna_path is None:
+        return None
+    return GeometryCache(dna_path)
@@ -37,8 +37,6 @@ import dna
 import dnacalib2
 import mh_character_assembler
 
-from mh_assemble_lib.model.dnalib import DNAReader, Layer
-
 from brenmeta.core import mhCore
 from brenmeta.core import mhWidgets
 from brenmeta.dna2 import mhSrc
@@ -47,11 +45,15 @@ from brenmeta.dna2 import mhBehaviour
 # from brenmeta.dna1 import mhUeUtils
 from brenmeta.dna2 import mhMesh
 from brenmeta.dna2 import mhJoints
+from brenmeta.dna2 import mhReader
+from brenmeta.dna2 import mhCache
+from brenmeta.dna2 import mhPoseEdits
 from brenmeta.mh import mhFaceMaterials
 from brenmeta.mh import mhFaceJoints
 from brenmeta.mh import mhFaceMeshes
 from brenmeta.maya import mhAnimUtils
 from brenmeta.maya import mhMayaUtils
+from brenmeta.maya import mhPlugs
 from brenmeta.maya import mhShapeBake
 from brenmeta.maya import mhBlendshape
 
@@ -284,9 +286,9 @@ class DnaTransferWidget(DnaTab):
         if confirm is QtWidgets.QMessageBox.Cancel:
             return False
 
-        dna_obj = DNAReader.read(input_dna_path, Layer.all)
-
-        calib_reader = dnacalib2.DNACalibDNAReader(dna_obj._reader)
+        # get our own copy of the cached reader to modify
+        dna_obj = mhCache.get_dna(input_dna_path)
+        calib_reader = mhCache.get_calib_reader(input_dna_path)
 
         if scale_value != 1.0:
             mhUtils.scale_dna(calib_reader, scale_value)
@@ -297,11 +299,14 @@ class DnaTransferWidget(DnaTab):
         if self.update_joint_list_checkbox.isChecked():
             mhJoints.update_joint_list(calib_reader, verbose=True)
 
+        # only recalculate lods of meshes that have changed
+        updated_mesh_indices = None
+
         if self.update_mesh_checkbox.isChecked():
-            mhMesh.update_meshes_from_scene(dna_obj, calib_reader)
+            updated_mesh_indices = mhMesh.update_meshes_from_scene(dna_obj, calib_reader)
 
         if self.calculate_lods_checkbox.isChecked():
-            mhMesh.calculate_lods(dna_obj, calib_reader)
+            mhMesh.calculate_lods(dna_obj, calib_reader, mesh_indices=updated_mesh_indices)
 
         mhUtils.save_dna(
             calib_reader,
@@ -355,21 +360,25 @@ class DnaInspectWidget(QtWidgets.QMainWindow):
 
         self.setWindowTitle(filename)
 
-        dna_obj = dna_viewer.DNA(dna_path)
-        calib_reader = dnacalib2.DNACalibDNAReader(dna_obj.reader)
+        # shared cached reader, read only
+        dna_obj = mhCache.get_dna(dna_path)
+        reader = mhCache.get_reader(dna_path)
+
+        # get all names and indices in one go
+        snapshot = mhReader.get_snapshot(reader)
 
         # mesh text
         mesh_fmt = "    {mesh_name}: {point_count} points, {blendshape_count} blendshape targets\n"
 
         mesh_txt = ""
 
-        mesh_indices = mhMesh.get_mesh_indices(dna_obj, calib_reader, lod=lod)
+        mesh_indices = mhMesh.get_mesh_indices(dna_obj, reader, lod=lod)
 
         for mesh_index in mesh_indices:
             mesh_txt += mesh_fmt.format(
-                mesh_name=dna_obj.meshes.names[mesh_index],
-                point_count=calib_reader.getVertexPositionCount(mesh_index),
-                blendshape_count=calib_reader.getBlendShapeTargetCount(mesh_index)
+                mesh_name=snapshot.mesh_names[mesh_index],
+                point_count=reader.getVertexPositionCount(mesh_index),
+                blendshape_count=reader.getBlendShapeTargetCount(mesh_index)
             )
 
         mesh_txt = "Meshes:\n\n{}".format(mesh_txt)
@@ -383,18 +392,13 @@ Joint count: {joint_count}
 Mesh count: {mesh_count}
         """.format(
             path=dna_path,
-            joint_count=calib_reader.getJointCount(),
-            mesh_count=calib_reader.getMeshCount(),
+            joint_count=snapshot.joint_count,
+            mesh_count=snapshot.mesh_count,
         )
 
         # blendshape text
-        blendshape_channel_names = [
-            calib_reader.getBlendShapeChannelName(i)
-            for i in range(calib_reader.getBlendShapeChannelCount())
-        ]
-
         blendshape_channel_text = [
-            "{}: {}".format(i, name) for i, name in enumerate(blendshape_channel_names)
+            "{}: {}".format(i, name) for i, name in enumerate(snapshot.blendshape_channel_names)
         ]
 
         blendshape_channel_text = "\n".join(blendshape_channel_text)
@@ -402,20 +406,14 @@ Mesh count: {mesh_count}
 
         # raw controls text
         raw_controls_names = [
-            "{}: {}".format(i, calib_reader.getRawControlName(i))
-            for i in range(calib_reader.getRawControlCount())
+            "{}: {}".format(i, name) for i, name in enumerate(snapshot.raw_control_names)
         ]
 
         raw_controls_text = "\n".join(raw_controls_names)
         raw_controls_text = "Raw Controls:\n\n{}".format(raw_controls_text)
 
         # joint column to blendshape channels
-        blendshape_channel_inputs = calib_reader.getBlendShapeChannelInputIndices()
-
-        columns_to_blendshapes = [""] * calib_reader.getJointColumnCount()
-
-        for blendshape_channel_name, joint_column in zip(blendshape_channel_names, blendshape_channel_inputs):
-            columns_to_blendshapes[joint_column] = blendshape_channel_name
+        columns_to_blendshapes = [name or "" for name in snapshot.columns_to_blendshape_channels]
 
         columns_to_blendshapes_text = ["{}: {}".format(i, name) for i, name in enumerate(columns_to_blendshapes)]
         columns_to_blendshapes_text = "\n".join(columns_to_blendshapes_text)
@@ -423,30 +421,21 @@ Mesh count: {mesh_count}
 
         # gui
         gui_control_names = [
-            "{}: {}".format(i, calib_reader.getGUIControlName(i))
-            for i in range(calib_reader.getGUIControlCount())
+            "{}: {}".format(i, name) for i, name in enumerate(snapshot.gui_control_names)
         ]
 
         gui_controls_text = "\n".join(gui_control_names)
         gui_controls_text = "GUI Controls:\n\n{}".format(gui_controls_text)
 
         # psd
-        psd_inputs = calib_reader.getPSDColumnIndices()
-        psd_outputs = calib_reader.getPSDRowIndices()
-
-        psd_mapping = {}
-
-        for psd_input, psd_output in zip(psd_inputs, psd_outputs):
-            if psd_output in psd_mapping:
-                psd_mapping[psd_output].append(psd_input)
-            else:
-                psd_mapping[psd_output] = [psd_input]
+        psd_matrix = snapshot.psd_matrix
 
         psd_text = "PSDs:\n"
 
-        for psd_output in sorted(psd_mapping.keys()):
+        for psd_output in sorted(psd_matrix.psd_indices.tolist()):
             psd_name = columns_to_blendshapes[psd_output]
-            input_names = [columns_to_blendshapes[i] for i in psd_mapping[psd_output]]
+            psd_inputs, _ = psd_matrix.get_inputs(psd_output)
+            input_names = [columns_to_blendshapes[i] for i in psd_inputs.tolist()]
             psd_text += "{}: {}\n".format(psd_name, input_names)
 
         # print to output
@@ -950,6 +939,9 @@ class DnaPosesWidget(DnaTab):
         self.dna_obj = None
         self.calib_reader = None
         self.poses = None
+        self.dna_path = None
+        self.dna_file_key = None
+        self.dna_hash = None
 
         self.create_widgets()
 
@@ -962,6 +954,13 @@ class DnaPosesWidget(DnaTab):
         self.load_btn.clicked.connect(self.load)
         self.save_btn.clicked.connect(self.save)
 
+        # pose edit checkpoints
+        self.save_edits_btn = QtWidgets.QPushButton("save pose edits")
+        self.load_edits_btn = QtWidgets.QPushButton("load pose edits")
+
+        self.save_edits_btn.clicked.connect(self.save_edits)
+        self.load_edits_btn.clicked.connect(self.load_edits)
+
         self.path_line_edit = QtWidgets.QLineEdit()
 
         # self.model = QtCore.QStringListModel()
@@ -1058,6 +1057,12 @@ class DnaPosesWidget(DnaTab):
         lyt.addLayout(self.input_lyt)
         lyt.addWidget(self.filter_line_edit)
         lyt.addLayout(self.view_lyt)
+
+        self.edits_lyt = QtWidgets.QHBoxLayout()
+        self.edits_lyt.addWidget(self.save_edits_btn)
+        self.edits_lyt.addWidget(self.load_edits_btn)
+
+        lyt.addLayout(self.edits_lyt)
         lyt.addWidget(self.save_btn)
 
         self.setLayout(lyt)
@@ -1094,8 +1099,14 @@ class DnaPosesWidget(DnaTab):
             return None
 
         # load dna and get poses
-        reader = mhUtils.load_dna(input_dna_path)
-        self.calib_reader = dnacalib2.DNACalibDNAReader(reader)
+        # poses are edited as python objects, so the shared cached reader is not modified
+        # only behavior data is needed, other layers are loaded if needed when saving
+        self.calib_reader = mhCache.get_lazy_reader(input_dna_path, layer="behavior")
+        self.dna_path = input_dna_path
+
+        # the dna is only hashed if pose edits are saved or loaded, see get_dna_hash
+        self.dna_file_key = self.calib_reader.key
+        self.dna_hash = None
 
         self.attrs = mhBehaviour.get_joint_attrs(self.calib_reader)
         self.attr_defaults = mhBehaviour.get_joint_defaults(self.calib_reader)
@@ -1148,10 +1159,12 @@ class DnaPosesWidget(DnaTab):
             return None
 
         # write data
+        # only joint groups driven by edited poses need to be updated
         mhBehaviour.save_dna(
             self.calib_reader,
             self.path_manager.output_dna_path,
             poses=self.poses,
+            dirty_only=True,
         )
 
         # confirm write
@@ -1172,6 +1185,84 @@ class DnaPosesWidget(DnaTab):
 
         return True
 
+    def get_dna_hash(self):
+        """Get hash of the loaded dna, hashed the first time it is needed if unchanged on disk since loading
+        """
+        if self.dna_hash is None:
+            self.dna_hash = mhPoseEdits.get_dna_hash(self.dna_path, file_key=self.dna_file_key)
+
+        return self.dna_hash
+
+    def save_edits(self):
+        """Save edited poses to a sidecar file, without writing a dna
+        """
+        if not self.poses:
+            self.error("No data loaded to save")
+            return False
+
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            "Save pose edits",
+            mhPoseEdits.get_edits_path(self.dna_path),
+            "Pose edits (*{})".format(mhPoseEdits.EXTENSION),
+        )
+
+        if not path:
+            return False
+
+        try:
+            pose_edits = mhPoseEdits.save_pose_edits(
+                path, self.dna_path, self.poses, dna_hash=self.get_dna_hash()
+            )
+        except mhCore.MHError as err:
+            self.error(err)
+            return False
+
+        QtWidgets.QMessageBox.information(
+            self,
+            "Success",
+            "{} edited poses saved:\n{}".format(len(pose_edits), path),
+            QtWidgets.QMessageBox.Ok
+        )
+
+        return True
+
+    def load_edits(self):
+        """Apply edited poses from a sidecar file to the loaded poses
+        """
+        if not self.poses:
+            self.error("No poses loaded to apply edits to")
+            return False
+
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self,
+            "Load pose edits",
+            mhPoseEdits.get_edits_path(self.dna_path),
+            "Pose edits (*{})".format(mhPoseEdits.EXTENSION),
+        )
+
+        if not path:
+            return False
+
+        try:
+            applied = mhPoseEdits.apply_pose_edits(
+                path, self.dna_path, self.poses, dna_hash=self.get_dna_hash()
+            )
+        except mhCore.MHError as err:
+            self.error(err)
+            return False
+
+        self.model.set_poses(self.poses)
+
+        QtWidgets.QMessageBox.information(
+            self,
+            "Complete",
+            "{} edited poses applied:\n{}".format(len(applied), path),
+            QtWidgets.QMessageBox.Ok
+        )
+
+        return True
+
     def selection_changed(self, old_selection, new_selection):
         pass
 
@@ -1234,7 +1325,7 @@ class DnaPosesWidget(DnaTab):
         else:
             pose = poses[0]
 
-        pose.update_from_scene()
+        pose.update_from_scene(plug_cache=mhPlugs.get_plug_cache())
 
         if isinstance(pose, mhCore.PSDPose):
             LOG.info("PSD pose data updated: {}".format(pose.pose.name))
@@ -1466,9 +1557,7 @@ class DnaQCWidget(DnaTab):
                 self.error("Dna path not found: {}".format(dna_path))
                 return False
 
-            LOG.info("Loading dna: {}".format(dna_path))
-            reader = mhUtils.load_dna(dna_path)
-            calib_reader = dnacalib2.DNACalibDNAReader(reader)
+            calib_reader = mhCache.get_reader(dna_path, layer="behavior")
 
             poses = mhBehaviour.get_all_poses(calib_reader)
             psd_poses = mhBehaviour.get_psd_poses(calib_reader, poses)
@@ -1549,6 +1638,14 @@ class DnaMergeWidget(DnaTab):
         self.calculate_lods_checkbox = QtWidgets.QCheckBox("calculate lods")
         self.json_checkbox = QtWidgets.QCheckBox("json")
 
+        # how dst vertices are matched to src vertices
+        self.vertex_match_combo = QtWidgets.QComboBox()
+        self.vertex_match_combo.addItems(["index", "nearest", "barycentric"])
+
+        vertex_match_lyt = QtWidgets.QHBoxLayout()
+        vertex_match_lyt.addWidget(QtWidgets.QLabel("vertex matching"))
+        vertex_match_lyt.addWidget(self.vertex_match_combo)
+
         merge_group_lyt.addWidget(self.src_dna_file_combo)
         merge_group_lyt.addWidget(self.dst_dna_file_combo)
 
@@ -1561,6 +1658,7 @@ class DnaMergeWidget(DnaTab):
             checkbox.setChecked(True)
             merge_group_lyt.addWidget(checkbox)
 
+        merge_group_lyt.addLayout(vertex_match_lyt)
         merge_group_lyt.addWidget(self.json_checkbox)
 
         self.merge_btn = QtWidgets.QPushButton("Merge")
@@ -1610,20 +1708,32 @@ class DnaMergeWidget(DnaTab):
         if confirm is QtWidgets.QMessageBox.Cancel:
             return False
 
-        src_dna_obj = DNAReader.read(src_dna_path, Layer.all)
-        src_calib_reader = dnacalib2.DNACalibDNAReader(src_dna_obj._reader)
+        # src is only read from so can use the shared cached reader
+        src_dna_obj = mhCache.get_dna(src_dna_path)
+        src_calib_reader = mhCache.get_reader(src_dna_path)
 
-        dst_dna_obj = DNAReader.read(dst_dna_path, Layer.all)
-        dst_calib_reader = dnacalib2.DNACalibDNAReader(dst_dna_obj._reader)
+        # get our own copy of dst to modify
+        dst_dna_obj = mhCache.get_dna(dst_dna_path)
+        dst_calib_reader = mhCache.get_calib_reader(dst_dna_path)
 
         if self.joint_xforms_checkbox.isChecked():
-            mhJoints.merge_joint_neutral_xforms(src_calib_reader, dst_calib_reader)
+            # logs moved and missing joints
+            mhJoints.merge_joint_neutral_xforms(src_calib_reader, dst_calib_reader, verbose=True)
+
+        # only recalculate lods of meshes that have changed
+        updated_mesh_indices = None
 
         if self.vertex_positions_checkbox.isChecked():
-            mhMesh.merge_meshes_positions(src_dna_obj, src_calib_reader, dst_dna_obj, dst_calib_reader)
+            vertex_match = self.vertex_match_combo.currentText()
+
+            updated_mesh_indices = mhMesh.merge_meshes_positions(
+                src_dna_obj, src_calib_reader, dst_dna_obj, dst_calib_reader,
+                src_dna_path=src_dna_path,
+                correspondence=None if vertex_match == "index" else vertex_match,
+            )
 
         if self.calculate_lods_checkbox.isChecked():
-            mhMesh.calculate_lods(dst_dna_obj, dst_calib_reader)
+            mhMesh.calculate_lods(dst_dna_obj, dst_calib_reader, mesh_indices=updated_mesh_indices)
 
         if self.poses_checkbox.isChecked():
             poses = mhBehaviour.get_all_poses(src_calib_reader)
@@ -1862,12 +1972,7 @@ class DnaShapeBakeWidget(DnaTab):
             return False
 
         # load dna data
-        LOG.info("Loading dna: {}".format(dna_path))
-
-        dna_obj = DNAReader.read(dna_path, Layer.all)
-
-        LOG.info("Getting reader...")
-        calib_reader = dnacalib2.DNACalibDNAReader(dna_obj._reader)
+        calib_reader = mhCache.get_reader(dna_path, layer="behavior")
 
         # get pose data
         LOG.info("Getting pose data...")
@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import numpy
+
 import dna
 import dnacalib2
 
@@ -22,26 +24,22 @@ from maya import cmds
 from maya.api import OpenMaya
 
 from brenmeta.core import mhCore
+from brenmeta.dna2 import mhReader
 
 LOG = mhCore.get_basic_logger(__name__)
 
 def get_joint_index(reader, joint_name):
-    for i in range(reader.getJointCount()):
-        if reader.getJointName(i) == joint_name:
-            return i
-    return None
+    return mhReader.get_reader_index(reader).get_joint_index(joint_name)
 
 
 def reset_scene_joint_xforms(reader, err=False):
-    for i in range(reader.getJointCount()):
-        joint = reader.getJointName(i)
+    snapshot = mhReader.get_snapshot(reader)
 
+    for joint, translation in zip(snapshot.joint_names, snapshot.neutral_joint_translations.tolist()):
         if not cmds.objExists(joint):
             if err:
                 raise mhCore.MHError("Joint not found: {}".format(joint))
 
-        translation = reader.getNeutralJointTranslation(i)
-
         cmds.xform(
             joint, translation=translation, rotation=(0, 0, 0)
         )
@@ -50,12 +48,18 @@ def reset_scene_joint_xforms(reader, err=False):
 
 
 def update_joint_neutral_xforms(calib_reader, verbose=False, err=False):
-    joint_translations = []
-    joint_rotations = []
+    """Update neutral joint xforms from scene joints
 
-    for i in range(calib_reader.getJointCount()):
-        joint_name = calib_reader.getJointName(i)
+    Commands are only run if the xforms differ from the reader.
+
+    :return: True if the reader was updated
+    """
+    snapshot = mhReader.get_snapshot(calib_reader)
+
+    joint_translations = snapshot.neutral_joint_translations.tolist()
+    joint_rotations = snapshot.neutral_joint_rotations.tolist()
 
+    for i, joint_name in enumerate(snapshot.joint_names):
         if not cmds.objExists(joint_name):
             msg = "Joint not found: {}".format(joint_name)
 
@@ -64,17 +68,17 @@ def update_joint_neutral_xforms(calib_reader, verbose=False, err=False):
             else:
                 cmds.warning(msg)
 
-            translation = calib_reader.getNeutralJointTranslation(i)
-            rotation = calib_reader.getNeutralJointRotation(i)
-        else:
-            if verbose:
-                LOG.info("Updating joint: {}".format(joint_name))
+            continue
+
+        if verbose:
+            LOG.info("Updating joint: {}".format(joint_name))
 
-            translation = cmds.xform(joint_name, query=True, translation=True)
-            rotation = cmds.joint(joint_name, query=True, orientation=True)
+        joint_translations[i] = cmds.xform(joint_name, query=True, translation=True)
+        joint_rotations[i] = cmds.joint(joint_name, query=True, orientation=True)
 
-        joint_translations.append(translation)
-        joint_rotations.append(rotation)
+    if snapshot.is_neutral_joint_xforms_equal(joint_translations, joint_rotations):
+        LOG.info("Neutral joint xforms unchanged, skipping update")
+        return False
 
     translations_cmd = dnacalib2.SetNeutralJointTranslationsCommand(joint_translations)
     rotations_cmd = dnacalib2.SetNeutralJointRotationsCommand(joint_rotations)
@@ -82,7 +86,7 @@ def update_joint_neutral_xforms(calib_reader, verbose=False, err=False):
     commands = dnacalib2.CommandSequence()
     commands.add(translations_cmd)
     commands.add(rotations_cmd)
-    commands.run(calib_reader)
+    mhReader.run_commands(commands, calib_reader)
 
     return True
 
@@ -107,40 +111,128 @@ def update_joint_list(calib_reader, verbose=False):
         command = dnacalib2.RemoveJointCommand(i)
         commands.add(command)
 
-    commands.run(calib_reader)
+    mhReader.run_commands(commands, calib_reader)
 
     return True
 
 
-def merge_joint_neutral_xforms(src_calib_reader, dst_calib_reader):
-    joint_translations = []
-    joint_rotations = []
+class JointXformDiff(object):
+    """Differences between neutral joint xforms of two readers, in dst joint order
+    """
+
+    def __init__(self, joint_names, src_indices, translation_deltas, rotation_deltas, missing_in_dst, tolerance=1e-5):
+        self.joint_names = joint_names
+        self.src_indices = src_indices
+        self.translation_deltas = translation_deltas
+        self.rotation_deltas = rotation_deltas
+        self.missing_in_dst = missing_in_dst
+        self.tolerance = tolerance
+
+    @property
+    def missing_in_src(self):
+        return [self.joint_names[i] for i in numpy.flatnonzero(self.src_indices < 0)]
+
+    @property
+    def translation_magnitudes(self):
+        return numpy.linalg.norm(self.translation_deltas, axis=1)
+
+    @property
+    def rotation_magnitudes(self):
+        return numpy.linalg.norm(self.rotation_deltas, axis=1)
+
+    @property
+    def moved_mask(self):
+        return (self.translation_magnitudes > self.tolerance) | (self.rotation_magnitudes > self.tolerance)
+
+    @property
+    def moved_joints(self):
+        return [self.joint_names[i] for i in numpy.flatnonzero(self.moved_mask)]
+
+    def get_moved(self):
+        """Get list of (joint name, translation magnitude, rotation magnitude) of moved joints, largest first
+        """
+        translation_magnitudes = self.translation_magnitudes
+        rotation_magnitudes = self.rotation_magnitudes
+
+        indices = numpy.flatnonzero(self.moved_mask)
+        indices = indices[numpy.argsort(-translation_magnitudes[indices], kind="stable")]
 
-    for dst_index in range(dst_calib_reader.getJointCount()):
-        joint_name = dst_calib_reader.getJointName(dst_index)
+        return [
+            (self.joint_names[i], float(translation_magnitudes[i]), float(rotation_magnitudes[i]))
+            for i in indices
+        ]
 
-        src_index = get_joint_index(src_calib_reader, joint_name)
+    def log(self, verbose=False):
+        moved = self.get_moved()
 
-        if src_index is None:
+        LOG.info("Joints moved: {}/{}".format(len(moved), len(self.joint_names)))
+
+        if verbose:
+            for joint_name, translation_magnitude, rotation_magnitude in moved:
+                LOG.info("    {}: translation {:.5f}, rotation {:.5f}".format(
+                    joint_name, translation_magnitude, rotation_magnitude
+                ))
+
+        for joint_name in self.missing_in_src:
             LOG.warning("joint not found in src reader: {}".format(joint_name))
 
-            translation = dst_calib_reader.getNeutralJointTranslation(dst_index)
-            rotation = dst_calib_reader.getNeutralJointRotation(dst_index)
-        else:
-            LOG.info("Updating joint: {}".format(joint_name))
+        for joint_name in self.missing_in_dst:
+            LOG.warning("joint not found in dst reader: {}".format(joint_name))
 
-            translation = src_calib_reader.getNeutralJointTranslation(src_index)
-            rotation = src_calib_reader.getNeutralJointRotation(src_index)
+        return True
 
-        joint_translations.append(translation)
-        joint_rotations.append(rotation)
 
-    translations_cmd = dnacalib2.SetNeutralJointTranslationsCommand(joint_translations)
-    rotations_cmd = dnacalib2.SetNeutralJointRotationsCommand(joint_rotations)
+def get_joint_index_map(src_snapshot, dst_snapshot):
+    """Get array of src joint index for each dst joint, -1 where the joint is missing from src
+    """
+    return numpy.array(
+        [src_snapshot.index.joints.get(joint_name, -1) for joint_name in dst_snapshot.joint_names],
+        dtype=numpy.intp
+    )
+
+
+def merge_joint_neutral_xforms(src_calib_reader, dst_calib_reader, tolerance=1e-5, verbose=False):
+    """Set neutral xforms of dst joints to those of matching src joints
+
+    Joints are matched by name, dst joints missing from src are left as they are.
+    Commands are only run if any xforms change.
+
+    :return: JointXformDiff of merged xforms against the original dst xforms
+    """
+    src_snapshot = mhReader.get_snapshot(src_calib_reader)
+    dst_snapshot = mhReader.get_snapshot(dst_calib_reader)
+
+    src_indices = get_joint_index_map(src_snapshot, dst_snapshot)
+    found = src_indices >= 0
+
+    # gather merged xforms
+    joint_translations = dst_snapshot.neutral_joint_translations.copy()
+    joint_rotations = dst_snapshot.neutral_joint_rotations.copy()
+
+    joint_translations[found] = src_snapshot.neutral_joint_translations[src_indices[found]]
+    joint_rotations[found] = src_snapshot.neutral_joint_rotations[src_indices[found]]
+
+    diff = JointXformDiff(
+        dst_snapshot.joint_names,
+        src_indices,
+        joint_translations - dst_snapshot.neutral_joint_translations,
+        joint_rotations - dst_snapshot.neutral_joint_rotations,
+        [name for name in src_snapshot.joint_names if name not in dst_snapshot.index.joints],
+        tolerance=tolerance,
+    )
+
+    diff.log(verbose=verbose)
+
+    if dst_snapshot.is_neutral_joint_xforms_equal(joint_translations, joint_rotations):
+        LOG.info("Neutral joint xforms unchanged, skipping update")
+        return diff
+
+    translations_cmd = dnacalib2.SetNeutralJointTranslationsCommand(joint_translations.tolist())
+    rotations_cmd = dnacalib2.SetNeutralJointRotationsCommand(joint_rotations.tolist())
 
     commands = dnacalib2.CommandSequence()
     commands.add(translations_cmd)
     commands.add(rotations_cmd)
-    commands.run(dst_calib_reader)
+    mhReader.run_commands(commands, dst_calib_reader)
 
-    return True
+    return diff
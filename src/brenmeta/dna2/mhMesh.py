@@ -15,6 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import concurrent.futures
+import time
+
+import numpy
+
 import dna
 import dnacalib2
 
@@ -22,9 +27,15 @@ from maya import cmds
 
 from brenmeta.maya import mhMayaUtils
 from brenmeta.core import mhCore
+from brenmeta.dna2 import mhReader
+from brenmeta.dna2 import mhGeoCache
+from brenmeta.dna2 import mhCorrespondence
 
 LOG = mhCore.get_basic_logger(__name__)
 
+# default number of threads used to prepare per mesh data, None uses the executor default
+MESH_WORKERS = None
+
 
 def get_mesh_indices(dna_obj, reader, lod=None):
     if lod is None:
@@ -34,91 +45,301 @@ def get_mesh_indices(dna_obj, reader, lod=None):
 
     return mesh_indices
 
-def get_vertex_positions_from_dna(dna_obj, reader, lod=0):
+def get_vertex_positions(reader, mesh_index):
+    """Get (N, 3) float32 array of vertex positions for mesh
+    """
+    return numpy.column_stack([
+        numpy.asarray(reader.getVertexPositionXs(mesh_index), dtype=numpy.float32),
+        numpy.asarray(reader.getVertexPositionYs(mesh_index), dtype=numpy.float32),
+        numpy.asarray(reader.getVertexPositionZs(mesh_index), dtype=numpy.float32),
+    ])
+
+
+def get_vertex_positions_from_dna(dna_obj, reader, lod=0, dna_path=None):
+    """Get dict of mesh index to (N, 3) float32 array of vertex positions
 
+    If the path of the dna file the reader was loaded from is given, positions are read from
+    the geometry cache if possible, and written to it if not.
+    Only give a path if the reader is unmodified since loading.
+    """
     mesh_indices = get_mesh_indices(dna_obj, reader, lod=lod)
 
     if not mesh_indices:
         LOG.info("No meshes found in DNA.")
         return None
 
-    mesh_vertex_positions = []
+    geo_cache = mhGeoCache.get_geometry_cache(dna_path)
+
+    mesh_vertex_positions = {}
 
     for mesh_index in mesh_indices:
-        xs = reader.getVertexPositionXs(mesh_index)
-        ys = reader.getVertexPositionYs(mesh_index)
-        zs = reader.getVertexPositionZs(mesh_index)
+        mesh_vertex_positions[mesh_index] = get_cached_vertex_positions(reader, mesh_index, geo_cache)
 
-        positions = [
-            [x,y,z] for x,y,z in zip(xs, ys, zs)
-        ]
+    return mesh_vertex_positions
 
-        mesh_vertex_positions.append(positions)
 
-    return mesh_vertex_positions
+def get_cached_vertex_positions(reader, mesh_index, geo_cache=None):
+    """Get vertex positions from geometry cache if given and cached, otherwise from reader
+    """
+    positions = geo_cache.load_positions(mesh_index) if geo_cache else None
 
+    if positions is None:
+        positions = get_vertex_positions(reader, mesh_index)
 
-def update_meshes_from_scene(dna_obj, calib_reader, lod=0):
+        if geo_cache:
+            geo_cache.save_positions(mesh_index, positions)
 
-    # get existing mesh data
-    LOG.info("getting dna mesh data...")
-    mesh_data = get_vertex_positions_from_dna(dna_obj, calib_reader, lod=lod)
-    meshes = dna_obj.get_meshes()
+    return positions
+
+
+def map_meshes(func, mesh_indices, workers=None):
+    """Call func(mesh_index) for each mesh in a thread pool
+
+    Results are returned in mesh_indices order regardless of which finish first.
+    If workers is None MESH_WORKERS is used, 1 runs everything on the calling thread.
+
+    func should only do numpy work on data already read on the calling thread.
+    Dna readers are not documented as thread safe, and their getters hold the GIL so gain nothing
+    from threads, whereas numpy and scipy release it for large array operations.
+    Maya must not be accessed from func.
+
+    :return: list of (mesh_index, result, seconds taken)
+    """
+    mesh_indices = list(mesh_indices)
+
+    if workers is None:
+        workers = MESH_WORKERS
 
-    # get deltas and create commands
+    def timed(mesh_index):
+        start = time.time()
+        result = func(mesh_index)
+        return result, time.time() - start
+
+    if workers == 1 or len(mesh_indices) <= 1:
+        results = [timed(mesh_index) for mesh_index in mesh_indices]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(timed, mesh_indices))
+
+    return [
+        (mesh_index, result, seconds) for mesh_index, (result, seconds) in zip(mesh_indices, results)
+    ]
+
+
+def set_mesh_workers(workers):
+    """Set default number of threads used to prepare per mesh data, None uses the executor default
+    """
+    global MESH_WORKERS
+    MESH_WORKERS = workers
+    return True
+
+
+def get_mesh_deltas(mesh, positions, existing_positions):
+    """Get (N, 3) deltas from existing positions to positions, or None if they are the same or can't be compared
+    """
+    if positions.shape != existing_positions.shape:
+        LOG.warning("vertex count mismatch, skipping mesh: {} {} != {}".format(
+            mesh, len(positions), len(existing_positions)
+        ))
+        return None
+
+    # compare as float32, the precision positions are stored with in dna files
+    if numpy.array_equal(positions.astype(numpy.float32), existing_positions.astype(numpy.float32)):
+        LOG.info("mesh unchanged: {}".format(mesh))
+        return None
+
+    return positions - existing_positions
+
+
+def apply_mesh_deltas(calib_reader, mesh_deltas, meshes, timings=None):
+    """Add prepared deltas to mesh vertex positions in one command sequence, in the given order
+
+    :param mesh_deltas: list of (mesh_index, deltas or None, seconds taken to prepare) as returned by map_meshes
+    :param timings: optional dict to add seconds taken to prepare each mesh to
+    :return: list of updated mesh indices
+    """
     commands = dnacalib2.CommandSequence()
+    updated_mesh_indices = []
+
+    for mesh_index, deltas, seconds in mesh_deltas:
+        if timings is not None:
+            timings[mesh_index] = timings.get(mesh_index, 0.0) + seconds
 
-    for mesh_index, existing_positions in enumerate(mesh_data):
+        if deltas is None:
+            continue
+
+        commands.add(get_vertex_positions_command(mesh_index, deltas))
+        updated_mesh_indices.append(mesh_index)
+
+        LOG.info("updating mesh: {} ({} vertices, {:.3f}s)".format(
+            meshes[mesh_index].name, len(deltas), seconds
+        ))
+
+    if not updated_mesh_indices:
+        LOG.info("No meshes changed")
+        return updated_mesh_indices
+
+    LOG.info("running commands...")
+    mhReader.run_commands(commands, calib_reader)
+
+    if not dna.Status.isOk():
+        status = dna.Status.get()
+        raise mhCore.MHError(status.message)
+
+    return updated_mesh_indices
+
+
+def get_mesh_topology_hash(reader, mesh_index, vertex_count):
+    """Get hash of vertex count, vertex layout and face count of mesh
+
+    Used to key correspondences, rather than triangulating every face, see get_mesh_triangles.
+    """
+    return mhCorrespondence.get_topology_hash(
+        vertex_count,
+        numpy.asarray(reader.getVertexLayoutPositionIndices(mesh_index), dtype=numpy.int64),
+        [reader.getFaceCount(mesh_index)],
+    )
+
+
+def get_mesh_triangles(reader, mesh_index):
+    """Get (T, 3) array of vertex position indices of each triangle, faces are fan triangulated
+    """
+    layout_positions = numpy.asarray(reader.getVertexLayoutPositionIndices(mesh_index), dtype=numpy.intp)
+
+    triangles = []
+
+    for face_index in range(reader.getFaceCount(mesh_index)):
+        face = layout_positions[numpy.asarray(reader.getFaceVertexLayoutIndices(mesh_index, face_index), dtype=numpy.intp)]
+
+        for i in range(1, len(face) - 1):
+            triangles.append((face[0], face[i], face[i + 1]))
+
+    return numpy.array(triangles, dtype=numpy.intp).reshape(-1, 3)
+
+
+def get_vertex_positions_command(mesh_index, deltas):
+    """Get command to add (N, 3) deltas to mesh vertex positions
+    """
+    deltas = numpy.ascontiguousarray(deltas, dtype=numpy.float32)
+
+    return dnacalib2.SetVertexPositionsCommand(
+        mesh_index, deltas.tolist(), dnacalib2.VectorOperation_Add
+    )
+
+
+def update_meshes_from_scene(dna_obj, calib_reader, lod=0, workers=None, timings=None):
+    """Update dna vertex positions from scene meshes
+
+    Scene meshes and dna positions are read on the calling thread, then deltas are computed in a thread pool,
+    see map_meshes.
+    Commands are only created for meshes whose positions differ from the dna.
+
+    :param timings: optional dict to add seconds taken for each mesh to
+    :return: list of updated mesh indices
+    """
+    mesh_indices = get_mesh_indices(dna_obj, calib_reader, lod=lod)
+    meshes = dna_obj.get_meshes()
+
+    # maya can only be accessed from the main thread
+    LOG.info("getting scene mesh data...")
+
+    scene_positions = {}
+    scene_times = {}
+
+    for mesh_index in mesh_indices:
         mesh = meshes[mesh_index].name
 
         if not cmds.objExists(mesh):
             LOG.info("mesh not found in scene: {}".format(mesh))
             continue
 
-        # TODO check vertex counts are the same
+        start = time.time()
+        scene_positions[mesh_index] = mhMayaUtils.get_points(mesh, as_numpy=True)
+        scene_times[mesh_index] = time.time() - start
 
-        LOG.info("updating mesh: {}".format(mesh))
+    # readers are also only read from the calling thread
+    LOG.info("getting dna mesh data...")
 
-        scene_vertex_positions = mhMayaUtils.get_points(mesh, as_positions=True)
+    existing_positions = {}
 
-        deltas = [
-            [a[i]-b[i] for i in range(3)]
-            for a, b in zip(scene_vertex_positions, existing_positions)
-        ]
+    for mesh_index in scene_positions.keys():
+        start = time.time()
+        existing_positions[mesh_index] = get_vertex_positions(calib_reader, mesh_index)
+        scene_times[mesh_index] += time.time() - start
 
-        command = dnacalib2.SetVertexPositionsCommand(
-            mesh_index, deltas, dnacalib2.VectorOperation_Add
+    def get_deltas(mesh_index):
+        return get_mesh_deltas(
+            meshes[mesh_index].name, scene_positions[mesh_index], existing_positions[mesh_index]
         )
 
-        commands.add(command)
+    mesh_deltas = [
+        (mesh_index, deltas, seconds + scene_times[mesh_index])
+        for mesh_index, deltas, seconds in map_meshes(get_deltas, scene_positions.keys(), workers=workers)
+    ]
 
-    LOG.info("running commands...")
-    commands.run(calib_reader)
+    return apply_mesh_deltas(calib_reader, mesh_deltas, meshes, timings=timings)
 
-    if not dna.Status.isOk():
-        status = dna.Status.get()
-        raise RuntimeError(status.message)
 
-    return True
+def calculate_lods(dna_obj, calib_reader, from_lod=0, mesh_indices=None, timings=None):
+    """Recalculate lower lods of meshes in from_lod
 
+    If mesh_indices is given, only those meshes are recalculated, eg. meshes that have been updated.
 
-def calculate_lods(dna_obj, calib_reader, from_lod=0):
+    All meshes are calculated in one command sequence, unless timings is given,
+    then commands are run one mesh at a time to time each mesh.
+
+    :param timings: optional dict to add seconds taken for each mesh to
+    """
     # get existing mesh data
     meshes = dna_obj.get_meshes()
 
+    lod_mesh_indices = dna_obj.get_mesh_indices_for_lod(from_lod)
+
+    if mesh_indices is not None:
+        skipped = [i for i in lod_mesh_indices if i not in mesh_indices]
+        lod_mesh_indices = [i for i in lod_mesh_indices if i in mesh_indices]
+
+        if skipped:
+            LOG.info("skipping lods of unchanged meshes: {}".format(
+                ", ".join([meshes[i].name for i in skipped])
+            ))
+
+    if not lod_mesh_indices:
+        LOG.info("No lods to calculate")
+        return True
+
     # create commands
     commands = dnacalib2.CommandSequence()
 
-    for mesh_index in dna_obj.get_mesh_indices_for_lod(from_lod):
+    for mesh_index in lod_mesh_indices:
         mesh = meshes[mesh_index]
 
-        LOG.info("calculating lods: {}".format(mesh.name))
         calculate_lods_command = dnacalib2.CalculateMeshLowerLODsCommand()
         calculate_lods_command.setMeshIndex(mesh_index)
-        commands.add(calculate_lods_command)
+
+        if timings is None:
+            LOG.info("calculating lods: {}".format(mesh.name))
+            commands.add(calculate_lods_command)
+            continue
+
+        start = time.time()
+
+        mhReader.run_commands(calculate_lods_command, calib_reader)
+
+        if not dna.Status.isOk():
+            status = dna.Status.get()
+            raise RuntimeError(status.message)
+
+        seconds = time.time() - start
+        timings[mesh_index] = timings.get(mesh_index, 0.0) + seconds
+
+        LOG.info("calculated lods: {} ({:.3f}s)".format(mesh.name, seconds))
+
+    if timings is not None:
+        return True
 
     LOG.info("running commands...")
-    commands.run(calib_reader)
+    mhReader.run_commands(commands, calib_reader)
 
     # Verify that everything went fine
     if not dna.Status.isOk():
@@ -127,73 +348,285 @@ def calculate_lods(dna_obj, calib_reader, from_lod=0):
 
     return True
 
-def get_blendshape_deltas(dna_obj, reader, lod=0):
-    # TODO finish this
-    if lod is None:
-        mesh_indices = list(range(reader.getMeshCount()))
+class MeshBlendshapeDeltas(object):
+    """Sparse blendshape target deltas for a mesh
+
+    Deltas and vertex indices of every target are concatenated,
+    with target i stored in the range offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, mesh_index, deltas, vertex_indices, offsets, channel_indices=None):
+        self.mesh_index = mesh_index
+        self.deltas = deltas
+        self.vertex_indices = vertex_indices
+        self.offsets = offsets
+        self.channel_indices = channel_indices
+        self.dirty = numpy.zeros(self.target_count, dtype=bool)
+
+    @property
+    def target_count(self):
+        return len(self.offsets) - 1
+
+    def get_target_deltas(self, target_index):
+        """Get (N, 3) deltas and (N,) vertex indices for target, these are views of the concatenated arrays
+        """
+        start, end = self.offsets[target_index], self.offsets[target_index + 1]
+        return self.deltas[start:end], self.vertex_indices[start:end]
+
+    def set_target_deltas(self, target_index, deltas, vertex_indices):
+        """Replace deltas of target, this may change the number of deltas
+        """
+        deltas = numpy.asarray(deltas, dtype=numpy.float32).reshape(-1, 3)
+        vertex_indices = numpy.asarray(vertex_indices, dtype=numpy.uint32)
+
+        if len(deltas) != len(vertex_indices):
+            raise mhCore.MHError("Delta count does not match vertex index count: {} != {}".format(
+                len(deltas), len(vertex_indices)
+            ))
+
+        start, end = self.offsets[target_index], self.offsets[target_index + 1]
+
+        self.deltas = numpy.concatenate([self.deltas[:start], deltas, self.deltas[end:]])
+        self.vertex_indices = numpy.concatenate([self.vertex_indices[:start], vertex_indices, self.vertex_indices[end:]])
+
+        self.offsets[target_index + 1:] += len(deltas) - (end - start)
+        self.dirty[target_index] = True
+
+        return True
+
+    def scale(self, value, target_indices=None):
+        """Scale deltas of all or given targets in place
+        """
+        if target_indices is None:
+            self.deltas *= value
+            self.dirty[:] = True
+        else:
+            for target_index in target_indices:
+                target_deltas, _ = self.get_target_deltas(target_index)
+                target_deltas *= value
+                self.dirty[target_index] = True
+
+        return True
+
+
+def get_mesh_blendshape_deltas(reader, mesh_index):
+    """Read deltas and vertex indices of every blendshape target on mesh into a MeshBlendshapeDeltas object
+    """
+    target_count = reader.getBlendShapeTargetCount(mesh_index)
+
+    xs = []
+    ys = []
+    zs = []
+    vertex_indices = []
+    channel_indices = numpy.zeros(target_count, dtype=numpy.intp)
+    counts = numpy.zeros(target_count, dtype=numpy.int64)
+
+    for target_index in range(target_count):
+        xs.append(numpy.asarray(reader.getBlendShapeTargetDeltaXs(mesh_index, target_index), dtype=numpy.float32))
+        ys.append(numpy.asarray(reader.getBlendShapeTargetDeltaYs(mesh_index, target_index), dtype=numpy.float32))
+        zs.append(numpy.asarray(reader.getBlendShapeTargetDeltaZs(mesh_index, target_index), dtype=numpy.float32))
+
+        vertex_indices.append(numpy.asarray(
+            reader.getBlendShapeTargetVertexIndices(mesh_index, target_index), dtype=numpy.uint32
+        ))
+
+        channel_indices[target_index] = reader.getBlendShapeChannelIndex(mesh_index, target_index)
+        counts[target_index] = len(vertex_indices[-1])
+
+    offsets = numpy.zeros(target_count + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+
+    if target_count:
+        deltas = numpy.column_stack([numpy.concatenate(xs), numpy.concatenate(ys), numpy.concatenate(zs)])
+        vertex_indices = numpy.concatenate(vertex_indices)
     else:
-        mesh_indices = dna_obj.get_mesh_indices_for_lod(lod)
+        deltas = numpy.zeros((0, 3), dtype=numpy.float32)
+        vertex_indices = numpy.zeros(0, dtype=numpy.uint32)
+
+    return MeshBlendshapeDeltas(mesh_index, deltas, vertex_indices, offsets, channel_indices=channel_indices)
+
+
+def get_blendshape_deltas(dna_obj, reader, lod=0, dna_path=None):
+    """Get dict of mesh index to MeshBlendshapeDeltas for meshes in lod, or all meshes if lod is None
+
+    If the path of the dna file the reader was loaded from is given, deltas are read from
+    the geometry cache if possible, and written to it if not.
+    Only give a path if the reader is unmodified since loading.
+    """
+    mesh_indices = get_mesh_indices(dna_obj, reader, lod=lod)
 
     if not mesh_indices:
         LOG.info("No meshes found in DNA.")
         return None
 
+    geo_cache = mhGeoCache.get_geometry_cache(dna_path)
+
+    blendshape_deltas = {}
+
     for mesh_index in mesh_indices:
-        target_count = reader.getBlendShapeTargetCount(mesh_index)
+        start = time.time()
 
-        for target_index in range(target_count):
-            delta_count = reader.getBlendShapeTargetDeltaCount(mesh_index, target_index)
+        arrays = geo_cache.load_blendshape_arrays(mesh_index) if geo_cache else None
 
-            for delta_index in range(delta_count):
-                delta = reader.getBlendShapeTargetDelta(mesh_index, target_index, delta_index)
+        if arrays is not None:
+            mesh_deltas = MeshBlendshapeDeltas(mesh_index, **arrays)
+        else:
+            mesh_deltas = get_mesh_blendshape_deltas(reader, mesh_index)
 
-    return True
+            if geo_cache:
+                geo_cache.save_blendshape_arrays(mesh_index, {
+                    name: getattr(mesh_deltas, name) for name in mhGeoCache.BLENDSHAPE_ARRAYS
+                })
 
-def set_blendshape_deltas():
-    # TODO
-    dnacalib2.SetBlendShapeTargetDeltasCommand
+        blendshape_deltas[mesh_index] = mesh_deltas
 
-def scale_all_blendshape_deltas():
-    pass
+        LOG.info("read blendshape deltas: mesh {} ({} targets, {} deltas, {:.3f}s)".format(
+            mesh_index, mesh_deltas.target_count, len(mesh_deltas.deltas), time.time() - start
+        ))
 
-def merge_meshes_positions(src_dna_obj, src_calib_reader, dst_dna_obj, dst_calib_reader, lod=0):
+    return blendshape_deltas
 
-    # get existing mesh data
-    LOG.info("getting dna mesh data...")
 
-    src_mesh_data = get_vertex_positions_from_dna(src_dna_obj, src_calib_reader, lod=lod)
-    src_meshes = src_dna_obj.get_meshes()
+def set_blendshape_deltas(calib_reader, blendshape_deltas, dirty_only=True):
+    """Write MeshBlendshapeDeltas objects back to calib reader in one command sequence
+
+    Target deltas are replaced, if dirty_only is True only targets that have been edited are written.
 
-    dst_mesh_data = get_vertex_positions_from_dna(dst_dna_obj, dst_calib_reader, lod=lod)
-    dst_meshes = dst_dna_obj.get_meshes()
+    :return: number of targets written
+    """
+    if isinstance(blendshape_deltas, dict):
+        blendshape_deltas = list(blendshape_deltas.values())
 
-    # get deltas and create commands
     commands = dnacalib2.CommandSequence()
+    target_count = 0
 
-    for mesh_index in src_dna_obj.get_mesh_indices_for_lod(lod):
-        mesh = src_meshes[mesh_index].name
+    for mesh_deltas in blendshape_deltas:
+        if dirty_only:
+            target_indices = numpy.flatnonzero(mesh_deltas.dirty)
+        else:
+            target_indices = range(mesh_deltas.target_count)
 
-        LOG.info("updating mesh: {}".format(mesh))
+        for target_index in target_indices:
+            deltas, vertex_indices = mesh_deltas.get_target_deltas(target_index)
 
-        src_positions = src_mesh_data[mesh_index]
-        dst_positions = dst_mesh_data[mesh_index]
+            xs, ys, zs = deltas.T.tolist()
 
-        deltas = [
-            [a[i]-b[i] for i in range(3)]
-            for a, b in zip(src_positions, dst_positions)
-        ]
+            command = dnacalib2.SetBlendShapeTargetDeltasCommand(
+                mesh_deltas.mesh_index,
+                int(target_index),
+                xs, ys, zs,
+                vertex_indices.tolist(),
+                dnacalib2.VectorOperation_Interpolate,
+            )
 
-        command = dnacalib2.SetVertexPositionsCommand(
-            mesh_index, deltas, dnacalib2.VectorOperation_Add
-        )
+            commands.add(command)
+            target_count += 1
 
-        commands.add(command)
+    if not target_count:
+        LOG.info("No blendshape deltas to update")
+        return 0
 
     LOG.info("running commands...")
-    commands.run(dst_calib_reader)
+    mhReader.run_commands(commands, calib_reader)
 
     if not dna.Status.isOk():
         status = dna.Status.get()
         raise mhCore.MHError(status.message)
 
+    for mesh_deltas in blendshape_deltas:
+        mesh_deltas.dirty[:] = False
+
+    LOG.info("Blendshape targets updated: {}".format(target_count))
+
+    return target_count
+
+
+def scale_all_blendshape_deltas(dna_obj, calib_reader, value, lod=None):
+    """Scale blendshape deltas of every target on meshes in lod, or all meshes if lod is None
+    """
+    blendshape_deltas = get_blendshape_deltas(dna_obj, calib_reader, lod=lod)
+
+    if not blendshape_deltas:
+        return False
+
+    for mesh_deltas in blendshape_deltas.values():
+        mesh_deltas.scale(value)
+
+    set_blendshape_deltas(calib_reader, blendshape_deltas)
+
     return True
+
+def merge_meshes_positions(
+        src_dna_obj, src_calib_reader, dst_dna_obj, dst_calib_reader, lod=0, src_dna_path=None, correspondence=None,
+        workers=None, timings=None,
+):
+    """Set dst vertex positions to src positions, for meshes whose positions differ
+
+    By default vertices are matched by index, and meshes with different vertex counts are skipped.
+    If correspondence is "nearest" or "barycentric", each dst vertex is matched to the nearest src vertex
+    or the closest point on the src mesh surface instead, see mhCorrespondence.
+
+    Deltas of each mesh are computed in a thread pool, see map_meshes.
+
+    :param timings: optional dict to add seconds taken for each mesh to
+    :return: list of updated mesh indices
+    """
+
+    src_meshes = src_dna_obj.get_meshes()
+    src_geo_cache = mhGeoCache.get_geometry_cache(src_dna_path)
+
+    mesh_indices = src_dna_obj.get_mesh_indices_for_lod(lod)
+
+    # read everything needed from the readers on the calling thread, see map_meshes
+    LOG.info("getting dna mesh data...")
+
+    mesh_data = {}
+    read_times = {}
+
+    for mesh_index in mesh_indices:
+        start = time.time()
+
+        src_positions = get_cached_vertex_positions(src_calib_reader, mesh_index, src_geo_cache)
+        dst_positions = get_vertex_positions(dst_calib_reader, mesh_index)
+
+        src_topology_hash = None
+        dst_topology_hash = None
+        src_triangles = None
+
+        if correspondence is not None:
+            src_topology_hash = get_mesh_topology_hash(src_calib_reader, mesh_index, len(src_positions))
+            dst_topology_hash = get_mesh_topology_hash(dst_calib_reader, mesh_index, len(dst_positions))
+
+            # only triangulate src faces if a barycentric correspondence isn't cached
+            if correspondence == "barycentric" and not mhCorrespondence.is_cached(
+                    correspondence, src_topology_hash, dst_topology_hash
+            ):
+                src_triangles = get_mesh_triangles(src_calib_reader, mesh_index)
+
+        mesh_data[mesh_index] = (src_positions, dst_positions, src_triangles, src_topology_hash, dst_topology_hash)
+        read_times[mesh_index] = time.time() - start
+
+    def get_deltas(mesh_index):
+        src_positions, dst_positions, src_triangles, src_topology_hash, dst_topology_hash = mesh_data[mesh_index]
+
+        if correspondence is not None:
+            mesh_correspondence = mhCorrespondence.get_correspondence(
+                src_positions,
+                src_triangles,
+                dst_positions,
+                None,
+                mode=correspondence,
+                src_topology_hash=src_topology_hash,
+                dst_topology_hash=dst_topology_hash,
+            )
+
+            src_positions = mesh_correspondence.apply(src_positions)
+
+        return get_mesh_deltas(src_meshes[mesh_index].name, src_positions, dst_positions)
+
+    mesh_deltas = [
+        (mesh_index, deltas, seconds + read_times[mesh_index])
+        for mesh_index, deltas, seconds in map_meshes(get_deltas, mesh_indices, workers=workers)
+    ]
+
+    return apply_mesh_deltas(dst_calib_reader, mesh_deltas, src_meshes, timings=timings)
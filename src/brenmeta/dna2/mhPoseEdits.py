@@ -0,0 +1,282 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Pose edit sidecar files
+
+Saving poses to a dna rewrites the whole file. Instead edited poses can be
+checkpointed to a small .npz file holding only the poses that differ from
+the base dna they were loaded from, keyed by a hash of the base dna contents:
+
+    mhPoseEdits.save_pose_edits(edits_path, dna_path, poses)
+
+Then applied over poses from the cached reader of the base dna later,
+and only baked into a new dna when needed:
+
+    poses = mhPoseEdits.load_poses(edits_path, dna_path)
+    mhBehaviour.save_dna(reader, output_path, poses=poses, dirty_only=True)
+
+Edited poses are those marked dirty, which poses stay until reloaded,
+so each checkpoint holds every edit made since loading the base dna.
+"""
+
+import os
+
+import numpy
+
+from brenmeta.core import mhCore
+from brenmeta.dna2 import mhBehaviour
+from brenmeta.dna2 import mhCache
+from brenmeta.dna2 import mhGeoCache
+
+LOG = mhCore.get_basic_logger(__name__)
+
+VERSION = 1
+
+EXTENSION = ".npz"
+
+
+class PoseEdits(object):
+    """Deltas of edited poses, as compressed sparse rows with their own attr names
+
+    pose_indices: index of each edited pose
+    indptr, attr_indices, values: CSR arrays of the deltas of each edited pose,
+        with attr_indices into attr_names
+    """
+
+    def __init__(self, dna_hash, pose_indices, indptr, attr_indices, values, attr_names):
+        self.dna_hash = dna_hash
+        self.pose_indices = pose_indices
+        self.indptr = indptr
+        self.attr_indices = attr_indices
+        self.values = values
+        self.attr_names = attr_names
+
+    def __len__(self):
+        return len(self.pose_indices)
+
+    def __repr__(self):
+        return "{}({} poses, {} deltas)".format(self.__class__.__name__, len(self), len(self.values))
+
+    @classmethod
+    def from_poses(cls, dna_hash, poses, dirty_only=True):
+        """Get PoseEdits of the given poses, or only those marked dirty
+        """
+        edited_poses = [pose for pose in poses if pose.dirty or not dirty_only]
+
+        indptr = numpy.zeros(len(edited_poses) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(pose.attr_indices) for pose in edited_poses], out=indptr[1:])
+
+        if not edited_poses:
+            return cls(
+                dna_hash,
+                numpy.zeros(0, dtype=numpy.int64),
+                indptr,
+                numpy.zeros(0, dtype=numpy.int32),
+                numpy.zeros(0, dtype=numpy.float32),
+                [],
+            )
+
+        # poses may come from different attr tables, so attrs are stored by name
+        attr_names = []
+        name_indices = {}
+        table_remaps = {}
+
+        attr_indices = []
+
+        for pose in edited_poses:
+            table = pose.attr_table
+
+            remap = table_remaps.get(id(table), numpy.zeros(0, dtype=numpy.int32))
+
+            # tables can grow as attrs are added to poses
+            if len(remap) < len(table):
+                remap = numpy.append(remap, numpy.full(len(table) - len(remap), -1, dtype=numpy.int32))
+                table_remaps[id(table)] = remap
+
+            # add any attrs of this pose not yet named
+            for attr_index in pose.attr_indices[remap[pose.attr_indices] < 0].tolist():
+                name = table.names[attr_index]
+
+                if name not in name_indices:
+                    name_indices[name] = len(attr_names)
+                    attr_names.append(name)
+
+                remap[attr_index] = name_indices[name]
+
+            attr_indices.append(remap[pose.attr_indices])
+
+        return cls(
+            dna_hash,
+            numpy.array([pose.index for pose in edited_poses], dtype=numpy.int64),
+            indptr,
+            numpy.concatenate(attr_indices).astype(numpy.int32),
+            numpy.concatenate([pose.values for pose in edited_poses]).astype(numpy.float32),
+            attr_names,
+        )
+
+    def save(self, path):
+        """Write to .npz file, replacing any existing file once written
+        """
+        temp_path = path + ".tmp"
+
+        with open(temp_path, "wb") as f:
+            numpy.savez_compressed(
+                f,
+                version=numpy.array(VERSION),
+                dna_hash=numpy.array(self.dna_hash),
+                pose_indices=self.pose_indices,
+                indptr=self.indptr,
+                attr_indices=self.attr_indices,
+                values=self.values,
+                attr_names=numpy.array(self.attr_names, dtype=numpy.str_),
+            )
+
+        os.replace(temp_path, path)
+
+        return True
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            raise mhCore.MHError("Pose edits not found: {}".format(path))
+
+        with numpy.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+
+            if version != VERSION:
+                raise mhCore.MHError("Pose edits version not supported: {} {}".format(version, path))
+
+            return cls(
+                str(data["dna_hash"]),
+                data["pose_indices"],
+                data["indptr"],
+                data["attr_indices"],
+                data["values"],
+                data["attr_names"].tolist(),
+            )
+
+    def apply(self, poses):
+        """Set deltas of edited poses, matching poses by index and attrs by name
+
+        Applied poses are marked dirty.
+
+        :return: list of applied pose indices
+        """
+        pose_lookup = {pose.index: pose for pose in poses}
+        table_remaps = {}
+
+        applied = []
+
+        for row, pose_index in enumerate(self.pose_indices.tolist()):
+            pose = pose_lookup.get(pose_index)
+
+            if pose is None:
+                LOG.warning("Edited pose not found: {}".format(pose_index))
+                continue
+
+            table = pose.attr_table
+
+            if id(table) not in table_remaps:
+                table_remaps[id(table)] = numpy.array(
+                    [table.add(name) for name in self.attr_names], dtype=numpy.int32
+                )
+
+            start, end = self.indptr[row], self.indptr[row + 1]
+
+            pose.set_arrays(table_remaps[id(table)][self.attr_indices[start:end]], self.values[start:end])
+
+            applied.append(pose_index)
+
+        return applied
+
+
+def get_edits_path(dna_path):
+    """Get default sidecar path for edits of dna, next to the dna file
+    """
+    return os.path.splitext(dna_path)[0] + ".poses" + EXTENSION
+
+
+def get_dna_hash(dna_path, file_key=None):
+    """Get hash of dna file contents that pose edits are keyed by
+
+    Hashing reads the whole file, so take the cheap mhCache file key when poses are loaded
+    and only hash once edits are saved or loaded. If file_key is given MHError is raised
+    if the file has changed on disk since, as the hash would not be of the dna the poses came from.
+    """
+    if file_key is not None and mhCache.get_key(dna_path) != file_key:
+        raise mhCore.MHError("Dna has changed on disk since poses were loaded: {}".format(dna_path))
+
+    return mhGeoCache.get_file_hash(dna_path)
+
+
+def save_pose_edits(path, dna_path, poses, dirty_only=True, dna_hash=None):
+    """Save edited poses, that were loaded from dna_path, to .npz sidecar file
+
+    :param dna_hash: hash of the dna poses were loaded from, see get_dna_hash
+    :return: PoseEdits
+    """
+    if dna_hash is None:
+        dna_hash = get_dna_hash(dna_path)
+
+    pose_edits = PoseEdits.from_poses(dna_hash, poses, dirty_only=dirty_only)
+    pose_edits.save(path)
+
+    LOG.info("Saved {} edited poses: {}".format(len(pose_edits), path))
+
+    return pose_edits
+
+
+def apply_pose_edits(path, dna_path, poses, force=False, dna_hash=None):
+    """Apply pose edits from sidecar file to poses loaded from dna_path
+
+    Raises MHError if the edits were saved against a different version of the dna,
+    unless force is True.
+
+    :param dna_hash: hash of the dna poses were loaded from, see get_dna_hash
+    :return: list of applied pose indices
+    """
+    pose_edits = PoseEdits.load(path)
+
+    if dna_hash is None:
+        dna_hash = get_dna_hash(dna_path)
+
+    if pose_edits.dna_hash != dna_hash:
+        message = "Pose edits were saved against a different dna: {} {}".format(path, dna_path)
+
+        if not force:
+            raise mhCore.MHError(message)
+
+        LOG.warning(message)
+
+    applied = pose_edits.apply(poses)
+
+    LOG.info("Applied {} edited poses: {}".format(len(applied), path))
+
+    return applied
+
+
+def load_poses(path, dna_path, force=False):
+    """Get all poses of dna with pose edits from sidecar file applied
+
+    Poses are read from the cached reader of the dna, see mhCache.
+    """
+    reader = mhCache.get_reader(dna_path, layer="behavior")
+    poses = mhBehaviour.get_all_poses(reader)
+
+    apply_pose_edits(path, dna_path, poses, force=force)
+
+    return poses
@@ -0,0 +1,541 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cached snapshots and lookups on DNA readers
+
+Each call to reader.getJointName(i) etc. crosses the SWIG boundary, so
+looping over per index reader methods is slow, especially when the same
+data is fetched several times within one operation.
+
+A DnaSnapshot pulls names, counts, neutral joint transforms and index
+arrays from the reader once, and a ReaderIndex adds name to index dicts.
+Snapshots are cached per reader and must be invalidated whenever the
+reader is modified, which run_commands does for dnacalib command sequences:
+
+    snapshot = mhReader.get_snapshot(reader)
+    joint_index = snapshot.index.get_joint_index("FACIAL_C_FacialRoot")
+
+    mhReader.run_commands(commands, calib_reader)
+
+Readers can be loaded with only the layers a workflow needs, eg. poses only
+need behavior data. A LazyReader loads more layers the first time a method
+from a missing layer is called:
+
+    reader = mhReader.LazyReader(dna_path, layer="behavior")
+    reader.getJointGroupCount()  # behavior is loaded
+    reader.getVertexPositionXs(0)  # reloaded with all layers
+
+"""
+
+import os
+import weakref
+
+import numpy
+
+import dna
+
+from brenmeta.core import mhCore
+
+LOG = mhCore.get_basic_logger(__name__)
+
+JOINT_ATTRS = ("tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz")
+
+_SNAPSHOTS = weakref.WeakKeyDictionary()
+
+# dna layers in order of size, each layer includes the descriptor and definition layers
+LAYERS = ["definition", "behavior", "geometry_without_blendshapes", "geometry", "all"]
+
+LAYER_CONTENTS = {
+    "definition": {"definition"},
+    "behavior": {"definition", "behavior"},
+    "geometry_without_blendshapes": {"definition", "geometry"},
+    "geometry": {"definition", "geometry", "blendshapes"},
+    "all": {"definition", "behavior", "geometry", "blendshapes"},
+}
+
+# reader method prefixes that need more than the definition layer
+METHOD_LAYERS = [
+    ("getJointGroup", "behavior"),
+    ("getJointRowCount", "behavior"),
+    ("getJointColumnCount", "behavior"),
+    ("getJointVariableAttributeIndices", "behavior"),
+    ("getPSD", "behavior"),
+    ("getGUIToRaw", "behavior"),
+    ("getAnimatedMap", "behavior"),
+    ("getBlendShapeChannelLOD", "behavior"),
+    ("getBlendShapeChannelInputIndices", "behavior"),
+    ("getBlendShapeChannelOutputIndices", "behavior"),
+    ("getBlendShapeTarget", "geometry"),
+    ("getVertex", "geometry_without_blendshapes"),
+    ("getFace", "geometry_without_blendshapes"),
+    ("getSkinWeights", "geometry_without_blendshapes"),
+    ("getMaximumInfluencePerVertex", "geometry_without_blendshapes"),
+]
+
+
+def get_layer_value(layer):
+    """Get dna.DataLayer value for layer name
+    """
+    values = {
+        "definition": dna.DataLayer_Definition,
+        "behavior": dna.DataLayer_Behavior,
+        "geometry_without_blendshapes": dna.DataLayer_GeometryWithoutBlendShapes,
+        "geometry": dna.DataLayer_Geometry,
+        "all": dna.DataLayer_All,
+    }
+
+    if layer not in values:
+        raise mhCore.MHError("Unrecognised dna layer: {}, expected one of: {}".format(layer, LAYERS))
+
+    return values[layer]
+
+
+def get_combined_layer(*layers):
+    """Get the smallest layer that contains everything in the given layers
+    """
+    contents = set()
+
+    for layer in layers:
+        if layer not in LAYER_CONTENTS:
+            raise mhCore.MHError("Unrecognised dna layer: {}, expected one of: {}".format(layer, LAYERS))
+
+        contents.update(LAYER_CONTENTS[layer])
+
+    for layer in LAYERS:
+        if contents.issubset(LAYER_CONTENTS[layer]):
+            return layer
+
+    return "all"
+
+
+def get_method_layer(method_name):
+    """Get layer needed to call reader method, eg. "behavior" for getJointGroupValues
+    """
+    for prefix, layer in METHOD_LAYERS:
+        if method_name.startswith(prefix):
+            return layer
+    return "definition"
+
+
+def get_file_key(path):
+    """Get (absolute path, size, mtime) key of a dna file, to tell when it has changed on disk
+    """
+    path = os.path.abspath(path)
+
+    if not os.path.exists(path):
+        raise mhCore.MHError("Dna path not found: {}".format(path))
+
+    stat = os.stat(path)
+
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def load_dna(path, layer="all"):
+    """Load binary dna reader with the given layer
+    """
+    stream = dna.FileStream(path, dna.FileStream.AccessMode_Read, dna.FileStream.OpenMode_Binary)
+    reader = dna.BinaryStreamReader(stream, get_layer_value(layer))
+    reader.read()
+
+    if not dna.Status.isOk():
+        status = dna.Status.get()
+        raise RuntimeError("Error loading DNA: {}".format(status.message))
+
+    return reader
+
+
+class LazyReader(object):
+    """Dna reader that is loaded with the given layer, and reloaded with more layers as they are needed
+
+    Reader methods can be called directly on this object, use upgrade to get the underlying
+    reader for anything that needs an actual dna reader, such as writer.setFrom().
+
+    If a key from get_file_key is given, MHError is raised rather than reloading
+    a file that has changed on disk since the key was taken, so layers from different
+    versions of a file are never mixed.
+
+    The snapshot of a replaced reader is kept for the new reader, see share_snapshot.
+    """
+
+    def __init__(self, path, layer="definition", loader=load_dna, key=None):
+        self.path = path
+        self.layer = None
+        self.loader = loader
+        self.key = key
+        self._reader = None
+
+        if layer is not None:
+            self.upgrade(layer)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        self.upgrade(get_method_layer(name))
+
+        return getattr(self._reader, name)
+
+    @property
+    def reader(self):
+        return self._reader
+
+    def covers(self, layer):
+        return self.layer is not None and LAYER_CONTENTS[layer].issubset(LAYER_CONTENTS[self.layer])
+
+    def check_key(self):
+        """Raise MHError if the file has changed on disk since key was taken
+        """
+        if self.key is not None and get_file_key(self.path) != self.key:
+            raise mhCore.MHError("Dna has changed on disk since it was loaded: {}".format(self.path))
+
+        return True
+
+    def set_reader(self, reader, layer):
+        """Set an already loaded reader
+        """
+        if self.covers("behavior"):
+            share_snapshot(self._reader, reader)
+
+        self._reader = reader
+        self.layer = layer
+
+        return True
+
+    def upgrade(self, layer):
+        """Make sure reader has everything in layer, reloading if needed, and return the underlying reader
+        """
+        if not self.covers(layer):
+            if self.layer is not None:
+                layer = get_combined_layer(self.layer, layer)
+
+            self.check_key()
+
+            LOG.info("Loading dna {} layer: {}".format(layer, self.path))
+
+            self.set_reader(self.loader(self.path, layer=layer), layer)
+
+        return self._reader
+
+
+def get_full_reader(reader):
+    """Get underlying reader with all layers loaded, eg. for writer.setFrom()
+    """
+    if isinstance(reader, LazyReader):
+        return reader.upgrade("all")
+    return reader
+
+
+def get_short_name(name):
+    """Get name without namespace, eg. "CTRL_expressions.browDownL" -> "browDownL"
+    """
+    return name.split(".")[-1]
+
+
+def get_name_indices(names):
+    """Get a dict of name to index, where names are duplicated the first index is used
+    """
+    name_indices = {}
+
+    for i, name in enumerate(names):
+        name_indices.setdefault(name, i)
+
+    return name_indices
+
+
+def get_neutral_joint_xforms(reader):
+    """Get (joint count, 3) arrays of neutral joint translations and rotations
+    """
+    joint_count = reader.getJointCount()
+
+    try:
+        translations = numpy.array([
+            reader.getNeutralJointTranslationXs(),
+            reader.getNeutralJointTranslationYs(),
+            reader.getNeutralJointTranslationZs(),
+        ], dtype=numpy.float64).T
+
+        rotations = numpy.array([
+            reader.getNeutralJointRotationXs(),
+            reader.getNeutralJointRotationYs(),
+            reader.getNeutralJointRotationZs(),
+        ], dtype=numpy.float64).T
+
+    except AttributeError:
+        # fall back on per joint methods
+        translations = numpy.array(
+            [reader.getNeutralJointTranslation(i) for i in range(joint_count)], dtype=numpy.float64
+        )
+
+        rotations = numpy.array(
+            [reader.getNeutralJointRotation(i) for i in range(joint_count)], dtype=numpy.float64
+        )
+
+    return translations.reshape(joint_count, 3), rotations.reshape(joint_count, 3)
+
+
+class ReaderIndex(object):
+    """Name to index lookups for joints, raw controls, blendshape channels, meshes and gui controls
+    """
+
+    def __init__(self, snapshot):
+        self.joints = get_name_indices(snapshot.joint_names)
+        self.raw_controls = get_name_indices(snapshot.raw_control_names)
+        self.expressions = get_name_indices(map(get_short_name, snapshot.raw_control_names))
+        self.blendshape_channels = get_name_indices(snapshot.blendshape_channel_names)
+        self.meshes = get_name_indices(snapshot.mesh_names)
+        self.gui_controls = get_name_indices(snapshot.gui_control_names)
+
+    def get_joint_index(self, joint_name):
+        return self.joints.get(joint_name)
+
+    def get_raw_control_index(self, raw_control, ignore_namespace=False):
+        if ignore_namespace:
+            return self.expressions.get(raw_control)
+        return self.raw_controls.get(raw_control)
+
+    def get_blendshape_channel_index(self, channel_name):
+        return self.blendshape_channels.get(channel_name)
+
+    def get_mesh_index(self, mesh_name):
+        return self.meshes.get(mesh_name)
+
+    def get_gui_control_index(self, gui_control):
+        return self.gui_controls.get(gui_control)
+
+
+class DnaSnapshot(object):
+    """Names, counts, neutral joint transforms and index arrays read from a dna reader in one go
+
+    Names are stored as tuples and index arrays as numpy arrays, these should be treated as read only.
+    """
+
+    def __init__(self, reader):
+        # counts
+        self.joint_count = reader.getJointCount()
+        self.joint_column_count = reader.getJointColumnCount()
+        self.joint_group_count = reader.getJointGroupCount()
+        self.raw_control_count = reader.getRawControlCount()
+        self.gui_control_count = reader.getGUIControlCount()
+        self.blendshape_channel_count = reader.getBlendShapeChannelCount()
+        self.mesh_count = reader.getMeshCount()
+        self.psd_count = reader.getPSDCount()
+        self.lod_count = reader.getLODCount()
+
+        # names
+        self.joint_names = tuple(reader.getJointName(i) for i in range(self.joint_count))
+        self.raw_control_names = tuple(reader.getRawControlName(i) for i in range(self.raw_control_count))
+        self.gui_control_names = tuple(reader.getGUIControlName(i) for i in range(self.gui_control_count))
+        self.mesh_names = tuple(reader.getMeshName(i) for i in range(self.mesh_count))
+
+        self.blendshape_channel_names = tuple(
+            reader.getBlendShapeChannelName(i) for i in range(self.blendshape_channel_count)
+        )
+
+        # neutral joint transforms
+        self.neutral_joint_translations, self.neutral_joint_rotations = get_neutral_joint_xforms(reader)
+
+        # index arrays
+        self.blendshape_channel_input_indices = numpy.array(
+            reader.getBlendShapeChannelInputIndices(), dtype=numpy.intp
+        )
+
+        self.joint_group_indices = tuple(
+            (
+                numpy.array(reader.getJointGroupOutputIndices(i), dtype=numpy.intp),
+                numpy.array(reader.getJointGroupInputIndices(i), dtype=numpy.intp),
+            )
+            for i in range(self.joint_group_count)
+        )
+
+        # number of output rows of each joint group active at each lod
+        self.joint_group_lods = tuple(
+            numpy.array(reader.getJointGroupLODs(i), dtype=numpy.intp)
+            for i in range(self.joint_group_count)
+        )
+
+        self.psd_row_indices = numpy.array(reader.getPSDRowIndices(), dtype=numpy.intp)
+        self.psd_column_indices = numpy.array(reader.getPSDColumnIndices(), dtype=numpy.intp)
+        self.psd_values = numpy.array(reader.getPSDValues(), dtype=numpy.float32)
+
+        self._index = None
+        self._joint_attrs = None
+        self._columns_to_blendshape_channels = None
+        self._neutral_joint_xforms_float32 = None
+        self._psd_matrix = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = ReaderIndex(self)
+        return self._index
+
+    @property
+    def neutral_joint_xforms_float32(self):
+        """Neutral joint translations and rotations as float32, the precision they are stored with in dna files
+        """
+        if self._neutral_joint_xforms_float32 is None:
+            self._neutral_joint_xforms_float32 = (
+                self.neutral_joint_translations.astype(numpy.float32),
+                self.neutral_joint_rotations.astype(numpy.float32),
+            )
+        return self._neutral_joint_xforms_float32
+
+    def is_neutral_joint_xforms_equal(self, translations, rotations):
+        """Check if translations and rotations are the same as the neutral joint xforms, compared as float32
+        """
+        snapshot_translations, snapshot_rotations = self.neutral_joint_xforms_float32
+
+        return (
+            numpy.array_equal(numpy.asarray(translations, dtype=numpy.float32), snapshot_translations)
+            and numpy.array_equal(numpy.asarray(rotations, dtype=numpy.float32), snapshot_rotations)
+        )
+
+    @property
+    def joint_attrs(self):
+        """Joint attr names corresponding to joint output indices
+        """
+        if self._joint_attrs is None:
+            self._joint_attrs = tuple(
+                "{}.{}".format(joint, attr) for joint in self.joint_names for attr in JOINT_ATTRS
+            )
+        return self._joint_attrs
+
+    @property
+    def columns_to_blendshape_channels(self):
+        """Blendshape channel name associated with each joint column, or None
+        """
+        if self._columns_to_blendshape_channels is None:
+            columns_to_blendshapes = [None] * self.joint_column_count
+
+            for blendshape_channel_name, joint_column in zip(
+                    self.blendshape_channel_names, self.blendshape_channel_input_indices
+            ):
+                if joint_column >= self.joint_column_count:
+                    LOG.warning("Blendshape out of joint column range: {} {}".format(
+                        blendshape_channel_name, joint_column
+                    ))
+                    continue
+
+                columns_to_blendshapes[joint_column] = blendshape_channel_name
+
+            self._columns_to_blendshape_channels = tuple(columns_to_blendshapes)
+
+        return self._columns_to_blendshape_channels
+
+    def get_joint_group_row_count(self, group_index, lod=None):
+        """Get number of output rows of joint group active at lod, or all rows if lod is None
+
+        Rows of each joint group are ordered so the rows of lower lods come first.
+        """
+        output_indices = self.joint_group_indices[group_index][0]
+
+        if lod is None:
+            return output_indices.size
+
+        if not 0 <= lod < self.lod_count:
+            raise mhCore.MHError("Lod out of range: {} (lod count {})".format(lod, self.lod_count))
+
+        lods = self.joint_group_lods[group_index]
+
+        if lod >= lods.size:
+            return output_indices.size
+
+        return min(int(lods[lod]), output_indices.size)
+
+    def get_joint_group_indices(self, lod=None):
+        """Get (output indices, input indices) of each joint group, with outputs sliced to rows active at lod
+        """
+        if lod is None:
+            return list(self.joint_group_indices)
+
+        return [
+            (output_indices[:self.get_joint_group_row_count(group_index, lod=lod)], input_indices)
+            for group_index, (output_indices, input_indices) in enumerate(self.joint_group_indices)
+        ]
+
+    @property
+    def psd_matrix(self):
+        """mhCore.PSDMatrix of psd input pose weights
+        """
+        if self._psd_matrix is None:
+            self._psd_matrix = mhCore.PSDMatrix.from_entries(
+                self.psd_row_indices, self.psd_column_indices, self.psd_values
+            )
+        return self._psd_matrix
+
+
+def get_snapshot(reader):
+    """Get cached DnaSnapshot for reader, building it if needed
+    """
+    try:
+        snapshot = _SNAPSHOTS.get(reader)
+    except TypeError:
+        # reader can't be weak referenced, so can't be cached
+        return DnaSnapshot(reader)
+
+    if snapshot is None:
+        snapshot = DnaSnapshot(reader)
+        _SNAPSHOTS[reader] = snapshot
+
+    return snapshot
+
+
+def share_snapshot(reader, other_reader):
+    """Use the cached DnaSnapshot of reader for other reader, eg. when the same file is reloaded with more layers
+
+    :return: True if a snapshot was shared
+    """
+    try:
+        snapshot = _SNAPSHOTS.get(reader)
+
+        if snapshot is None:
+            return False
+
+        _SNAPSHOTS[other_reader] = snapshot
+
+    except TypeError:
+        return False
+
+    return True
+
+
+def get_reader_index(reader):
+    """Get cached ReaderIndex for reader, building it if needed
+    """
+    return get_snapshot(reader).index
+
+
+def invalidate_snapshot(reader):
+    """Discard cached DnaSnapshot and ReaderIndex for reader, call this after modifying reader
+    """
+    try:
+        _SNAPSHOTS.pop(reader, None)
+    except TypeError:
+        pass
+
+    return True
+
+
+def run_commands(commands, calib_reader):
+    """Run dnacalib command or command sequence on calib reader and invalidate cached snapshot
+    """
+    try:
+        commands.run(calib_reader)
+    finally:
+        invalidate_snapshot(calib_reader)
+
+    return True
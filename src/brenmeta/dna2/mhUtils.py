@@ -29,23 +29,20 @@ from mh_assemble_lib.impl.maya.handler import MayaHandler
 from mh_assemble_lib.impl.maya.properties import MayaSceneOrient
 
 from brenmeta.core import mhCore
+from brenmeta.dna2 import mhReader
 
 def scale_dna(reader, scale):
     scale_cmd = dnacalib2.ScaleCommand(scale, [0, 0, 0])
-    scale_cmd.run(reader)
+    mhReader.run_commands(scale_cmd, reader)
     return True
 
 
-def load_dna(path):
-    """
+def load_dna(path, layer="all"):
+    """Load dna reader with the given layer
+
+    Layer can be one of "definition", "behavior", "geometry", "geometry_without_blendshapes" or "all"
     """
-    stream = dna.FileStream(path, dna.FileStream.AccessMode_Read, dna.FileStream.OpenMode_Binary)
-    reader = dna.BinaryStreamReader(stream, Layer.all.value)
-    reader.read()
-    if not dna.Status.isOk():
-        status = dna.Status.get()
-        raise RuntimeError("Error loading DNA: {}".format(status.message))
-    return reader
+    return mhReader.load_dna(path, layer=layer)
 
 
 def save_dna(reader, path, validate=True, as_json=False):
@@ -56,7 +53,7 @@ def save_dna(reader, path, validate=True, as_json=False):
     else:
         writer = dna.BinaryStreamWriter(stream)
 
-    writer.setFrom(reader)
+    writer.setFrom(mhReader.get_full_reader(reader))
 
     writer.write()
 
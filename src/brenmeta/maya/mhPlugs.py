@@ -0,0 +1,259 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cached plugs for setting joint attrs of poses in the scene
+
+Posing joints with cmds.setAttr parses each attr and runs a command per value.
+Instead plugs are resolved once per attr and cached, then all values of a pose
+are set through one MDGModifier:
+
+    applier = mhPlugs.PoseApplier()
+
+    for pose in poses:
+        pose.pose_joints(applier=applier)
+        ...
+        pose.reset_joints(applier=applier)
+
+Values of joint attrs can be read back from the scene the same way, in one pass:
+
+    values = mhPlugs.get_plug_cache().get_values(attrs)
+
+Plugs are cached for the session, see get_plug_cache, and each applier caches
+the plug list of every set of attrs it sets. Locked or connected attrs raise MHError,
+as MDGModifier would set them without error.
+Values are in ui units, as with cmds.setAttr and cmds.getAttr, and converted to internal units.
+Note changes made through an applier are not undoable.
+"""
+
+import numpy
+
+from maya.api import OpenMaya
+
+from brenmeta.core import mhCore
+
+LOG = mhCore.get_basic_logger(__name__)
+
+
+def get_unit_type(plug):
+    """Get MFnUnitAttribute unit type of plug, or None if not a unit attr
+    """
+    attr = plug.attribute()
+
+    if not attr.hasFn(OpenMaya.MFn.kUnitAttribute):
+        return None
+
+    return OpenMaya.MFnUnitAttribute(attr).unitType()
+
+
+def get_ui_unit_factors():
+    """Get dict of factors converting values from the current ui units to internal units, by unit type
+    """
+    return {
+        OpenMaya.MFnUnitAttribute.kAngle: OpenMaya.MAngle(1.0, OpenMaya.MAngle.uiUnit()).asRadians(),
+        OpenMaya.MFnUnitAttribute.kDistance: OpenMaya.MDistance(1.0, OpenMaya.MDistance.uiUnit()).asCentimeters(),
+    }
+
+
+class PlugList(object):
+    """Resolved plugs of a list of attrs, with unit factors of the ui units they were last used in
+
+    Only the nodes of the plugs are checked when validating the list, rather than each attr.
+    """
+
+    def __init__(self, attrs, plugs, unit_types, node_handles):
+        self.attrs = attrs
+        self.plugs = plugs
+        self.unit_types = unit_types
+        self.node_handles = node_handles
+
+        self._ui_units = None
+        self._factors = None
+
+    def __len__(self):
+        return len(self.plugs)
+
+    def __repr__(self):
+        return "{}({} plugs)".format(self.__class__.__name__, len(self))
+
+    def is_valid(self):
+        return all(handle.isValid() for handle in self.node_handles)
+
+    def get_factors(self):
+        """Get array of ui unit factors of each plug, only queried again if ui units have changed
+        """
+        ui_units = (OpenMaya.MAngle.uiUnit(), OpenMaya.MDistance.uiUnit())
+
+        if self._factors is None or ui_units != self._ui_units:
+            unit_factors = get_ui_unit_factors()
+
+            self._factors = numpy.array(
+                [unit_factors.get(unit_type, 1.0) for unit_type in self.unit_types], dtype=numpy.float64
+            )
+
+            self._ui_units = ui_units
+
+        return self._factors
+
+    def get_unsettable_attrs(self):
+        """Get list of attrs that are locked or connected, which cmds.setAttr would fail to set
+        """
+        return [
+            attr for attr, plug in zip(self.attrs, self.plugs) if plug.isLocked or plug.isDestination
+        ]
+
+
+class PlugCache(object):
+    """Plugs of joint attrs, resolved once per attr
+
+    Plugs of nodes that have since been deleted are resolved again when next requested.
+    """
+
+    def __init__(self):
+        # attr -> (plug, node handle, unit type)
+        self.plugs = {}
+
+    def __len__(self):
+        return len(self.plugs)
+
+    def __repr__(self):
+        return "{}({} plugs)".format(self.__class__.__name__, len(self))
+
+    def resolve(self, attr):
+        sel = OpenMaya.MSelectionList()
+
+        try:
+            sel.add(attr)
+        except RuntimeError as err:
+            raise mhCore.MHError("{} ({})".format(str(err), attr))
+
+        plug = sel.getPlug(0)
+
+        self.plugs[attr] = (plug, OpenMaya.MObjectHandle(plug.node()), get_unit_type(plug))
+
+        return self.plugs[attr]
+
+    def get_plug_list(self, attrs):
+        """Get PlugList of attrs
+        """
+        plugs = []
+        unit_types = []
+        node_handles = {}
+
+        for attr in attrs:
+            cached = self.plugs.get(attr)
+
+            if cached is None or not cached[1].isValid():
+                cached = self.resolve(attr)
+
+            plugs.append(cached[0])
+            unit_types.append(cached[2])
+            node_handles[cached[1].hashCode()] = cached[1]
+
+        return PlugList(list(attrs), plugs, unit_types, list(node_handles.values()))
+
+    def get_values(self, attrs):
+        """Get float array of the current value of each attr, in ui units
+        """
+        plug_list = self.get_plug_list(attrs)
+
+        values = numpy.array([plug.asDouble() for plug in plug_list.plugs], dtype=numpy.float64)
+
+        return values / plug_list.get_factors()
+
+    def clear(self):
+        self.plugs.clear()
+        return True
+
+
+_PLUG_CACHE = PlugCache()
+
+
+def get_plug_cache():
+    """Get plug cache shared for the session
+    """
+    return _PLUG_CACHE
+
+
+def clear_plug_cache():
+    return _PLUG_CACHE.clear()
+
+
+class PoseApplier(object):
+    """Reusable object for setting joint attrs of poses with cached plugs
+
+    The plug list of each set of attrs is cached, so posing the same pose again only checks the nodes are valid.
+    Attrs are checked to be settable when their plugs are resolved.
+    """
+
+    def __init__(self, plug_cache=None):
+        self.plug_cache = plug_cache if plug_cache is not None else get_plug_cache()
+
+        # tuple of attrs -> PlugList
+        self.plug_lists = {}
+
+    def __repr__(self):
+        return "{}({}, {} plug lists)".format(self.__class__.__name__, self.plug_cache, len(self.plug_lists))
+
+    def get_plug_list(self, attrs):
+        """Get cached PlugList of attrs, raises MHError if any are locked or connected
+        """
+        key = tuple(attrs)
+
+        plug_list = self.plug_lists.get(key)
+
+        if plug_list is not None and plug_list.is_valid():
+            return plug_list
+
+        plug_list = self.plug_cache.get_plug_list(key)
+
+        # MDGModifier sets these without error, unlike cmds.setAttr
+        unsettable_attrs = plug_list.get_unsettable_attrs()
+
+        if unsettable_attrs:
+            raise mhCore.MHError("Joint attrs are locked or connected: {}".format(", ".join(unsettable_attrs)))
+
+        self.plug_lists[key] = plug_list
+
+        return plug_list
+
+    def set_arrays(self, attrs, values):
+        """Set each attr to value in one modifier
+        """
+        plug_list = self.get_plug_list(attrs)
+
+        values = numpy.asarray(values, dtype=numpy.float64) * plug_list.get_factors()
+
+        modifier = OpenMaya.MDGModifier()
+
+        for plug, value in zip(plug_list.plugs, values.tolist()):
+            modifier.newPlugValueDouble(plug, value)
+
+        try:
+            modifier.doIt()
+        except RuntimeError as err:
+            raise mhCore.MHError("Failed to set {} joint attrs: {}".format(len(plug_list), err))
+
+        return True
+
+    def set_values(self, values):
+        """Set joint attrs from dict of attr values
+        """
+        return self.set_arrays(list(values.keys()), list(values.values()))
+
+    def clear(self):
+        self.plug_lists.clear()
+        return True
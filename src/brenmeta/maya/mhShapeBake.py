@@ -28,6 +28,7 @@ from maya import mel
 
 from brenmeta.maya import mhBlendshape
 from brenmeta.maya import mhMayaUtils
+from brenmeta.maya import mhPlugs
 from brenmeta.core import mhCore
 
 LOG = mhCore.get_basic_logger(__name__)
@@ -228,20 +229,13 @@ bmMhFaceShapeBake.bake_shapes_from_dna_v2(
 
     """
     from brenmeta.dna2 import mhBehaviour
+    from brenmeta.dna2 import mhCache
     from brenmeta.dna2 import mhSrc
 
-    import dnacalib2
-    from mh_assemble_lib.model.dnalib import DNAReader, Layer
-
     mhSrc.validate_plugin()
 
-    # load dna data
-    LOG.info("Loading dna: {}".format(dna_file))
-
-    dna_obj = DNAReader.read(dna_file, Layer.all)
-
-    LOG.info("Getting reader...")
-    calib_reader = dnacalib2.DNACalibDNAReader(dna_obj._reader)
+    # load dna data, only read from so the shared cached reader can be used
+    calib_reader = mhCache.get_reader(dna_file, layer="behavior")
 
     # get pose data
     LOG.info("Getting pose data...")
@@ -376,19 +370,13 @@ def create_joint_poses(poses, pose_joints, driver_mapping):
     # get attr poses
     # dict where key is every attr for all joints we want to still have driven
     # and value is all poses that drive that attr
-    attr_poses = {}
-
-    for joint in pose_joints:
-        for attr in ["tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz"]:
-            joint_attr = "{}.{}".format(joint, attr)
-
-            joint_poses = []
-
-            for pose in poses:
-                if joint_attr in pose.deltas:
-                    joint_poses.append(pose)
+    joint_attrs = [
+        "{}.{}".format(joint, attr)
+        for joint in pose_joints
+        for attr in ["tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz"]
+    ]
 
-            attr_poses[joint_attr] = joint_poses
+    attr_poses = mhCore.get_attr_poses(poses, joint_attrs)
 
     for attr, poses in attr_poses.items():
         if not poses:
@@ -492,6 +480,9 @@ def bake_shapes_from_poses(mesh_blendshapes, poses, psd_poses, in_betweens, deta
 
     cmds.hide(target_groups)
 
+    # resolve joint attr plugs once for all poses
+    applier = mhPlugs.PoseApplier()
+
     # bake core shapes
     targets = [[] for _ in meshes]
 
@@ -518,11 +509,11 @@ def bake_shapes_from_poses(mesh_blendshapes, poses, psd_poses, in_betweens, deta
         # pose rig
         if pose_index in psd_poses:
             psd_pose = psd_poses[pose_index]
-            psd_pose.pose_joints(summed=True)
+            psd_pose.pose_joints(summed=True, applier=applier)
             pose_name = psd_pose.pose.name
             pose = psd_pose
         else:
-            pose.pose_joints()
+            pose.pose_joints(applier=applier)
             pose_name = pose.name
             pose_names.append(pose_name)
 
@@ -541,7 +532,7 @@ def bake_shapes_from_poses(mesh_blendshapes, poses, psd_poses, in_betweens, deta
                 bs_node, base_mesh, target, default_weight=0.0
             )
 
-        pose.reset_joints()
+        pose.reset_joints(applier=applier)
 
         # create in-betweens
         if pose_name in in_betweens:
@@ -551,7 +542,7 @@ def bake_shapes_from_poses(mesh_blendshapes, poses, psd_poses, in_betweens, deta
                 ib_value = float(ib_index + 1) / float(in_betweens[pose_name] + 1)
                 ib_value = round(ib_value, 3)
 
-                pose.pose_joints(blend=ib_value)
+                pose.pose_joints(blend=ib_value, applier=applier)
 
                 for mesh, base_mesh, bs_node, target_group, mesh_targets in zip(
                         meshes, base_meshes, bs_nodes, target_groups, targets
@@ -564,7 +555,7 @@ def bake_shapes_from_poses(mesh_blendshapes, poses, psd_poses, in_betweens, deta
                         bs_node, base_mesh, pose_name, in_between_target, ib_value
                     )
 
-                pose.reset_joints()
+                pose.reset_joints(applier=applier)
 
     cmds.progressBar(gMainProgressBar, edit=True, endProgress=True)
 
@@ -0,0 +1,75 @@
+# brenmeta metahuman DNA modification tool
+#
+# Copyright (C) 2025 Brenainn Jordan
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests of the process wide dna cache, run with mayapy -m pytest tests
+"""
+
+import pytest
+
+pytest.importorskip("dnacalib2")
+pytest.importorskip("mh_assemble_lib")
+
+from brenmeta.dna2 import mhCache
+
+
+class CountingDNAReader(object):
+    """Stands in for DNAReader, counting how many times a file is parsed
+    """
+
+    reads = []
+
+    def __init__(self, path):
+        self._reader = object()
+        self.path = path
+
+    @classmethod
+    def read(cls, path, layer):
+        cls.reads.append(path)
+        return cls(path)
+
+
+@pytest.fixture
+def dna_path(tmp_path, monkeypatch):
+    CountingDNAReader.reads = []
+    monkeypatch.setattr(mhCache, "DNAReader", CountingDNAReader)
+
+    path = tmp_path / "head.dna"
+    path.write_bytes(b"dna")
+
+    return str(path)
+
+
+def test_get_dna_miss_then_hit(dna_path):
+    cache = mhCache.DnaCache()
+
+    dna_obj = cache.get_dna(dna_path)
+
+    assert (cache.misses, cache.hits) == (1, 0)
+
+    assert cache.get_dna(dna_path) is dna_obj
+
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert len(CountingDNAReader.reads) == 1
+
+
+def test_invalidate_path(dna_path):
+    cache = mhCache.DnaCache()
+    cache.get_dna(dna_path)
+
+    cache.invalidate(dna_path)
+
+    assert len(cache) == 0